@@ -1,13 +1,76 @@
-from typing import Generator
+import math
+import time
+from typing import AsyncIterator, Generator
 
+from fastapi import Request
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from database import get_db
+from config import settings
+from database import get_db, get_read_db
 
+# Методы без записи: читают через движок чтения
+READ_METHODS = {"GET", "HEAD"}
+# Время последней записи клиента: cookie и заголовок запроса/ответа
+LAST_WRITE_COOKIE = "last_write"
+LAST_WRITE_HEADER = "X-Last-Write"
+
+
+def recent_write(request: Request) -> bool:
+    """Клиент писал в последние READ_YOUR_WRITES_SECONDS"""
+    value = request.headers.get(LAST_WRITE_HEADER) or request.cookies.get(
+        LAST_WRITE_COOKIE
+    )
+    try:
+        written_at = float(value)
+    except (TypeError, ValueError):
+        return False
+    return time.time() - written_at < settings.read_your_writes_seconds
+
+
+def get_database(request: Request) -> Generator[Session, None, None]:
+    """
+    Сессия запроса.
+
+    GET и HEAD читают через движок чтения (READ_DATABASE_URL), если клиент
+    недавно не писал: иначе реплика может не содержать его изменений.
+    """
+    if request.method in READ_METHODS and not recent_write(request):
+        yield from get_read_database()
+        return
 
-def get_database() -> Generator[Session, None, None]:
     db = next(get_db())
     try:
         yield db
     finally:
         db.close()
+
+
+def get_read_database() -> Generator[Session, None, None]:
+    db = next(get_read_db())
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def mark_writes(request: Request, call_next):
+    """Middleware: отметить успешную запись клиента (cookie и заголовок)"""
+    response = await call_next(request)
+    if request.method not in READ_METHODS and response.status_code < 400:
+        written_at = f"{time.time():.3f}"
+        response.headers[LAST_WRITE_HEADER] = written_at
+        response.set_cookie(
+            LAST_WRITE_COOKIE,
+            written_at,
+            max_age=math.ceil(settings.read_your_writes_seconds),
+        )
+    return response
+
+
+async def get_async_database() -> AsyncIterator[AsyncSession]:
+    # Импорт по требованию: асинхронный драйвер нужен только при ASYNC_DATABASE
+    from database_async import get_async_db
+
+    async for db in get_async_db():
+        yield db
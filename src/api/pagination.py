@@ -0,0 +1,74 @@
+import base64
+import binascii
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+from fastapi import Depends, HTTPException, Query, Response
+
+# Размер страницы по умолчанию и верхняя граница для всех списков
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+# Заголовок с курсором следующей страницы
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+_CURSOR_PREFIX = "id:"
+
+
+def encode_cursor(last_id: int) -> str:
+    """Непрозрачный курсор по id последней записи страницы"""
+    raw = f"{_CURSOR_PREFIX}{last_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        if not raw.startswith(_CURSOR_PREFIX):
+            raise ValueError(raw)
+        return int(raw[len(_CURSOR_PREFIX) :])
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def cursor_param(
+    cursor: Optional[str] = Query(None, description="курсор из X-Next-Cursor"),
+) -> Optional[int]:
+    """id из курсора, после которого продолжается выборка"""
+    return decode_cursor(cursor) if cursor is not None else None
+
+
+@dataclass
+class PageParams:
+    after_id: Optional[int]
+    limit: int
+    skip: int
+
+
+def page_params(
+    after_id: Optional[int] = Depends(cursor_param),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    skip: int = Query(0, ge=0, deprecated=True),
+) -> PageParams:
+    """
+    Параметры страницы списка.
+
+    Keyset-пагинация: следующая страница начинается после id из курсора,
+    поэтому любая страница стоит как первая. skip (OFFSET) оставлен для
+    совместимости и игнорируется при переданном курсоре.
+    """
+    return PageParams(
+        after_id=after_id, limit=limit, skip=0 if after_id is not None else skip
+    )
+
+
+def set_next_cursor(response: Response, items: Sequence, page: PageParams) -> None:
+    """Курсор следующей страницы, если текущая заполнена целиком"""
+    if items and len(items) == page.limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(items[-1].id)
+
+
+def set_export_cursor(response: Response, last_id: Optional[int]) -> None:
+    """Курсор продолжения выгрузки после строки last_id, если она есть"""
+    if last_id is not None:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last_id)
@@ -1,61 +1,153 @@
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Response,
+)
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from api.dependencies import get_database
+from api.pagination import (
+    PageParams,
+    cursor_param,
+    page_params,
+    set_export_cursor,
+    set_next_cursor,
+)
+from config import settings
 from crud.contact import contact as contact_crud
 from crud.lead import lead as lead_crud
 from crud.source import source as source_crud
+from database import explain, unit_of_work
 from schemas.contact import (
+    ContactBatch,
+    ContactBatchResult,
+    ContactBulkClose,
+    ContactBulkCloseResult,
     ContactCreate,
     ContactCreateDB,
+    ContactDistributeBatch,
+    ContactFilter,
+    ContactQueryPlan,
     ContactResponse,
     ContactWithDetails,
+    IdempotencyStats,
+    SpoolAck,
+    SpoolStatus,
 )
+from services.dispatcher import pending_dispatcher
 from services.distribution import distribution_service
+from services.export import ExportFormat, exporter
+from services.idempotency import (
+    IdempotencyKeyMismatch,
+    idempotency_cache,
+    request_fingerprint,
+)
+from services.ingestion import ingest_batch, lead_defaults
+from services.routing_index import routing_index
+from services.spool import contact_spool
 
 router = APIRouter()
 
+# Заголовок ответа на повтор запроса с уже использованным ключом
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def _read_details(
+    db: Session, response: Response, page: PageParams, **filters
+) -> List[ContactWithDetails]:
+    """Страница контактов с деталями одним запросом с JOIN"""
+    rows = contact_crud.get_details(
+        db, skip=page.skip, limit=page.limit, after_id=page.after_id, **filters
+    )
+    set_next_cursor(response, rows, page)
+    return [ContactWithDetails.model_validate(row._mapping) for row in rows]
+
 
 @router.post("/contacts/", response_model=ContactResponse)
-def create_contact(contact_in: ContactCreate, db: Session = Depends(get_database)):
+def create_contact(
+    contact_in: ContactCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(default=None, max_length=255),
+    db: Session = Depends(get_database),
+):
     """
     Создание нового обращения (контакта).
+
+    Лид, резервирование слота оператора и контакт пишутся в одной
+    транзакции с единственным коммитом. Повтор с тем же Idempotency-Key (а
+    при DEDUPE_WINDOW_SECONDS — с тем же лидом, источником и сообщением в
+    пределах окна) получает исходный ответ без создания обращения.
+    Тот же Idempotency-Key с другим телом запроса отклоняется с 422.
     """
-    # 1. Находим или создаем лида
-    defaults = {}
-    if contact_in.phone:
-        defaults["phone"] = contact_in.phone
-    if contact_in.email:
-        defaults["email"] = contact_in.email
-    if contact_in.full_name:
-        defaults["full_name"] = contact_in.full_name
+    keys = idempotency_cache.keys_for(contact_in, idempotency_key)
+    fingerprint = request_fingerprint(contact_in)
+    try:
+        replay = idempotency_cache.lookup(db, keys, fingerprint)
+        if replay is None:
+            try:
+                with unit_of_work(db):
+                    created = _create_contact(db, contact_in)
+                    idempotency_cache.record(db, keys, created, fingerprint)
+            except IntegrityError:
+                # Параллельный запрос с тем же ключом зафиксировал обращение первым
+                replay = idempotency_cache.lookup(db, keys, fingerprint)
+                if replay is None:
+                    raise
+            else:
+                idempotency_cache.remember(keys, created, fingerprint)
+                return created
+    except IdempotencyKeyMismatch:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key was already used with a different request",
+        )
+
+    response.headers[REPLAYED_HEADER] = "true"
+    return replay
 
+
+@router.get("/contacts/idempotency-stats", response_model=IdempotencyStats)
+def read_idempotency_stats():
+    """Счетчики повторов создания обращений"""
+    return idempotency_cache.stats()
+
+
+def _create_contact(db: Session, contact_in: ContactCreate) -> ContactResponse:
+    """Создание обращения внутри единицы работы"""
+    # 1. Проверяем существование источника (по кэшу маршрутизации)
+    if not routing_index.source_exists(db, contact_in.source_id):
+        raise HTTPException(status_code=404, detail="Source not found")
+
+    # 2. Находим или создаем лида
+    defaults = lead_defaults(contact_in)
     lead = lead_crud.get_or_create_by_external_id(
         db, external_id=contact_in.lead_external_id, defaults=defaults
     )
 
-    # 2. Проверяем существование источника
-    source = source_crud.get(db, id=contact_in.source_id)
-    if not source:
-        raise HTTPException(status_code=404, detail="Source not found")
-
-    # 3. Выбираем оператора
-    operator = distribution_service.select_operator(db, contact_in.source_id)
+    # 3. Выбираем оператора и резервируем его слот нагрузки
+    operator_id = distribution_service.reserve_operator(
+        db, contact_in.source_id, routing_key=contact_in.lead_external_id
+    )
 
     # 4. Создаем контакт
     contact_data = ContactCreateDB(
         lead_id=lead.id,
         source_id=contact_in.source_id,
-        operator_id=operator.id if operator else None,
+        operator_id=operator_id,
         message=contact_in.message,
         status="new",
         is_active=True,
     )
+    contact = contact_crud.create(db, obj_in=contact_data, load_reserved=True)
 
-    contact = contact_crud.create(db, obj_in=contact_data)
-
+    # Ответ собираем до коммита: после него объекты сессии устаревают
     return ContactResponse(
         id=contact.id,
         lead_id=contact.lead_id,
@@ -69,103 +161,236 @@ def create_contact(contact_in: ContactCreate, db: Session = Depends(get_database
     )
 
 
-@router.get("/contacts/", response_model=List[ContactWithDetails])
-def read_contacts(skip: int = 0, limit: int = 100, db: Session = Depends(get_database)):
-    """Получение списка контактов с деталями"""
-    contacts = contact_crud.get_multi(db, skip=skip, limit=limit)
-
-    result = []
-    for contact in contacts:
-        # Создаем объект ContactWithDetails
-        contact_dict = ContactWithDetails(
-            id=contact.id,
-            lead_id=contact.lead_id,
-            source_id=contact.source_id,
-            operator_id=contact.operator_id,
-            message=contact.message,
-            status=contact.status,
-            is_active=contact.is_active,
-            created_at=contact.created_at,
-            updated_at=contact.updated_at,
-            lead_external_id=contact.lead.external_id if contact.lead else "",
-            lead_phone=contact.lead.phone if contact.lead else None,
-            lead_email=contact.lead.email if contact.lead else None,
-            operator_name=contact.operator.name if contact.operator else None,
-            source_name=contact.source.name if contact.source else "",
-        )
-        result.append(contact_dict)
+@router.post("/contacts/distribute", response_model=List[ContactResponse])
+def distribute_contacts(
+    batch_in: ContactDistributeBatch, db: Session = Depends(get_database)
+):
+    """
+    Распределение пачки обращений одного источника за один проход.
 
-    return result
+    Кандидаты читаются один раз, емкость операторов учитывается по мере
+    заполнения, все обращения создаются одной транзакцией.
+    """
+    source = source_crud.get(db, id=batch_in.source_id)
+    if not source:
+        raise HTTPException(status_code=404, detail="Source not found")
+    if not batch_in.contacts:
+        return []
 
+    with unit_of_work(db):
+        defaults_by_external_id = {}
+        for item in batch_in.contacts:
+            defaults_by_external_id.setdefault(
+                item.lead_external_id, lead_defaults(item)
+            )
+        leads = lead_crud.get_or_create_many(db, defaults_by_external_id)
 
-@router.get("/contacts/by-lead/{lead_id}", response_model=List[ContactWithDetails])
-def read_contacts_by_lead(lead_id: int, db: Session = Depends(get_database)):
-    """Получение контактов по лиду"""
-    contacts = contact_crud.get_by_lead_id(db, lead_id=lead_id)
-
-    result = []
-    for contact in contacts:
-        contact_dict = ContactWithDetails(
-            id=contact.id,
-            lead_id=contact.lead_id,
-            source_id=contact.source_id,
-            operator_id=contact.operator_id,
-            message=contact.message,
-            status=contact.status,
-            is_active=contact.is_active,
-            created_at=contact.created_at,
-            updated_at=contact.updated_at,
-            lead_external_id=contact.lead.external_id if contact.lead else "",
-            lead_phone=contact.lead.phone if contact.lead else None,
-            lead_email=contact.lead.email if contact.lead else None,
-            operator_name=contact.operator.name if contact.operator else None,
-            source_name=contact.source.name if contact.source else "",
+        operator_ids = distribution_service.reserve_for_keys(
+            db,
+            batch_in.source_id,
+            [item.lead_external_id for item in batch_in.contacts],
         )
-        result.append(contact_dict)
-
+        contacts = contact_crud.add_batch(
+            db,
+            objs_in=[
+                ContactCreateDB(
+                    lead_id=leads[item.lead_external_id].id,
+                    source_id=batch_in.source_id,
+                    operator_id=operator_id,
+                    message=item.message,
+                )
+                for item, operator_id in zip(batch_in.contacts, operator_ids)
+            ],
+        )
+        result = [ContactResponse.model_validate(contact) for contact in contacts]
     return result
 
 
+@router.post("/contacts/batch", response_model=ContactBatchResult)
+def create_contacts_batch(batch_in: ContactBatch, db: Session = Depends(get_database)):
+    """
+    Пакетное создание обращений из разных источников.
+
+    Лиды создаются одним upsert, каждый источник проверяется один раз,
+    операторы резервируются пачкой на источник с учетом емкости, контакты
+    вставляются одной транзакцией. Ошибка отдельного обращения попадает в его
+    результат и не отменяет остальные.
+    """
+    with unit_of_work(db):
+        results = ingest_batch(db, batch_in.contacts)
+
+    failed = sum(result.error is not None for result in results)
+    return ContactBatchResult(
+        created=len(results) - failed, failed=failed, results=results
+    )
+
+
+@router.post("/contacts/spool", response_model=SpoolAck, status_code=202)
+def spool_contact(contact_in: ContactCreate):
+    """
+    Прием обращения через локальный журнал.
+
+    Ответ приходит после записи на диск, не дожидаясь БД; обращение создает
+    фоновый applier. Состояние — по tracking_id.
+    """
+    if not contact_spool.running:
+        raise HTTPException(status_code=503, detail="Spool is disabled")
+
+    return SpoolAck(tracking_id=contact_spool.submit(contact_in))
+
+
+@router.get("/contacts/spool/{tracking_id}", response_model=SpoolStatus)
+def read_spool_status(tracking_id: str, db: Session = Depends(get_database)):
+    """Состояние обращения, принятого через журнал"""
+    spool_status = contact_spool.status(db, tracking_id)
+    if spool_status is None:
+        raise HTTPException(status_code=404, detail="Tracking id not found")
+
+    return spool_status
+
+
+@router.get("/contacts/", response_model=List[ContactWithDetails])
+def read_contacts(
+    response: Response,
+    page: PageParams = Depends(page_params),
+    db: Session = Depends(get_database),
+):
+    """Получение списка контактов с деталями (курсор в X-Next-Cursor)"""
+    return _read_details(db, response, page)
+
+
+@router.get("/contacts/by-lead/{lead_id}", response_model=List[ContactWithDetails])
+def read_contacts_by_lead(
+    lead_id: int,
+    response: Response,
+    page: PageParams = Depends(page_params),
+    db: Session = Depends(get_database),
+):
+    """Получение контактов по лиду (постранично)"""
+    return _read_details(db, response, page, lead_id=lead_id)
+
+
 @router.get(
     "/contacts/by-operator/{operator_id}", response_model=List[ContactWithDetails]
 )
-def read_contacts_by_operator(operator_id: int, db: Session = Depends(get_database)):
-    """Получение контактов по оператору"""
-    contacts = contact_crud.get_by_operator_id(db, operator_id=operator_id)
-
-    result = []
-    for contact in contacts:
-        contact_dict = ContactWithDetails(
-            id=contact.id,
-            lead_id=contact.lead_id,
-            source_id=contact.source_id,
-            operator_id=contact.operator_id,
-            message=contact.message,
-            status=contact.status,
-            is_active=contact.is_active,
-            created_at=contact.created_at,
-            updated_at=contact.updated_at,
-            lead_external_id=contact.lead.external_id if contact.lead else "",
-            lead_phone=contact.lead.phone if contact.lead else None,
-            lead_email=contact.lead.email if contact.lead else None,
-            operator_name=contact.operator.name if contact.operator else None,
-            source_name=contact.source.name if contact.source else "",
+def read_contacts_by_operator(
+    operator_id: int,
+    response: Response,
+    page: PageParams = Depends(page_params),
+    db: Session = Depends(get_database),
+):
+    """Получение контактов по оператору (постранично)"""
+    return _read_details(db, response, page, operator_id=operator_id)
+
+
+@router.get("/contacts/search", response_model=List[ContactWithDetails])
+def search_contacts(
+    response: Response,
+    filters: ContactFilter = Depends(),
+    page: PageParams = Depends(page_params),
+    db: Session = Depends(get_database),
+):
+    """
+    Поиск контактов по статусу, активности, источнику, оператору и периоду
+    создания (постранично, курсор в X-Next-Cursor)
+    """
+    return _read_details(db, response, page, filters=filters)
+
+
+@router.get("/contacts/export")
+def export_contacts(
+    format_: ExportFormat = Query("ndjson", alias="format"),
+    lead_id: Optional[int] = None,
+    after_id: Optional[int] = Depends(cursor_param),
+    limit: Optional[int] = Query(None, ge=1),
+    filters: ContactFilter = Depends(),
+):
+    """
+    Потоковая выгрузка контактов с деталями в NDJSON или CSV.
+
+    Принимает фильтры поиска. С limit выгружается не больше limit строк,
+    а курсор продолжения возвращается в X-Next-Cursor, как у списков.
+    """
+
+    def build_query(db: Session):
+        return contact_crud.details_query(
+            db, filters=filters, lead_id=lead_id, after_id=after_id
         )
-        result.append(contact_dict)
 
-    return result
+    if limit is None:
+        return exporter.response(build_query, format_, "contacts")
+
+    id_column = contact_crud.model.id
+    ids = exporter.page_ids(build_query, id_column, limit)
+    response = exporter.response(
+        build_query, format_, "contacts", id_column=id_column, ids=ids
+    )
+    set_export_cursor(response, ids[-1] if len(ids) == limit else None)
+    return response
+
+
+@router.get("/contacts/search/plan", response_model=ContactQueryPlan)
+def explain_contact_search(
+    filters: ContactFilter = Depends(),
+    page: PageParams = Depends(page_params),
+    db: Session = Depends(get_database),
+):
+    """План запроса поиска контактов (только в отладочном режиме)"""
+    if not settings.debug:
+        raise HTTPException(status_code=404, detail="Not found")
+
+    query = contact_crud.details_query(
+        db, filters=filters, skip=page.skip, limit=page.limit, after_id=page.after_id
+    )
+    return ContactQueryPlan(sql=str(query.statement), plan=explain(db, query.statement))
 
 
 @router.put("/contacts/{contact_id}/close")
-def close_contact(contact_id: int, db: Session = Depends(get_database)):
+def close_contact(
+    contact_id: int,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_database),
+):
     """Закрытие контакта (снижение нагрузки оператора)"""
     contact = contact_crud.get(db, id=contact_id)
     if not contact:
         raise HTTPException(status_code=404, detail="Contact not found")
 
-    contact.is_active = False
-    contact.status = "closed"
-    db.commit()
-    db.refresh(contact)
+    was_active = contact.is_active
+    contact_crud.close(db, db_obj=contact)
+    if was_active and contact.operator_id is not None:
+        distribution_service.release_slot(contact.operator_id)
+        # Освободившийся слот сразу отдаем обращениям из очереди ожидания
+        background_tasks.add_task(
+            pending_dispatcher.on_operator_capacity, contact.operator_id
+        )
 
     return {"message": "Contact closed successfully"}
+
+
+@router.post("/contacts/close", response_model=ContactBulkCloseResult)
+def close_contacts(
+    criteria: ContactBulkClose,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_database),
+):
+    """
+    Массовое закрытие обращений: по списку id, оператору и/или источнику.
+
+    Контакты закрываются и нагрузка операторов уменьшается несколькими
+    UPDATE в одной транзакции.
+    """
+    closed = contact_crud.close_many(
+        db,
+        ids=criteria.ids,
+        operator_id=criteria.operator_id,
+        source_id=criteria.source_id,
+    )
+    for operator_id, count in closed.items():
+        if operator_id is None:
+            continue
+        for _ in range(count):
+            distribution_service.release_slot(operator_id)
+        background_tasks.add_task(pending_dispatcher.on_operator_capacity, operator_id)
+
+    return ContactBulkCloseResult(closed=sum(closed.values()))
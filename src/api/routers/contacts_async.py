@@ -0,0 +1,179 @@
+from typing import List, Optional
+
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    Header,
+    HTTPException,
+    Response,
+)
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.dependencies import get_async_database
+from api.pagination import PageParams, page_params, set_next_cursor
+from crud.async_crud import contact as contact_crud
+from crud.async_crud import lead as lead_crud
+from database_async import async_unit_of_work
+from schemas.contact import (
+    ContactCreate,
+    ContactCreateDB,
+    ContactResponse,
+    ContactWithDetails,
+)
+from services.async_distribution import (
+    async_distribution_service,
+    async_idempotency_cache,
+    async_routing_index,
+)
+from services.dispatcher import pending_dispatcher
+from services.distribution import distribution_service
+from services.idempotency import (
+    IdempotencyKeyMismatch,
+    idempotency_cache,
+    request_fingerprint,
+)
+from services.ingestion import lead_defaults
+
+from .contacts import REPLAYED_HEADER
+
+# Асинхронные версии горячих маршрутов контактов (ASYNC_DATABASE=true).
+# Регистрируются раньше синхронного роутера и перекрывают его маршруты.
+router = APIRouter()
+
+
+async def _read_details(
+    db: AsyncSession, response: Response, page: PageParams, **filters
+) -> List[ContactWithDetails]:
+    rows = await contact_crud.get_details(
+        db, skip=page.skip, limit=page.limit, after_id=page.after_id, **filters
+    )
+    set_next_cursor(response, rows, page)
+    return [ContactWithDetails.model_validate(row._mapping) for row in rows]
+
+
+@router.post("/contacts/", response_model=ContactResponse)
+async def create_contact_async(
+    contact_in: ContactCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(default=None, max_length=255),
+    db: AsyncSession = Depends(get_async_database),
+):
+    """Создание нового обращения (асинхронная версия POST /contacts/)"""
+    keys = idempotency_cache.keys_for(contact_in, idempotency_key)
+    fingerprint = request_fingerprint(contact_in)
+    try:
+        replay = await async_idempotency_cache.lookup(db, keys, fingerprint)
+        if replay is None:
+            try:
+                async with async_unit_of_work(db):
+                    created = await _create_contact(db, contact_in)
+                    await async_idempotency_cache.record(db, keys, created, fingerprint)
+            except IntegrityError:
+                # Параллельный запрос с тем же ключом зафиксировал обращение первым
+                replay = await async_idempotency_cache.lookup(db, keys, fingerprint)
+                if replay is None:
+                    raise
+            else:
+                idempotency_cache.remember(keys, created, fingerprint)
+                return created
+    except IdempotencyKeyMismatch:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key was already used with a different request",
+        )
+
+    response.headers[REPLAYED_HEADER] = "true"
+    return replay
+
+
+async def _create_contact(
+    db: AsyncSession, contact_in: ContactCreate
+) -> ContactResponse:
+    """Создание обращения внутри единицы работы"""
+    # 1. Проверяем существование источника (по кэшу маршрутизации)
+    if not await async_routing_index.source_exists(db, contact_in.source_id):
+        raise HTTPException(status_code=404, detail="Source not found")
+
+    # 2. Находим или создаем лида
+    lead = await lead_crud.get_or_create_by_external_id(
+        db,
+        external_id=contact_in.lead_external_id,
+        defaults=lead_defaults(contact_in),
+    )
+
+    # 3. Выбираем оператора и резервируем его слот нагрузки
+    operator_id = await async_distribution_service.reserve_operator(
+        db, contact_in.source_id, routing_key=contact_in.lead_external_id
+    )
+
+    # 4. Создаем контакт
+    contact = await contact_crud.create(
+        db,
+        obj_in=ContactCreateDB(
+            lead_id=lead.id,
+            source_id=contact_in.source_id,
+            operator_id=operator_id,
+            message=contact_in.message,
+        ),
+        load_reserved=True,
+    )
+    return ContactResponse.model_validate(contact)
+
+
+@router.get("/contacts/", response_model=List[ContactWithDetails])
+async def read_contacts_async(
+    response: Response,
+    page: PageParams = Depends(page_params),
+    db: AsyncSession = Depends(get_async_database),
+):
+    """Получение списка контактов с деталями (курсор в X-Next-Cursor)"""
+    return await _read_details(db, response, page)
+
+
+@router.get("/contacts/by-lead/{lead_id}", response_model=List[ContactWithDetails])
+async def read_contacts_by_lead_async(
+    lead_id: int,
+    response: Response,
+    page: PageParams = Depends(page_params),
+    db: AsyncSession = Depends(get_async_database),
+):
+    """Получение контактов по лиду (постранично)"""
+    return await _read_details(db, response, page, lead_id=lead_id)
+
+
+@router.get(
+    "/contacts/by-operator/{operator_id}", response_model=List[ContactWithDetails]
+)
+async def read_contacts_by_operator_async(
+    operator_id: int,
+    response: Response,
+    page: PageParams = Depends(page_params),
+    db: AsyncSession = Depends(get_async_database),
+):
+    """Получение контактов по оператору (постранично)"""
+    return await _read_details(db, response, page, operator_id=operator_id)
+
+
+@router.put("/contacts/{contact_id}/close")
+async def close_contact_async(
+    contact_id: int,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_database),
+):
+    """Закрытие контакта (снижение нагрузки оператора)"""
+    contact = await contact_crud.get(db, id=contact_id)
+    if not contact:
+        raise HTTPException(status_code=404, detail="Contact not found")
+
+    was_active = contact.is_active
+    await contact_crud.close(db, db_obj=contact)
+    if was_active and contact.operator_id is not None:
+        distribution_service.release_slot(contact.operator_id)
+        # Освободившийся слот сразу отдаем обращениям из очереди ожидания
+        background_tasks.add_task(
+            pending_dispatcher.on_operator_capacity, contact.operator_id
+        )
+
+    return {"message": "Contact closed successfully"}
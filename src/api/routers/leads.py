@@ -1,11 +1,19 @@
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 
 from api.dependencies import get_database
+from api.pagination import (
+    PageParams,
+    cursor_param,
+    page_params,
+    set_export_cursor,
+    set_next_cursor,
+)
 from crud.lead import lead as lead_crud
 from schemas.lead import LeadCreate, LeadResponse, LeadUpdate
+from services.export import ExportFormat, exporter
 
 router = APIRouter()
 
@@ -25,12 +33,47 @@ def create_lead(lead_in: LeadCreate, db: Session = Depends(get_database)):
 
 
 @router.get("/leads/", response_model=List[LeadResponse])
-def read_leads(skip: int = 0, limit: int = 100, db: Session = Depends(get_database)):
-    """Получение списка лидов"""
-    leads = lead_crud.get_multi(db, skip=skip, limit=limit)
+def read_leads(
+    response: Response,
+    page: PageParams = Depends(page_params),
+    db: Session = Depends(get_database),
+):
+    """Получение списка лидов (курсор следующей страницы в X-Next-Cursor)"""
+    leads = lead_crud.get_multi(
+        db, skip=page.skip, limit=page.limit, after_id=page.after_id
+    )
+    set_next_cursor(response, leads, page)
     return [LeadResponse.model_validate(lead) for lead in leads]
 
 
+@router.get("/leads/export")
+def export_leads(
+    format_: ExportFormat = Query("ndjson", alias="format"),
+    after_id: Optional[int] = Depends(cursor_param),
+    limit: Optional[int] = Query(None, ge=1),
+):
+    """
+    Потоковая выгрузка лидов в NDJSON или CSV.
+
+    С limit выгружается не больше limit строк, а курсор продолжения
+    возвращается в X-Next-Cursor, как у списков.
+    """
+
+    def build_query(db: Session):
+        return lead_crud.export_query(db, after_id=after_id)
+
+    if limit is None:
+        return exporter.response(build_query, format_, "leads")
+
+    id_column = lead_crud.model.id
+    ids = exporter.page_ids(build_query, id_column, limit)
+    response = exporter.response(
+        build_query, format_, "leads", id_column=id_column, ids=ids
+    )
+    set_export_cursor(response, ids[-1] if len(ids) == limit else None)
+    return response
+
+
 @router.get("/leads/{lead_id}", response_model=LeadResponse)
 def read_lead(lead_id: int, db: Session = Depends(get_database)):
     """Получение лида по ID"""
@@ -1,16 +1,21 @@
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
 
 from api.dependencies import get_database
+from api.pagination import PageParams, page_params, set_next_cursor
 from crud.operator import operator as operator_crud
 from schemas.operator import (
     OperatorCreate,
+    OperatorDrainSummary,
+    OperatorLoadDrift,
     OperatorResponse,
     OperatorUpdate,
     OperatorWithLoad,
 )
+from services.dispatcher import pending_dispatcher
+from services.distribution import distribution_service
 
 router = APIRouter()
 
@@ -31,19 +36,29 @@ def create_operator(operator_in: OperatorCreate, db: Session = Depends(get_datab
 
 @router.get("/operators/", response_model=List[OperatorResponse])
 def read_operators(
-    skip: int = 0, limit: int = 100, db: Session = Depends(get_database)
+    response: Response,
+    page: PageParams = Depends(page_params),
+    db: Session = Depends(get_database),
 ):
-    """Получение списка операторов"""
-    operators = operator_crud.get_multi(db, skip=skip, limit=limit)
+    """Получение списка операторов (курсор следующей страницы в X-Next-Cursor)"""
+    operators = operator_crud.get_multi(
+        db, skip=page.skip, limit=page.limit, after_id=page.after_id
+    )
+    set_next_cursor(response, operators, page)
     return [OperatorResponse.model_validate(op) for op in operators]
 
 
 @router.get("/operators/available", response_model=List[OperatorWithLoad])
 def read_available_operators(
-    skip: int = 0, limit: int = 100, db: Session = Depends(get_database)
+    response: Response,
+    page: PageParams = Depends(page_params),
+    db: Session = Depends(get_database),
 ):
-    """Получение доступных операторов (с нагрузкой)"""
-    operators = operator_crud.get_available_operators(db, skip=skip, limit=limit)
+    """Получение доступных операторов (с нагрузкой, постранично)"""
+    operators = operator_crud.get_available_operators(
+        db, skip=page.skip, limit=page.limit, after_id=page.after_id
+    )
+    set_next_cursor(response, operators, page)
 
     result = []
     for operator in operators:
@@ -63,6 +78,13 @@ def read_available_operators(
     return result
 
 
+@router.post("/operators/reconcile-load", response_model=List[OperatorLoadDrift])
+def reconcile_operator_load(db: Session = Depends(get_database)):
+    """Пересчет счетчиков нагрузки по контактам (возвращает расхождения)"""
+    drift = operator_crud.reconcile_load(db)
+    return [OperatorLoadDrift(**item) for item in drift]
+
+
 @router.get("/operators/{operator_id}", response_model=OperatorWithLoad)
 def read_operator(operator_id: int, db: Session = Depends(get_database)):
     """Получение оператора по ID с нагрузкой"""
@@ -84,14 +106,28 @@ def read_operator(operator_id: int, db: Session = Depends(get_database)):
 
 @router.put("/operators/{operator_id}", response_model=OperatorResponse)
 def update_operator(
-    operator_id: int, operator_in: OperatorUpdate, db: Session = Depends(get_database)
+    operator_id: int,
+    operator_in: OperatorUpdate,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_database),
 ):
     """Обновление оператора"""
     operator = operator_crud.get(db, id=operator_id)
     if not operator:
         raise HTTPException(status_code=404, detail="Operator not found")
 
+    was_active, old_max_load = operator.is_active, operator.max_load
     updated_operator = operator_crud.update(db, db_obj=operator, obj_in=operator_in)
+
+    # Деактивированный оператор отдает свои обращения другим
+    if was_active and not updated_operator.is_active:
+        distribution_service.drain_operator(db, operator_id)
+
+    # Активация или рост лимита освобождают емкость для очереди ожидания
+    if updated_operator.is_active and (
+        not was_active or updated_operator.max_load > old_max_load
+    ):
+        background_tasks.add_task(pending_dispatcher.on_operator_capacity, operator_id)
     return OperatorResponse.model_validate(updated_operator)
 
 
@@ -102,5 +138,16 @@ def delete_operator(operator_id: int, db: Session = Depends(get_database)):
     if not operator:
         raise HTTPException(status_code=404, detail="Operator not found")
 
-    operator_crud.remove(db, id=operator_id)
-    return {"message": "Operator deleted successfully"}
+    summary = distribution_service.remove_operator(db, operator_id)
+    return {"message": "Operator deleted successfully", **summary}
+
+
+@router.post("/operators/{operator_id}/drain", response_model=OperatorDrainSummary)
+def drain_operator(operator_id: int, db: Session = Depends(get_database)):
+    """Перераспределение активных обращений оператора между другими операторами"""
+    operator = operator_crud.get(db, id=operator_id)
+    if not operator:
+        raise HTTPException(status_code=404, detail="Operator not found")
+
+    summary = distribution_service.drain_operator(db, operator_id)
+    return OperatorDrainSummary(operator_id=operator_id, **summary)
@@ -1,17 +1,22 @@
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
 
 from api.dependencies import get_database
+from api.pagination import PageParams, page_params, set_next_cursor
 from crud.source import source as source_crud
 from schemas.source import (
     SourceCreate,
     SourceResponse,
+    SourceRoutingStats,
+    SourceUpdate,
     SourceWeightCreate,
     SourceWeightResponse,
     SourceWithWeights,
 )
+from services.dispatcher import pending_dispatcher
+from services.routing_index import routing_index
 
 router = APIRouter()
 
@@ -31,9 +36,16 @@ def create_source(source_in: SourceCreate, db: Session = Depends(get_database)):
 
 
 @router.get("/sources/", response_model=List[SourceResponse])
-def read_sources(skip: int = 0, limit: int = 100, db: Session = Depends(get_database)):
-    """Получение списка источников"""
-    sources = source_crud.get_multi(db, skip=skip, limit=limit)
+def read_sources(
+    response: Response,
+    page: PageParams = Depends(page_params),
+    db: Session = Depends(get_database),
+):
+    """Получение списка источников (курсор следующей страницы в X-Next-Cursor)"""
+    sources = source_crud.get_multi(
+        db, skip=page.skip, limit=page.limit, after_id=page.after_id
+    )
+    set_next_cursor(response, sources, page)
     return [SourceResponse.model_validate(source) for source in sources]
 
 
@@ -66,15 +78,57 @@ def read_source(source_id: int, db: Session = Depends(get_database)):
         name=source.name,
         bot_token=source.bot_token,
         description=source.description,
+        routing_strategy=source.routing_strategy,
         created_at=source.created_at,
         updated_at=source.updated_at,
         weights=weight_responses,
     )
 
 
+@router.get("/sources/{source_id}/routing-stats", response_model=SourceRoutingStats)
+def read_routing_stats(source_id: int, db: Session = Depends(get_database)):
+    """
+    Статистика привязки по ключу: сколько обращений попало к предпочтительному
+    оператору и сколько ушло дальше по рангу (счетчики процесса)
+    """
+    source = source_crud.get(db, id=source_id)
+    if not source:
+        raise HTTPException(status_code=404, detail="Source not found")
+
+    return SourceRoutingStats(
+        source_id=source_id,
+        routing_strategy=source.routing_strategy,
+        **routing_index.sticky_stats(source_id),
+    )
+
+
+@router.put("/sources/{source_id}", response_model=SourceResponse)
+def update_source(
+    source_id: int, source_in: SourceUpdate, db: Session = Depends(get_database)
+):
+    """Обновление источника (в том числе стратегии распределения)"""
+    source = source_crud.get(db, id=source_id)
+    if not source:
+        raise HTTPException(status_code=404, detail="Source not found")
+
+    # bot_token не должен совпадать с токеном другого источника
+    if source_in.bot_token is not None:
+        existing = source_crud.get_by_bot_token(db, bot_token=source_in.bot_token)
+        if existing and existing.id != source_id:
+            raise HTTPException(
+                status_code=400, detail="Source with this bot_token already exists"
+            )
+
+    updated_source = source_crud.update(db, db_obj=source, obj_in=source_in)
+    return SourceResponse.model_validate(updated_source)
+
+
 @router.post("/sources/{source_id}/weights", response_model=SourceWeightResponse)
 def add_source_weight(
-    source_id: int, weight_in: SourceWeightCreate, db: Session = Depends(get_database)
+    source_id: int,
+    weight_in: SourceWeightCreate,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_database),
 ):
     """Добавление веса оператора к источнику"""
     source = source_crud.get(db, id=source_id)
@@ -82,6 +136,8 @@ def add_source_weight(
         raise HTTPException(status_code=404, detail="Source not found")
 
     weight = source_crud.add_weight(db, source_id=source_id, weight_in=weight_in)
+    # Новый оператор источника может разобрать очередь ожидания
+    background_tasks.add_task(pending_dispatcher.on_source_capacity, source_id)
 
     return SourceWeightResponse(
         id=weight.id,
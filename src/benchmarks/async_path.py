@@ -0,0 +1,156 @@
+"""
+Сравнение синхронного и асинхронного пути POST /contacts/ под одной нагрузкой.
+
+Для каждого режима создает временную SQLite-базу с источником и
+операторами, собирает приложение (create_app) и отправляет поток
+обращений с заданной параллельностью через ASGI-транспорт httpx, без сети.
+Синхронные маршруты выполняются в пуле потоков Starlette, асинхронные — в
+цикле событий через AsyncSession. Печатает число обращений в секунду,
+перцентили задержки и число ошибок.
+
+Запуск из каталога src:
+
+    python -m benchmarks.async_path --contacts 2000 --concurrency 64
+"""
+
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import models  # noqa: F401  (регистрация моделей в метаданных)
+from api.dependencies import get_async_database, get_database
+from database import Base, apply_sqlite_profile, sqlite_profile
+from database_async import async_url
+from main import create_app
+
+from .distribution import percentile
+from .sqlite_profiles import seed
+
+MODES = ("sync", "async")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--contacts", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--operators", type=int, default=20)
+    parser.add_argument(
+        "--mode", choices=MODES, action="append", help="режим (по умолчанию оба)"
+    )
+    parser.add_argument("--json", action="store_true", help="вывод в JSON")
+    return parser.parse_args(argv)
+
+
+async def load(app, source_id: int, args) -> dict:
+    """args.contacts запросов POST /contacts/ не более args.concurrency разом"""
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies: List[float] = []
+    errors = 0
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+
+        async def send(i: int):
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(
+                    "/api/v1/contacts/",
+                    json={"lead_external_id": f"bench_{i}", "source_id": source_id},
+                )
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(send(i) for i in range(args.contacts)))
+        elapsed = time.perf_counter() - started
+    return {"latencies": latencies, "errors": errors, "elapsed": elapsed}
+
+
+def run_mode(mode: str, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{Path(tmp) / 'bench.db'}"
+        engine = create_engine(url, connect_args={"check_same_thread": False})
+        apply_sqlite_profile(engine, sqlite_profile())
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        async_engine = create_async_engine(async_url(url))
+        apply_sqlite_profile(async_engine.sync_engine, sqlite_profile())
+        async_session_factory = async_sessionmaker(
+            async_engine, autoflush=False, expire_on_commit=False
+        )
+
+        def override_get_database():
+            with session_factory() as db:
+                yield db
+
+        async def override_get_async_database():
+            async with async_session_factory() as db:
+                yield db
+
+        app = create_app(async_database=mode == "async")
+        app.dependency_overrides[get_database] = override_get_database
+        app.dependency_overrides[get_async_database] = override_get_async_database
+
+        async def run():
+            try:
+                return await load(app, source_id, args)
+            finally:
+                await async_engine.dispose()
+
+        try:
+            source_id = seed(session_factory, args)
+            result = asyncio.run(run())
+        finally:
+            engine.dispose()
+
+    latencies = result["latencies"] or [0.0]
+    return {
+        "mode": mode,
+        "created": len(result["latencies"]),
+        "errors": result["errors"],
+        "requests_per_second": len(result["latencies"]) / result["elapsed"],
+        "latency_ms": {
+            "p50": percentile(latencies, 50) * 1000,
+            "p95": percentile(latencies, 95) * 1000,
+            "p99": percentile(latencies, 99) * 1000,
+        },
+    }
+
+
+def print_report(reports: List[dict], args) -> None:
+    print(f"Обращений: {args.contacts}, параллельно: {args.concurrency}")
+    print(f"{'режим':<6} {'обр/с':>8} {'p50, мс':>8} {'p99, мс':>8} {'ошибок':>7}")
+    for report in reports:
+        latency = report["latency_ms"]
+        print(
+            f"{report['mode']:<6} {report['requests_per_second']:>8.0f} "
+            f"{latency['p50']:>8.2f} {latency['p99']:>8.2f} {report['errors']:>7}"
+        )
+
+
+def main(argv=None) -> List[dict]:
+    args = parse_args(argv)
+    reports = [run_mode(mode, args) for mode in args.mode or MODES]
+    if args.json:
+        print(json.dumps(reports, ensure_ascii=False, indent=2))
+    else:
+        print_report(reports, args)
+    return reports
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Симулятор распределения обращений.
+
+Создает во временной SQLite-базе N операторов, M источников и матрицу весов,
+прогоняет через DistributionService поток поступлений и закрытий обращений и
+печатает пропускную способность выбора, перцентили задержки, число
+SQL-выражений на выбор и отклонение фактических долей от заданных весов.
+
+Запуск из каталога src:
+
+    python -m benchmarks.distribution --operators 500 --sources 5 --contacts 20000
+"""
+
+import argparse
+import json
+import random
+import statistics
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+import models  # noqa: F401  (регистрация моделей в метаданных)
+from crud.contact import contact as contact_crud
+from database import Base, StatementCounter
+from models.contact import Contact
+from models.lead import Lead
+from models.operator import Operator
+from models.source import Source, SourceWeight
+from schemas.contact import ContactCreateDB
+from services.distribution import distribution_service
+from services.strategies import STRATEGIES
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--operators", type=int, default=200)
+    parser.add_argument("--sources", type=int, default=3)
+    parser.add_argument(
+        "--operators-per-source",
+        type=int,
+        default=None,
+        help="сколько операторов назначено на источник (по умолчанию все)",
+    )
+    parser.add_argument("--contacts", type=int, default=5000)
+    parser.add_argument("--max-load", type=int, default=1000)
+    parser.add_argument(
+        "--close-rate",
+        type=float,
+        default=0.5,
+        help="вероятность закрыть случайное активное обращение перед поступлением",
+    )
+    parser.add_argument("--strategy", choices=sorted(STRATEGIES), default="random")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--db", type=Path, default=None, help="новый файл SQLite для симуляции"
+    )
+    parser.add_argument("--json", action="store_true", help="вывод в JSON")
+    args = parser.parse_args(argv)
+    if args.db is not None and args.db.exists():
+        parser.error(f"{args.db} уже существует, симуляция использует чистую базу")
+    return args
+
+
+def seed(session_factory, args, rng: random.Random) -> Dict[int, Dict[int, int]]:
+    """Операторы, источники и веса; возвращает {source_id: {operator_id: вес}}"""
+    weights: Dict[int, Dict[int, int]] = {}
+    with session_factory() as db:
+        operators = [
+            Operator(
+                name=f"Оператор {i}",
+                email=f"sim_operator_{i}@example.com",
+                max_load=args.max_load,
+            )
+            for i in range(args.operators)
+        ]
+        db.add_all(operators)
+        db.flush()
+
+        per_source = args.operators_per_source or args.operators
+        for i in range(args.sources):
+            source = Source(
+                name=f"Источник {i}",
+                bot_token=f"sim_bot_{i}",
+                routing_strategy=args.strategy,
+            )
+            db.add(source)
+            db.flush()
+            chosen = rng.sample(operators, min(per_source, len(operators)))
+            weights[source.id] = {}
+            for operator in chosen:
+                weight = rng.randint(1, 100)
+                weights[source.id][operator.id] = weight
+                db.add(
+                    SourceWeight(
+                        source_id=source.id, operator_id=operator.id, weight=weight
+                    )
+                )
+        db.add(Lead(external_id="sim_lead"))
+        db.commit()
+    return weights
+
+
+def replay(session_factory, engine, args, weights, rng: random.Random) -> dict:
+    """Поток поступлений и закрытий через реальный сервис распределения"""
+    counter = StatementCounter()
+    event.listen(engine, "before_cursor_execute", counter)
+
+    latencies: List[float] = []
+    statements: List[int] = []
+    assigned: Dict[int, Counter] = defaultdict(Counter)
+    active: List[int] = []
+    unassigned = 0
+    source_ids = list(weights)
+
+    with session_factory() as db:
+        lead_id = db.query(Lead.id).scalar()
+        started = time.perf_counter()
+        for _ in range(args.contacts):
+            if active and rng.random() < args.close_rate:
+                contact_id = active.pop(rng.randrange(len(active)))
+                contact = db.get(Contact, contact_id)
+                contact_crud.close(db, db_obj=contact)
+                distribution_service.release_slot(contact.operator_id)
+
+            source_id = rng.choice(source_ids)
+            # Для sticky повторные обращения приходят от ограниченного числа лидов
+            routing_key = (
+                f"sim_lead_{rng.randrange(max(args.contacts // 4, 1))}"
+                if args.strategy == "sticky"
+                else None
+            )
+            before = counter.count
+            call_started = time.perf_counter()
+            operator_id = distribution_service.reserve_operator(
+                db, source_id, routing_key=routing_key
+            )
+            latencies.append(time.perf_counter() - call_started)
+            statements.append(counter.count - before)
+
+            contact = contact_crud.create(
+                db,
+                obj_in=ContactCreateDB(
+                    lead_id=lead_id, source_id=source_id, operator_id=operator_id
+                ),
+                load_reserved=True,
+            )
+            if operator_id is None:
+                unassigned += 1
+            else:
+                assigned[source_id][operator_id] += 1
+                active.append(contact.id)
+        elapsed = time.perf_counter() - started
+
+    event.remove(engine, "before_cursor_execute", counter)
+    return {
+        "latencies": latencies,
+        "statements": statements,
+        "assigned": assigned,
+        "unassigned": unassigned,
+        "elapsed": elapsed,
+    }
+
+
+def share_deviation(weights: Dict[int, int], assigned: Counter) -> float:
+    """Максимальное отклонение фактической доли оператора от заданной"""
+    total_weight = sum(weights.values())
+    total_assigned = sum(assigned.values())
+    if not total_assigned:
+        return 0.0
+    return max(
+        abs(assigned[operator_id] / total_assigned - weight / total_weight)
+        for operator_id, weight in weights.items()
+    )
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+def summarize(args, weights, result) -> dict:
+    latencies = result["latencies"]
+    deviations = {
+        source_id: share_deviation(source_weights, result["assigned"][source_id])
+        for source_id, source_weights in weights.items()
+    }
+    return {
+        "operators": args.operators,
+        "sources": args.sources,
+        "contacts": args.contacts,
+        "strategy": args.strategy,
+        "selections_per_second": len(latencies) / sum(latencies),
+        "ingest_per_second": args.contacts / result["elapsed"],
+        "latency_ms": {
+            "p50": percentile(latencies, 50) * 1000,
+            "p95": percentile(latencies, 95) * 1000,
+            "p99": percentile(latencies, 99) * 1000,
+            "max": max(latencies) * 1000,
+        },
+        "statements_per_selection": {
+            "mean": statistics.mean(result["statements"]),
+            "max": max(result["statements"]),
+        },
+        "unassigned": result["unassigned"],
+        "max_share_deviation": max(deviations.values(), default=0.0),
+        "share_deviation_by_source": deviations,
+    }
+
+
+def print_report(report: dict) -> None:
+    latency = report["latency_ms"]
+    statements = report["statements_per_selection"]
+    print(
+        f"Операторов: {report['operators']}, источников: {report['sources']}, "
+        f"обращений: {report['contacts']}, стратегия: {report['strategy']}"
+    )
+    print(f"Выборов в секунду:        {report['selections_per_second']:.0f}")
+    print(f"Обращений в секунду:      {report['ingest_per_second']:.0f}")
+    print(
+        f"Задержка выбора, мс:      p50={latency['p50']:.3f} "
+        f"p95={latency['p95']:.3f} p99={latency['p99']:.3f} max={latency['max']:.3f}"
+    )
+    print(
+        f"SQL-выражений на выбор:   среднее={statements['mean']:.2f} "
+        f"макс={statements['max']}"
+    )
+    print(f"Без оператора:            {report['unassigned']}")
+    print(f"Макс. отклонение доли:    {report['max_share_deviation']:.4f}")
+
+
+def main(argv=None) -> dict:
+    args = parse_args(argv)
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = args.db or Path(tmp) / "simulation.db"
+        engine = create_engine(
+            f"sqlite:///{db_path}", connect_args={"check_same_thread": False}
+        )
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        try:
+            weights = seed(session_factory, args, rng)
+            result = replay(session_factory, engine, args, weights, rng)
+        finally:
+            engine.dispose()
+
+    report = summarize(args, weights, result)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+    return report
+
+
+if __name__ == "__main__":
+    main()
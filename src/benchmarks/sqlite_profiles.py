@@ -0,0 +1,196 @@
+"""
+Сравнение пропускной способности приема обращений для профилей SQLite.
+
+Для каждого профиля создает временную базу с источником и операторами и
+прогоняет поток обращений из нескольких потоков тем же путем, что и
+POST /contacts/: лид, резервирование слота и контакт в одной транзакции.
+Печатает число обращений в секунду, перцентили задержки и число ошибок
+(например, "database is locked").
+
+Запуск из каталога src:
+
+    python -m benchmarks.sqlite_profiles --contacts 2000 --threads 8
+"""
+
+import argparse
+import json
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+import models  # noqa: F401  (регистрация моделей в метаданных)
+from crud.contact import contact as contact_crud
+from crud.lead import lead as lead_crud
+from database import (
+    Base,
+    apply_sqlite_profile,
+    sqlite_pragma_report,
+    sqlite_profile,
+    unit_of_work,
+)
+from models.operator import Operator
+from models.source import Source, SourceWeight
+from schemas.contact import ContactCreateDB
+from services.distribution import distribution_service
+
+from .distribution import percentile
+
+PROFILES: Dict[str, Dict[str, object]] = {
+    # Как до введения профиля: журнал отката, полная синхронизация, без ожидания
+    "legacy": {"busy_timeout": 0, "journal_mode": "delete", "synchronous": "full"},
+    "wal_full": {
+        "busy_timeout": 5000,
+        "journal_mode": "wal",
+        "synchronous": "full",
+    },
+    # Профиль из настроек приложения
+    "settings": sqlite_profile(),
+}
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--contacts", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--operators", type=int, default=20)
+    parser.add_argument(
+        "--profile",
+        choices=sorted(PROFILES),
+        action="append",
+        help="профиль для прогона (по умолчанию все)",
+    )
+    parser.add_argument("--json", action="store_true", help="вывод в JSON")
+    return parser.parse_args(argv)
+
+
+def seed(session_factory, args) -> int:
+    """Источник с операторами без ограничения нагрузки; возвращает source_id"""
+    with session_factory() as db:
+        source = Source(name="Источник", bot_token="profile_bot")
+        operators = [
+            Operator(
+                name=f"Оператор {i}",
+                email=f"profile_operator_{i}@example.com",
+                max_load=args.contacts,
+            )
+            for i in range(args.operators)
+        ]
+        db.add(source)
+        db.add_all(operators)
+        db.flush()
+        db.add_all(
+            SourceWeight(source_id=source.id, operator_id=operator.id, weight=1)
+            for operator in operators
+        )
+        db.commit()
+        return source.id
+
+
+def ingest(session_factory, source_id: int, args) -> dict:
+    """Поток обращений из args.threads потоков, по транзакции на обращение"""
+    per_thread = args.contacts // args.threads
+    latencies: List[float] = []
+    errors: List[str] = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(args.threads)
+
+    def worker(thread_no: int):
+        local: List[float] = []
+        with session_factory() as db:
+            barrier.wait()
+            for i in range(per_thread):
+                started = time.perf_counter()
+                try:
+                    with unit_of_work(db):
+                        lead = lead_crud.get_or_create_by_external_id(
+                            db, external_id=f"profile_lead_{thread_no}_{i}"
+                        )
+                        operator_id = distribution_service.reserve_operator(
+                            db, source_id
+                        )
+                        contact_crud.create(
+                            db,
+                            obj_in=ContactCreateDB(
+                                lead_id=lead.id,
+                                source_id=source_id,
+                                operator_id=operator_id,
+                            ),
+                            load_reserved=True,
+                        )
+                except OperationalError as exc:
+                    with lock:
+                        errors.append(str(exc.orig))
+                    continue
+                local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {"latencies": latencies, "errors": errors, "elapsed": elapsed}
+
+
+def run_profile(name: str, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(
+            f"sqlite:///{Path(tmp) / 'profile.db'}",
+            connect_args={"check_same_thread": False},
+        )
+        apply_sqlite_profile(engine, PROFILES[name])
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        try:
+            pragmas = sqlite_pragma_report(engine)
+            source_id = seed(session_factory, args)
+            result = ingest(session_factory, source_id, args)
+        finally:
+            engine.dispose()
+
+    latencies = result["latencies"] or [0.0]
+    return {
+        "profile": name,
+        "pragmas": pragmas,
+        "created": len(result["latencies"]),
+        "errors": len(result["errors"]),
+        "ingest_per_second": len(result["latencies"]) / result["elapsed"],
+        "latency_ms": {
+            "p50": percentile(latencies, 50) * 1000,
+            "p95": percentile(latencies, 95) * 1000,
+            "p99": percentile(latencies, 99) * 1000,
+        },
+    }
+
+
+def print_report(reports: List[dict]) -> None:
+    print(f"{'профиль':<10} {'обр/с':>8} {'p50, мс':>8} {'p99, мс':>8} {'ошибок':>7}")
+    for report in reports:
+        latency = report["latency_ms"]
+        print(
+            f"{report['profile']:<10} {report['ingest_per_second']:>8.0f} "
+            f"{latency['p50']:>8.2f} {latency['p99']:>8.2f} {report['errors']:>7}"
+        )
+
+
+def main(argv=None) -> List[dict]:
+    args = parse_args(argv)
+    reports = [run_profile(name, args) for name in args.profile or PROFILES]
+    if args.json:
+        print(json.dumps(reports, ensure_ascii=False, indent=2))
+    else:
+        print_report(reports)
+    return reports
+
+
+if __name__ == "__main__":
+    main()
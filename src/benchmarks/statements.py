@@ -0,0 +1,231 @@
+"""
+Микробенчмарк горячих запросов: сборка Query на каждый вызов против реестра
+готовых выражений (crud/statements.py).
+
+Для каждого запроса измеряет накладные расходы до обращения к БД — сборку
+выражения и вычисление ключа кэша компиляции — и полное время вызова на
+SQLite в памяти. "До" — прежняя сборка через db.query(...).filter(...),
+"после" — текущие методы CRUD и таблицы маршрутизации.
+
+Запуск из каталога src:
+
+    python -m benchmarks.statements --calls 5000
+"""
+
+import argparse
+import json
+import timeit
+from typing import Callable, Dict, List, Tuple
+
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import Session, sessionmaker
+
+import models  # noqa: F401  (регистрация моделей в метаданных)
+from crud import statements
+from crud.lead import lead as lead_crud
+from crud.operator import operator as operator_crud
+from crud.source import source as source_crud
+from database import Base
+from models.lead import Lead
+from models.operator import Operator
+from models.source import Source, SourceWeight
+from services.routing_index import routing_index
+
+
+def legacy_lead(db: Session):
+    return db.query(Lead).filter(Lead.external_id == "bench_lead")
+
+
+def legacy_source(db: Session):
+    return db.query(Source).filter(Source.bot_token == "bench_bot")
+
+
+def legacy_operator(db: Session):
+    return db.query(Operator).filter(Operator.id == 1)
+
+
+def legacy_reserve(db: Session):
+    return (
+        update(Operator)
+        .where(
+            Operator.id == 1,
+            Operator.is_active,
+            Operator.active_load + 1 <= Operator.max_load,
+        )
+        .values(active_load=Operator.active_load + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def legacy_route(db: Session):
+    return (
+        db.query(
+            SourceWeight.operator_id,
+            SourceWeight.weight,
+            Operator.max_load,
+            Operator.active_load,
+        )
+        .join(Operator, Operator.id == SourceWeight.operator_id)
+        .filter(
+            SourceWeight.source_id == 1,
+            SourceWeight.weight > 0,
+            Operator.is_active,
+        )
+        .order_by(SourceWeight.operator_id)
+    )
+
+
+def legacy_candidates(db: Session):
+    return (
+        db.query(Operator, SourceWeight.weight, Operator.active_load)
+        .join(SourceWeight, SourceWeight.operator_id == Operator.id)
+        .filter(
+            SourceWeight.source_id == 1,
+            SourceWeight.weight > 0,
+            Operator.is_active,
+            Operator.active_load < Operator.max_load,
+        )
+        .order_by(Operator.id)
+    )
+
+
+def statement_of(query):
+    return getattr(query, "statement", query)
+
+
+# Запрос: (сборка "до", выражение "после", вызов "до", вызов "после")
+CASES: Dict[str, Tuple[Callable, object, Callable, Callable]] = {
+    "lead_by_external_id": (
+        legacy_lead,
+        statements.LEAD_BY_EXTERNAL_ID,
+        lambda db: legacy_lead(db).first(),
+        lambda db: lead_crud.get_by_external_id(db, "bench_lead"),
+    ),
+    "source_by_bot_token": (
+        legacy_source,
+        statements.SOURCE_BY_BOT_TOKEN,
+        lambda db: legacy_source(db).first(),
+        lambda db: source_crud.get_by_bot_token(db, "bench_bot"),
+    ),
+    "operator_with_load": (
+        legacy_operator,
+        statements.OPERATOR_BY_ID,
+        lambda db: legacy_operator(db).first(),
+        lambda db: operator_crud.get_with_load(db, 1),
+    ),
+    "operator_try_reserve": (
+        legacy_reserve,
+        statements.OPERATOR_TRY_RESERVE,
+        lambda db: db.execute(legacy_reserve(db)).rowcount,
+        lambda db: operator_crud.try_reserve(db, 1, source_id=1),
+    ),
+    "source_route_rows": (
+        legacy_route,
+        statements.SOURCE_ROUTE_ROWS,
+        lambda db: legacy_route(db).all(),
+        lambda db: routing_index._build(db, 1),
+    ),
+    "source_candidates": (
+        legacy_candidates,
+        statements.SOURCE_CANDIDATES,
+        lambda db: legacy_candidates(db).all(),
+        lambda db: operator_crud.get_candidates_for_source(db, 1),
+    ),
+}
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--calls", type=int, default=5000)
+    parser.add_argument("--operators", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="вывод в JSON")
+    return parser.parse_args(argv)
+
+
+def seed(db: Session, args) -> None:
+    source = Source(name="Источник", bot_token="bench_bot")
+    operators = [
+        Operator(
+            name=f"Оператор {i}",
+            email=f"bench_operator_{i}@example.com",
+            max_load=10**9,
+        )
+        for i in range(args.operators)
+    ]
+    db.add_all([source, Lead(external_id="bench_lead"), *operators])
+    db.flush()
+    db.add_all(
+        SourceWeight(source_id=source.id, operator_id=operator.id, weight=1)
+        for operator in operators
+    )
+    db.commit()
+
+
+def per_call_us(func: Callable, calls: int) -> float:
+    """Лучшее из трех повторов среднее время вызова, мкс"""
+    return min(timeit.repeat(func, number=calls, repeat=3)) / calls * 1e6
+
+
+def run(args) -> List[dict]:
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    reports = []
+    with sessionmaker(bind=engine)() as db:
+        seed(db, args)
+        for name, (build, stmt, call_before, call_after) in CASES.items():
+            # Прогрев: компиляция попадает в кэш движка в обоих вариантах
+            call_before(db)
+            call_after(db)
+
+            def prepare_before(build=build):
+                return statement_of(build(db))._generate_cache_key()
+
+            reports.append(
+                {
+                    "query": name,
+                    "prepare_us": {
+                        "before": per_call_us(prepare_before, args.calls),
+                        "after": per_call_us(stmt._generate_cache_key, args.calls),
+                    },
+                    "call_us": {
+                        "before": per_call_us(
+                            lambda call=call_before: call(db), args.calls
+                        ),
+                        "after": per_call_us(
+                            lambda call=call_after: call(db), args.calls
+                        ),
+                    },
+                }
+            )
+            db.rollback()
+    engine.dispose()
+    return reports
+
+
+def print_report(reports: List[dict]) -> None:
+    print(
+        f"{'запрос':<22} {'подготовка, мкс':>20} {'вызов, мкс':>20} {'ускорение':>10}"
+    )
+    print(f"{'':<22} {'до':>9} {'после':>10} {'до':>9} {'после':>10}")
+    for report in reports:
+        prepare, call = report["prepare_us"], report["call_us"]
+        print(
+            f"{report['query']:<22} "
+            f"{prepare['before']:>9.1f} {prepare['after']:>10.2f} "
+            f"{call['before']:>9.1f} {call['after']:>10.1f} "
+            f"{call['before'] / call['after']:>9.2f}x"
+        )
+
+
+def main(argv=None) -> List[dict]:
+    args = parse_args(argv)
+    reports = run(args)
+    if args.json:
+        print(json.dumps(reports, ensure_ascii=False, indent=2))
+    else:
+        print_report(reports)
+    return reports
+
+
+if __name__ == "__main__":
+    main()
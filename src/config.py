@@ -1,3 +1,5 @@
+from typing import Literal, Optional
+
 from pydantic_settings import BaseSettings
 
 
@@ -5,9 +7,40 @@ class Settings(BaseSettings):
     # Используем простой относительный путь
     # Файл будет создаваться в рабочей директории при запуске
     database_url: str = "sqlite:///database.db"  # Файл в текущей директории
+    # Движок для чтения в GET-запросах: read-only URI той же WAL-базы или
+    # реплика, например sqlite:///file:database.db?mode=ro&uri=true; None — основной
+    read_database_url: Optional[str] = None
+    # Сколько секунд после записи клиент читает через основной движок
+    read_your_writes_seconds: float = 5
 
     app_title: str = "CRM Lead Distribution API"
     app_version: str = "1.0.0"
+    # Асинхронные маршруты контактов с AsyncSession (aiosqlite/asyncpg)
+    async_database: bool = False
+    # Отладочный режим: диагностические эндпоинты (планы запросов)
+    debug: bool = False
+    # Файл журнала приема обращений (POST /contacts/spool); None — выключен
+    spool_path: Optional[str] = None
+    # Автозакрытие обращений без изменений дольше TTL; None — выключено
+    idle_close_ttl_seconds: Optional[int] = None
+    idle_sweep_interval_seconds: float = 60
+    idle_sweep_batch_size: int = 500
+    # Окно дедупликации POST /contacts/ по лиду, источнику и сообщению; None — выключено
+    dedupe_window_seconds: Optional[int] = None
+    # Число ответов по ключам идемпотентности в памяти процесса
+    idempotency_cache_size: int = 10000
+    # Срок хранения ключей Idempotency-Key; None — бессрочно
+    idempotency_key_ttl_seconds: Optional[int] = 86400
+    # Срок хранения квитанций журнала приема (неделя); None — бессрочно
+    spool_receipt_ttl_seconds: Optional[int] = 7 * 86400
+
+    # Профиль SQLite: PRAGMA, выполняемые при каждом подключении
+    sqlite_journal_mode: Literal["wal", "delete", "truncate", "persist"] = "wal"
+    sqlite_synchronous: Literal["off", "normal", "full", "extra"] = "normal"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    sqlite_cache_size: int = -64000  # отрицательное значение — в КиБ
+    sqlite_temp_store: Literal["default", "file", "memory"] = "memory"
 
 
 settings = Settings()
@@ -1,6 +1,17 @@
 from .contact import contact as contact_crud
+from .idempotency_key import idempotency_key as idempotency_key_crud
 from .lead import lead as lead_crud
 from .operator import operator as operator_crud
+from .pending_assignment import pending_assignment as pending_assignment_crud
 from .source import source as source_crud
+from .spool_receipt import spool_receipt as spool_receipt_crud
 
-__all__ = ["operator_crud", "lead_crud", "source_crud", "contact_crud"]
+__all__ = [
+    "operator_crud",
+    "lead_crud",
+    "source_crud",
+    "contact_crud",
+    "pending_assignment_crud",
+    "spool_receipt_crud",
+    "idempotency_key_crud",
+]
@@ -0,0 +1,16 @@
+from database_async import AsyncProxy
+
+from .contact import contact as contact_crud
+from .idempotency_key import idempotency_key as idempotency_key_crud
+from .lead import lead as lead_crud
+from .operator import operator as operator_crud
+from .pending_assignment import pending_assignment as pending_assignment_crud
+from .source import source as source_crud
+
+# Асинхронные CRUD для AsyncSession (ASYNC_DATABASE=true)
+contact = AsyncProxy(contact_crud)
+idempotency_key = AsyncProxy(idempotency_key_crud)
+lead = AsyncProxy(lead_crud)
+operator = AsyncProxy(operator_crud)
+pending_assignment = AsyncProxy(pending_assignment_crud)
+source = AsyncProxy(source_crud)
@@ -1,17 +1,50 @@
-from typing import Any, Dict, Generic, List, Optional, Type, TypeVar, Union
+from itertools import islice
+from typing import (
+    Any,
+    Dict,
+    Generic,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
 
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy import func, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Query, Session
 
-from database import Base
+from database import Base, commit_or_flush
 
 ModelType = TypeVar("ModelType", bound=Base)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
 UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
 
+# Размер пачки строк для массовой вставки
+BULK_CHUNK_SIZE = 1000
+# Размер списка в WHERE id IN (...) для массовых UPDATE/DELETE
+IN_CHUNK_SIZE = 500
+
+# Диалекты с поддержкой INSERT ... ON CONFLICT
+UPSERT_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def chunked(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
 
 class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
+    # Естественный ключ модели (уникальные колонки) для upsert_many
+    natural_key: Tuple[str, ...] = ()
+
     def __init__(self, model: Type[ModelType]):
         self.model = model
 
@@ -19,18 +52,131 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         return db.query(self.model).filter(self.model.id == id).first()
 
     def get_multi(
-        self, db: Session, *, skip: int = 0, limit: int = 100
+        self,
+        db: Session,
+        *,
+        skip: int = 0,
+        limit: int = 100,
+        after_id: Optional[int] = None,
     ) -> List[ModelType]:
-        return db.query(self.model).offset(skip).limit(limit).all()
+        return self.paginate(
+            db.query(self.model), skip=skip, limit=limit, after_id=after_id
+        ).all()
+
+    def paginate(
+        self,
+        query: Query,
+        *,
+        skip: int = 0,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+    ) -> Query:
+        """
+        Страница запроса в порядке id.
+
+        С after_id используется keyset-условие id > after_id вместо OFFSET:
+        стоимость страницы не зависит от ее номера.
+        """
+        if after_id is not None:
+            query = query.filter(self.model.id > after_id)
+        query = query.order_by(self.model.id)
+        if skip:
+            query = query.offset(skip)
+        if limit is not None:
+            query = query.limit(limit)
+        return query
 
     def create(self, db: Session, *, obj_in: CreateSchemaType) -> ModelType:
         obj_in_data = jsonable_encoder(obj_in)
         db_obj = self.model(**obj_in_data)
         db.add(db_obj)
-        db.commit()
-        db.refresh(db_obj)
+        commit_or_flush(db, db_obj)
         return db_obj
 
+    def create_many(
+        self,
+        db: Session,
+        *,
+        objs_in: Iterable[CreateSchemaType],
+        chunk_size: int = BULK_CHUNK_SIZE,
+    ) -> List[int]:
+        """
+        Массовая вставка в одной транзакции.
+
+        Строки пишутся пачками по chunk_size одним INSERT ... RETURNING id
+        на пачку; объекты ORM не создаются. Возвращает id в порядке входных
+        объектов.
+        """
+        # Порядок строк RETURNING сам по себе не гарантирован:
+        # sort_by_parameter_order сопоставляет их с порядком параметров
+        stmt = insert(self.model).returning(self.model.id, sort_by_parameter_order=True)
+        ids: List[int] = []
+        for chunk in chunked(objs_in, chunk_size):
+            rows = [obj_in.model_dump() for obj_in in chunk]
+            ids.extend(db.scalars(stmt, rows))
+        commit_or_flush(db)
+        return ids
+
+    def upsert_insert(self, db: Session):
+        """INSERT диалекта сессии с поддержкой ON CONFLICT по natural_key"""
+        if not self.natural_key:
+            raise ValueError(f"{self.model.__name__} has no natural key")
+        dialect = db.get_bind().dialect.name
+        if dialect not in UPSERT_INSERTS:
+            raise NotImplementedError(f"Upsert is not supported for {dialect}")
+        return UPSERT_INSERTS[dialect](self.model)
+
+    def upsert_many(
+        self,
+        db: Session,
+        *,
+        objs_in: Iterable[CreateSchemaType],
+        update_fields: Optional[Sequence[str]] = None,
+        chunk_size: int = BULK_CHUNK_SIZE,
+    ) -> List[int]:
+        """
+        Массовая вставка с обновлением существующих строк по natural_key.
+
+        Использует INSERT ... ON CONFLICT DO UPDATE; по умолчанию обновляются
+        все поля схемы, кроме ключа. Повторы ключа во входных данных
+        схлопываются (побеждает последний). Возвращает id в порядке входных
+        объектов.
+        """
+        rows_by_key: Dict[Tuple[Any, ...], dict] = {}
+        keys: List[Tuple[Any, ...]] = []
+        for obj_in in objs_in:
+            row = obj_in.model_dump()
+            key = tuple(row[column] for column in self.natural_key)
+            rows_by_key[key] = row
+            keys.append(key)
+        if not keys:
+            return []
+
+        if update_fields is None:
+            first_row = next(iter(rows_by_key.values()))
+            update_fields = [
+                field for field in first_row if field not in self.natural_key
+            ]
+        stmt = self.upsert_insert(db)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(self.natural_key),
+            set_={
+                **{field: stmt.excluded[field] for field in update_fields},
+                "updated_at": func.now(),
+            },
+        ).returning(
+            self.model.id,
+            *(getattr(self.model, column) for column in self.natural_key),
+        )
+
+        # Обновленные строки сохраняют старые id, поэтому сопоставляем по ключу
+        ids_by_key: Dict[Tuple[Any, ...], int] = {}
+        for chunk in chunked(rows_by_key.values(), chunk_size):
+            for id_, *key in db.execute(stmt, chunk):
+                ids_by_key[tuple(key)] = id_
+        commit_or_flush(db)
+        return [ids_by_key[key] for key in keys]
+
     def update(
         self,
         db: Session,
@@ -47,12 +193,11 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             if field in update_data:
                 setattr(db_obj, field, update_data[field])
         db.add(db_obj)
-        db.commit()
-        db.refresh(db_obj)
+        commit_or_flush(db, db_obj)
         return db_obj
 
     def remove(self, db: Session, *, id: int) -> ModelType:
         obj = db.query(self.model).get(id)
         db.delete(obj)
-        db.commit()
+        commit_or_flush(db)
         return obj
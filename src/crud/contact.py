@@ -1,20 +1,278 @@
-from typing import List
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 
-from sqlalchemy import func
-from sqlalchemy.orm import Session
+from sqlalchemy import Row, and_, case, func, select, update
+from sqlalchemy.orm import Query, Session
 
+from database import commit_or_flush
 from models.contact import Contact
-from schemas.contact import ContactCreateDB
+from models.lead import Lead
+from models.operator import Operator
+from models.source import Source
+from schemas.contact import ContactCreateDB, ContactFilter
 
-from .base import CRUDBase
+from .base import IN_CHUNK_SIZE, CRUDBase, chunked
+from .operator import operator as operator_crud
+from .pending_assignment import pending_assignment as pending_crud
 
 
 class CRUDContact(CRUDBase[Contact, ContactCreateDB, ContactCreateDB]):
-    def get_by_lead_id(self, db: Session, lead_id: int) -> List[Contact]:
-        return db.query(Contact).filter(Contact.lead_id == lead_id).all()
+    def create(
+        self, db: Session, *, obj_in: ContactCreateDB, load_reserved: bool = False
+    ) -> Contact:
+        """
+        Создание контакта вместе с увеличением нагрузки оператора.
 
-    def get_by_operator_id(self, db: Session, operator_id: int) -> List[Contact]:
-        return db.query(Contact).filter(Contact.operator_id == operator_id).all()
+        load_reserved=True означает, что слот уже занят в этой транзакции
+        (DistributionService.reserve_operator) и счетчик трогать не нужно.
+        Контакт без оператора ставится в очередь ожидания.
+        """
+        db_obj = Contact(**obj_in.model_dump())
+        db.add(db_obj)
+        if db_obj.operator_id is not None and db_obj.is_active and not load_reserved:
+            operator_crud.change_load(db, db_obj.operator_id, 1)
+        if db_obj.operator_id is None and db_obj.is_active:
+            db.flush()
+            pending_crud.enqueue(db, [db_obj])
+        commit_or_flush(db, db_obj)
+        return db_obj
+
+    def add_batch(
+        self, db: Session, *, objs_in: List[ContactCreateDB]
+    ) -> List[Contact]:
+        """
+        Добавление пачки контактов без фиксации транзакции.
+
+        Слоты операторов должны быть заняты заранее
+        (DistributionService.reserve_batch). Контакты без оператора ставятся в
+        очередь ожидания.
+        """
+        db_objs = [Contact(**obj_in.model_dump()) for obj_in in objs_in]
+        db.add_all(db_objs)
+        db.flush()
+        pending_crud.enqueue(db, db_objs)
+        return db_objs
+
+    def close(self, db: Session, *, db_obj: Contact) -> Contact:
+        """Закрытие контакта с освобождением слота оператора"""
+        if db_obj.is_active and db_obj.operator_id is not None:
+            operator_crud.change_load(db, db_obj.operator_id, -1)
+        elif db_obj.is_active:
+            pending_crud.remove_for_contact(db, db_obj.id)
+        db_obj.is_active = False
+        db_obj.status = "closed"
+        commit_or_flush(db, db_obj)
+        return db_obj
+
+    def close_many(
+        self,
+        db: Session,
+        *,
+        ids: Optional[List[int]] = None,
+        operator_id: Optional[int] = None,
+        source_id: Optional[int] = None,
+    ) -> Dict[Optional[int], int]:
+        """
+        Массовое закрытие активных контактов (условия объединяются по И).
+
+        Возвращает число закрытых контактов по operator_id (None — контакты из
+        очереди ожидания).
+        """
+        criteria = []
+        if operator_id is not None:
+            criteria.append(Contact.operator_id == operator_id)
+        if source_id is not None:
+            criteria.append(Contact.source_id == source_id)
+
+        closed: Counter = Counter()
+        if ids is None:
+            closed.update(self.close_where(db, *criteria))
+        else:
+            for chunk in chunked(ids, IN_CHUNK_SIZE):
+                closed.update(self.close_where(db, Contact.id.in_(chunk), *criteria))
+        commit_or_flush(db)
+        return dict(closed)
+
+    def close_idle(
+        self, db: Session, *, before: datetime, limit: int
+    ) -> Dict[Optional[int], int]:
+        """Закрыть до limit контактов, не менявшихся с before (одна транзакция)"""
+        closed = self.close_where(db, Contact.updated_at < before, limit=limit)
+        commit_or_flush(db)
+        return closed
+
+    def close_statement(self, *criteria, limit: Optional[int] = None):
+        """
+        UPDATE закрытия активных контактов по условию без выполнения
+        (например, для EXPLAIN). С limit закрываются limit давно не
+        менявшихся: для автозакрытия выборка идет по частичному индексу
+        ix_contacts_active_updated_at без сортировки.
+        """
+        condition = and_(Contact.is_active, *criteria)
+        if limit is not None:
+            # Снаружи — id и повторная проверка активности на случай
+            # параллельного закрытия: строки ищутся по первичному ключу
+            condition = and_(
+                Contact.id.in_(
+                    select(Contact.id)
+                    .where(condition)
+                    .order_by(Contact.updated_at, Contact.id)
+                    .limit(limit)
+                ),
+                Contact.is_active,
+            )
+        return (
+            update(Contact)
+            .where(condition)
+            .values(is_active=False, status="closed")
+            .returning(Contact.id, Contact.operator_id)
+            .execution_options(synchronize_session=False)
+        )
+
+    def close_where(
+        self, db: Session, *criteria, limit: Optional[int] = None
+    ) -> Dict[Optional[int], int]:
+        """
+        Закрыть активные контакты по условию без фиксации транзакции.
+
+        Контакты закрываются одним UPDATE ... RETURNING, нагрузка операторов
+        уменьшается одним UPDATE на число закрытых у каждого, закрытые
+        ожидавшие контакты убираются из очереди.
+        """
+        rows = db.execute(self.close_statement(*criteria, limit=limit)).all()
+
+        closed = Counter(operator_id for _, operator_id in rows)
+        released = {
+            operator_id: count
+            for operator_id, count in closed.items()
+            if operator_id is not None
+        }
+        if released:
+            db.execute(
+                update(Operator)
+                .where(Operator.id.in_(released))
+                .values(
+                    active_load=Operator.active_load - case(released, value=Operator.id)
+                )
+                .execution_options(synchronize_session=False)
+            )
+        pending_crud.remove_for_contacts(
+            db, [contact_id for contact_id, operator_id in rows if operator_id is None]
+        )
+        return dict(closed)
+
+    def get_by_lead_id(
+        self,
+        db: Session,
+        lead_id: int,
+        *,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+    ) -> List[Contact]:
+        query = db.query(Contact).filter(Contact.lead_id == lead_id)
+        return self.paginate(query, limit=limit, after_id=after_id).all()
+
+    def get_by_operator_id(
+        self,
+        db: Session,
+        operator_id: int,
+        *,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+    ) -> List[Contact]:
+        query = db.query(Contact).filter(Contact.operator_id == operator_id)
+        return self.paginate(query, limit=limit, after_id=after_id).all()
+
+    def get_details(
+        self,
+        db: Session,
+        *,
+        filters: Optional[ContactFilter] = None,
+        lead_id: Optional[int] = None,
+        operator_id: Optional[int] = None,
+        skip: int = 0,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+    ) -> List[Row]:
+        """
+        Страница контактов с данными лида, оператора и источника.
+
+        Один запрос с JOIN выбирает только колонки ContactWithDetails (имена
+        колонок совпадают с полями схемы); ORM-объекты не создаются.
+        """
+        return self.details_query(
+            db,
+            filters=filters,
+            lead_id=lead_id,
+            operator_id=operator_id,
+            skip=skip,
+            limit=limit,
+            after_id=after_id,
+        ).all()
+
+    def details_query(
+        self,
+        db: Session,
+        *,
+        filters: Optional[ContactFilter] = None,
+        lead_id: Optional[int] = None,
+        operator_id: Optional[int] = None,
+        skip: int = 0,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+    ) -> Query:
+        """Запрос страницы get_details без выполнения (например, для EXPLAIN)"""
+        query = (
+            db.query(
+                Contact.id,
+                Contact.lead_id,
+                Contact.source_id,
+                Contact.operator_id,
+                Contact.message,
+                Contact.status,
+                Contact.is_active,
+                Contact.created_at,
+                Contact.updated_at,
+                func.coalesce(Lead.external_id, "").label("lead_external_id"),
+                Lead.phone.label("lead_phone"),
+                Lead.email.label("lead_email"),
+                Operator.name.label("operator_name"),
+                func.coalesce(Source.name, "").label("source_name"),
+            )
+            .outerjoin(Lead, Lead.id == Contact.lead_id)
+            .outerjoin(Operator, Operator.id == Contact.operator_id)
+            .outerjoin(Source, Source.id == Contact.source_id)
+        )
+        if lead_id is not None:
+            query = query.filter(Contact.lead_id == lead_id)
+        if operator_id is not None:
+            query = query.filter(Contact.operator_id == operator_id)
+        if filters is not None:
+            query = self.apply_filters(query, filters)
+        return self.paginate(query, skip=skip, limit=limit, after_id=after_id)
+
+    @staticmethod
+    def apply_filters(query: Query, filters: ContactFilter) -> Query:
+        """
+        Условия поиска контактов.
+
+        Покрываются составными индексами Contact: (operator_id, is_active),
+        (source_id, created_at), (status, created_at).
+        """
+        if filters.operator_id is not None:
+            query = query.filter(Contact.operator_id == filters.operator_id)
+        if filters.is_active is not None:
+            query = query.filter(Contact.is_active == filters.is_active)
+        if filters.source_id is not None:
+            query = query.filter(Contact.source_id == filters.source_id)
+        if filters.status is not None:
+            query = query.filter(Contact.status == filters.status)
+        if filters.created_from is not None:
+            query = query.filter(Contact.created_at >= filters.created_from)
+        if filters.created_to is not None:
+            query = query.filter(Contact.created_at < filters.created_to)
+        return query
 
     def get_active_by_operator_id(self, db: Session, operator_id: int) -> List[Contact]:
         return (
@@ -23,11 +281,47 @@ class CRUDContact(CRUDBase[Contact, ContactCreateDB, ContactCreateDB]):
             .all()
         )
 
+    def assign_pending(self, db: Session, contact_id: int, operator_id: int) -> bool:
+        """
+        Назначить оператора ожидающему контакту (без коммита).
+
+        Срабатывает, только если контакт все еще активен и без оператора.
+        """
+        assigned = (
+            db.query(Contact)
+            .filter(
+                Contact.id == contact_id,
+                Contact.operator_id.is_(None),
+                Contact.is_active,
+            )
+            .update({Contact.operator_id: operator_id}, synchronize_session=False)
+        )
+        return assigned == 1
+
+    def get_active_ids_by_operator_id(
+        self, db: Session, operator_id: int
+    ) -> List[Tuple[int, int]]:
+        """Пары (id, source_id) активных контактов оператора"""
+        return [
+            (contact_id, source_id)
+            for contact_id, source_id in db.query(Contact.id, Contact.source_id)
+            .filter(Contact.operator_id == operator_id, Contact.is_active)
+            .order_by(Contact.id)
+        ]
+
+    def reassign(
+        self, db: Session, contact_ids: List[int], operator_id: Optional[int]
+    ) -> None:
+        """Сменить оператора у контактов пачками UPDATE ... WHERE id IN (без коммита)"""
+        for chunk in chunked(contact_ids, IN_CHUNK_SIZE):
+            db.query(Contact).filter(Contact.id.in_(chunk)).update(
+                {Contact.operator_id: operator_id}, synchronize_session=False
+            )
+
     def count_active_by_operator_id(self, db: Session, operator_id: int) -> int:
+        # Читаем денормализованный счетчик вместо COUNT(*) по контактам
         return (
-            db.query(func.count(Contact.id))
-            .filter(Contact.operator_id == operator_id, Contact.is_active)
-            .scalar()
+            db.query(Operator.active_load).filter(Operator.id == operator_id).scalar()
             or 0
         )
 
@@ -0,0 +1,66 @@
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+from sqlalchemy import delete, insert
+from sqlalchemy.orm import Session
+
+from models.idempotency_key import IdempotencyKey
+
+from .base import CRUDBase
+
+
+class CRUDIdempotencyKey(CRUDBase[IdempotencyKey, BaseModel, BaseModel]):
+    natural_key = ("key",)
+
+    def get_many(self, db: Session, keys: List[str]) -> Dict[str, IdempotencyKey]:
+        return {
+            row.key: row
+            for row in db.query(IdempotencyKey).filter(IdempotencyKey.key.in_(keys))
+        }
+
+    def add(
+        self,
+        db: Session,
+        *,
+        key: str,
+        contact_id: int,
+        response: str,
+        fingerprint: Optional[str] = None,
+        expire_before: Optional[datetime] = None,
+    ) -> None:
+        """
+        Сохранить ответ по ключу без фиксации транзакции.
+
+        Повторный ключ вызывает IntegrityError: параллельный запрос с тем же
+        ключом успел первым. С expire_before запись с этим ключом, созданная
+        раньше, сначала удаляется — ключ вышел из окна и занимается заново.
+        """
+        if expire_before is not None:
+            db.execute(
+                delete(IdempotencyKey).where(
+                    IdempotencyKey.key == key,
+                    IdempotencyKey.created_at < expire_before,
+                )
+            )
+        db.execute(
+            insert(IdempotencyKey).values(
+                key=key,
+                contact_id=contact_id,
+                response=response,
+                fingerprint=fingerprint,
+            )
+        )
+
+    def purge(self, db: Session, *, prefix: str, before: datetime) -> int:
+        """Удалить ключи с префиксом, созданные раньше before (без коммита)"""
+        result = db.execute(
+            delete(IdempotencyKey).where(
+                IdempotencyKey.key.startswith(prefix, autoescape=True),
+                IdempotencyKey.created_at < before,
+            )
+        )
+        return result.rowcount
+
+
+idempotency_key = CRUDIdempotencyKey(IdempotencyKey)
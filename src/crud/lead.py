@@ -1,27 +1,109 @@
-from typing import Optional
+from typing import Any, Dict, Optional
 
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Query, Session
 
+from database import commit_or_flush
 from models.lead import Lead
 from schemas.lead import LeadCreate, LeadUpdate
 
+from . import statements
 from .base import CRUDBase
 
+# Upsert лида get_or_create по имени диалекта
+_GET_OR_CREATE_STMTS: Dict[str, Any] = {}
+
 
 class CRUDLead(CRUDBase[Lead, LeadCreate, LeadUpdate]):
+    natural_key = ("external_id",)
+
     def get_by_external_id(self, db: Session, external_id: str) -> Optional[Lead]:
-        return db.query(Lead).filter(Lead.external_id == external_id).first()
+        return db.scalars(
+            statements.LEAD_BY_EXTERNAL_ID, {"external_id": external_id}
+        ).first()
 
     def get_or_create_by_external_id(
         self, db: Session, external_id: str, defaults: dict = None
     ) -> Lead:
-        lead = self.get_by_external_id(db, external_id)
-        if not lead:
-            create_data = {"external_id": external_id}
-            if defaults:
-                create_data.update(defaults)
-            lead = self.create(db, obj_in=LeadCreate(**create_data))
+        """
+        Найти или создать лида одним выражением INSERT ... ON CONFLICT.
+
+        При конфликте по external_id выполняется пустое обновление, поэтому
+        RETURNING отдает строку в обоих случаях, а параллельные первые
+        обращения одного лида не падают с IntegrityError. defaults
+        применяются только к новому лиду.
+        """
+        create_data = {"external_id": external_id}
+        if defaults:
+            create_data.update(defaults)
+        lead = db.scalars(
+            self._get_or_create_stmt(db),
+            LeadCreate(**create_data).model_dump(),
+            execution_options={"populate_existing": True},
+        ).one()
+        commit_or_flush(db, lead)
         return lead
 
+    def export_query(
+        self,
+        db: Session,
+        *,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> Query:
+        """Колонки лидов для выгрузки в порядке id, начиная после after_id"""
+        query = db.query(
+            Lead.id,
+            Lead.external_id,
+            Lead.phone,
+            Lead.email,
+            Lead.full_name,
+            Lead.notes,
+            Lead.created_at,
+            Lead.updated_at,
+        )
+        return self.paginate(query, limit=limit, after_id=after_id)
+
+    def get_or_create_many(
+        self, db: Session, defaults_by_external_id: Dict[str, dict]
+    ) -> Dict[str, Lead]:
+        """
+        Найти или создать лидов пачкой: один SELECT и один upsert недостающих.
+
+        Лиды, созданные параллельно между SELECT и вставкой, возвращаются
+        тем же upsert. Транзакция не фиксируется.
+        """
+        external_ids = list(defaults_by_external_id)
+        leads = {
+            lead.external_id: lead
+            for lead in db.query(Lead).filter(Lead.external_id.in_(external_ids))
+        }
+        missing = [
+            LeadCreate(
+                external_id=external_id, **defaults_by_external_id[external_id]
+            ).model_dump()
+            for external_id in external_ids
+            if external_id not in leads
+        ]
+        if missing:
+            created = db.scalars(
+                self._get_or_create_stmt(db),
+                missing,
+                execution_options={"populate_existing": True},
+            )
+            leads.update((lead.external_id, lead) for lead in created)
+        return leads
+
+    def _get_or_create_stmt(self, db: Session):
+        # Выражение строится один раз на диалект, значения передаются параметрами
+        dialect = db.get_bind().dialect.name
+        if dialect not in _GET_OR_CREATE_STMTS:
+            # Пустое обновление при конфликте: RETURNING отдает и существующую строку
+            stmt = self.upsert_insert(db)
+            _GET_OR_CREATE_STMTS[dialect] = stmt.on_conflict_do_update(
+                index_elements=["external_id"],
+                set_={"external_id": stmt.excluded.external_id},
+            ).returning(Lead)
+        return _GET_OR_CREATE_STMTS[dialect]
+
 
 lead = CRUDLead(Lead)
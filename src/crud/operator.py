@@ -1,48 +1,141 @@
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 
-from sqlalchemy import func
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 
+from database import commit_or_flush
 from models.contact import Contact
 from models.operator import Operator
+from models.source import SourceWeight
 from schemas.operator import OperatorCreate, OperatorUpdate
 
+from . import statements
 from .base import CRUDBase
 
 
 class CRUDOperator(CRUDBase[Operator, OperatorCreate, OperatorUpdate]):
+    natural_key = ("email",)
+
     def get_by_email(self, db: Session, email: str) -> Optional[Operator]:
         return db.query(Operator).filter(Operator.email == email).first()
 
     def get_with_load(self, db: Session, id: int) -> Optional[Operator]:
-        operator = db.query(Operator).filter(Operator.id == id).first()
-        if operator:
-            # Считаем текущую нагрузку (количество активных контактов)
-            load = (
-                db.query(func.count(Contact.id))
-                .filter(Contact.operator_id == id, Contact.is_active)
-                .scalar()
+        # Нагрузка хранится в самом операторе (active_load)
+        return db.scalars(statements.OPERATOR_BY_ID, {"operator_id": id}).first()
+
+    def get_if_available(self, db: Session, id: int) -> Optional[Operator]:
+        """Оператор, если он активен и не достиг лимита нагрузки"""
+        return (
+            db.query(Operator)
+            .filter(
+                Operator.id == id,
+                Operator.is_active,
+                Operator.active_load < Operator.max_load,
             )
-            # Добавляем нагрузку как атрибут объекта
-            setattr(operator, "current_load", load or 0)
-        return operator
+            .first()
+        )
 
     def get_available_operators(
-        self, db: Session, *, skip: int = 0, limit: int = 100
+        self,
+        db: Session,
+        *,
+        skip: int = 0,
+        limit: int = 100,
+        after_id: Optional[int] = None,
     ) -> List[Operator]:
-        # Получаем операторов с текущей нагрузкой
-        operators = db.query(Operator).filter(Operator.is_active).all()
-        result = []
-        for operator in operators:
-            load = (
-                db.query(func.count(Contact.id))
-                .filter(Contact.operator_id == operator.id, Contact.is_active)
-                .scalar()
+        query = db.query(Operator).filter(
+            Operator.is_active, Operator.active_load < Operator.max_load
+        )
+        return self.paginate(query, skip=skip, limit=limit, after_id=after_id).all()
+
+    def change_load(self, db: Session, operator_id: int, delta: int) -> None:
+        """Изменение счетчика нагрузки без фиксации транзакции"""
+        db.query(Operator).filter(Operator.id == operator_id).update(
+            {Operator.active_load: Operator.active_load + delta},
+            synchronize_session=False,
+        )
+
+    def try_reserve(
+        self, db: Session, operator_id: int, amount: int = 1, *, source_id: int
+    ) -> bool:
+        """
+        Атомарно занять amount слотов нагрузки оператора под источник.
+
+        Условный UPDATE срабатывает, только если оператор активен, не достиг
+        лимита и все еще имеет вес в источнике, поэтому параллельные запросы
+        не превышают max_load, а устаревший маршрут не отдает обращения
+        оператору, убранному из источника. Транзакция не фиксируется.
+        """
+        result = db.execute(
+            statements.OPERATOR_TRY_RESERVE,
+            {"operator_id": operator_id, "amount": amount, "source_id": source_id},
+        )
+        return result.rowcount == 1
+
+    def remove_set_based(self, db: Session, operator_id: int) -> None:
+        """
+        Удаление оператора без загрузки связанных объектов.
+
+        Веса удаляются одним DELETE, в контактах ссылка обнуляется одним
+        UPDATE (как при удалении через ORM).
+        """
+        db.query(SourceWeight).filter(SourceWeight.operator_id == operator_id).delete(
+            synchronize_session=False
+        )
+        db.query(Contact).filter(Contact.operator_id == operator_id).update(
+            {Contact.operator_id: None}, synchronize_session=False
+        )
+        db.query(Operator).filter(Operator.id == operator_id).delete(
+            synchronize_session=False
+        )
+        commit_or_flush(db)
+
+    def reconcile_load(self, db: Session) -> List[Dict[str, int]]:
+        """
+        Пересчет счетчиков нагрузки по таблице контактов.
+
+        Возвращает список расхождений (до исправления) и исправляет их одним
+        UPDATE.
+        """
+        actual = (
+            select(func.count(Contact.id))
+            .where(Contact.operator_id == Operator.id, Contact.is_active)
+            .correlate(Operator)
+            .scalar_subquery()
+        )
+        drift = [
+            {"operator_id": id, "recorded_load": recorded, "actual_load": real}
+            for id, recorded, real in db.query(
+                Operator.id, Operator.active_load, actual
+            )
+            .filter(Operator.active_load != actual)
+            .order_by(Operator.id)
+            .all()
+        ]
+        if drift:
+            db.query(Operator).filter(Operator.active_load != actual).update(
+                {Operator.active_load: actual}, synchronize_session=False
+            )
+        commit_or_flush(db)
+        return drift
+
+    def get_candidates_for_source(
+        self, db: Session, source_id: int, *, exclude_operator_id: Optional[int] = None
+    ) -> List[Tuple[Operator, int, int]]:
+        """
+        Кандидаты на распределение одним запросом.
+
+        Возвращает тройки (оператор, вес, текущая нагрузка) только для активных
+        операторов с положительным весом, не достигших лимита нагрузки.
+        """
+        if exclude_operator_id is None:
+            rows = db.execute(statements.SOURCE_CANDIDATES, {"source_id": source_id})
+        else:
+            rows = db.execute(
+                statements.SOURCE_CANDIDATES_EXCLUDING,
+                {"source_id": source_id, "exclude_operator_id": exclude_operator_id},
             )
-            if load is None or load < operator.max_load:
-                operator.current_load = load or 0
-                result.append(operator)
-        return result[skip : skip + limit]
+        return [(op, weight, current_load) for op, weight, current_load in rows]
 
 
 operator = CRUDOperator(Operator)
@@ -0,0 +1,98 @@
+from typing import Iterable, List, Tuple
+
+from pydantic import BaseModel
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from models.contact import Contact
+from models.pending_assignment import PendingAssignment
+from models.source import SourceWeight
+
+from .base import IN_CHUNK_SIZE, CRUDBase, chunked
+
+
+class CRUDPendingAssignment(CRUDBase[PendingAssignment, BaseModel, BaseModel]):
+    def enqueue(self, db: Session, contacts: Iterable[Contact]) -> None:
+        """Поставить в очередь активные контакты без оператора (без коммита)"""
+        db.add_all(
+            PendingAssignment(contact_id=contact.id, source_id=contact.source_id)
+            for contact in contacts
+            if contact.operator_id is None and contact.is_active
+        )
+
+    def enqueue_ids(self, db: Session, items: List[Tuple[int, int]]) -> None:
+        """Поставить в очередь пары (contact_id, source_id) одним executemany"""
+        if items:
+            db.execute(
+                insert(PendingAssignment),
+                [
+                    {"contact_id": contact_id, "source_id": source_id}
+                    for contact_id, source_id in items
+                ],
+            )
+
+    def backfill(self, db: Session) -> List[int]:
+        """
+        Поставить в очередь активные контакты без оператора, которых в ней
+        нет (например, созданные до появления очереди), без коммита.
+        Возвращает источники добавленных обращений.
+        """
+        queued = (
+            db.query(PendingAssignment.id)
+            .filter(PendingAssignment.contact_id == Contact.id)
+            .exists()
+        )
+        missing = (
+            db.query(Contact.id, Contact.source_id)
+            .filter(Contact.operator_id.is_(None), Contact.is_active, ~queued)
+            .order_by(Contact.id)
+        )
+        source_ids = sorted({source_id for _, source_id in missing})
+        if source_ids:
+            db.execute(
+                insert(PendingAssignment).from_select(
+                    ["contact_id", "source_id"], missing.statement
+                )
+            )
+        return source_ids
+
+    def get_batch(
+        self, db: Session, source_id: int, limit: int
+    ) -> List[PendingAssignment]:
+        """Первые в очереди источника в порядке поступления"""
+        return (
+            db.query(PendingAssignment)
+            .filter(PendingAssignment.source_id == source_id)
+            .order_by(PendingAssignment.id)
+            .limit(limit)
+            .all()
+        )
+
+    def sources_for_operator(self, db: Session, operator_id: int) -> List[int]:
+        """Источники оператора, в очереди которых есть обращения"""
+        has_pending = (
+            db.query(PendingAssignment.id)
+            .filter(PendingAssignment.source_id == SourceWeight.source_id)
+            .exists()
+        )
+        return [
+            source_id
+            for (source_id,) in db.query(SourceWeight.source_id)
+            .filter(SourceWeight.operator_id == operator_id, has_pending)
+            .distinct()
+            .order_by(SourceWeight.source_id)
+        ]
+
+    def remove_for_contact(self, db: Session, contact_id: int) -> None:
+        db.query(PendingAssignment).filter(
+            PendingAssignment.contact_id == contact_id
+        ).delete(synchronize_session=False)
+
+    def remove_for_contacts(self, db: Session, contact_ids: List[int]) -> None:
+        for chunk in chunked(contact_ids, IN_CHUNK_SIZE):
+            db.query(PendingAssignment).filter(
+                PendingAssignment.contact_id.in_(chunk)
+            ).delete(synchronize_session=False)
+
+
+pending_assignment = CRUDPendingAssignment(PendingAssignment)
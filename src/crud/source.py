@@ -2,15 +2,21 @@ from typing import List, Optional
 
 from sqlalchemy.orm import Session
 
+from database import commit_or_flush
 from models.source import Source, SourceWeight
 from schemas.source import SourceCreate, SourceUpdate, SourceWeightCreate
 
+from . import statements
 from .base import CRUDBase
 
 
 class CRUDSource(CRUDBase[Source, SourceCreate, SourceUpdate]):
+    natural_key = ("bot_token",)
+
     def get_by_bot_token(self, db: Session, bot_token: str) -> Optional[Source]:
-        return db.query(Source).filter(Source.bot_token == bot_token).first()
+        return db.scalars(
+            statements.SOURCE_BY_BOT_TOKEN, {"bot_token": bot_token}
+        ).first()
 
     def add_weight(
         self, db: Session, source_id: int, weight_in: SourceWeightCreate
@@ -21,8 +27,7 @@ class CRUDSource(CRUDBase[Source, SourceCreate, SourceUpdate]):
             weight=weight_in.weight,
         )
         db.add(weight)
-        db.commit()
-        db.refresh(weight)
+        commit_or_flush(db, weight)
         return weight
 
     def get_weights(self, db: Session, source_id: int) -> List[SourceWeight]:
@@ -41,7 +46,7 @@ class CRUDSource(CRUDBase[Source, SourceCreate, SourceUpdate]):
         )
         if weight:
             db.delete(weight)
-            db.commit()
+            commit_or_flush(db)
         return weight
 
 
@@ -0,0 +1,45 @@
+from datetime import datetime
+from typing import Iterable, List, Optional, Set
+
+from pydantic import BaseModel
+from sqlalchemy import delete, insert
+from sqlalchemy.orm import Session
+
+from models.spool_receipt import SpoolReceipt
+
+from .base import CRUDBase
+
+
+class CRUDSpoolReceipt(CRUDBase[SpoolReceipt, BaseModel, BaseModel]):
+    def get_by_tracking_id(
+        self, db: Session, tracking_id: str
+    ) -> Optional[SpoolReceipt]:
+        return (
+            db.query(SpoolReceipt)
+            .filter(SpoolReceipt.tracking_id == tracking_id)
+            .first()
+        )
+
+    def applied(self, db: Session, tracking_ids: Iterable[str]) -> Set[str]:
+        """Какие из tracking_id уже применены"""
+        return {
+            tracking_id
+            for (tracking_id,) in db.query(SpoolReceipt.tracking_id).filter(
+                SpoolReceipt.tracking_id.in_(list(tracking_ids))
+            )
+        }
+
+    def add_many(self, db: Session, receipts: List[dict]) -> None:
+        """Записать квитанции одним executemany (без коммита)"""
+        if receipts:
+            db.execute(insert(SpoolReceipt), receipts)
+
+    def purge(self, db: Session, *, before: datetime) -> int:
+        """Удалить квитанции, созданные раньше before (без коммита)"""
+        result = db.execute(
+            delete(SpoolReceipt).where(SpoolReceipt.created_at < before)
+        )
+        return result.rowcount
+
+
+spool_receipt = CRUDSpoolReceipt(SpoolReceipt)
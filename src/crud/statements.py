@@ -0,0 +1,77 @@
+from sqlalchemy import bindparam, select, update
+
+from models.lead import Lead
+from models.operator import Operator
+from models.source import Source, SourceWeight
+
+# Реестр выражений горячих запросов. Выражения строятся один раз при импорте
+# и выполняются с параметрами: ключ кэша у неизменяемого выражения
+# запоминается, поэтому на вызов не приходится ни сборка Query, ни обход
+# дерева выражения, а SQL берется из кэша компиляции движка.
+
+LEAD_BY_EXTERNAL_ID = (
+    select(Lead).where(Lead.external_id == bindparam("external_id")).limit(1)
+)
+
+SOURCE_BY_BOT_TOKEN = (
+    select(Source).where(Source.bot_token == bindparam("bot_token")).limit(1)
+)
+
+OPERATOR_BY_ID = select(Operator).where(Operator.id == bindparam("operator_id"))
+
+# Резервирование проверяет и вес оператора в источнике: маршрут,
+# устаревший после изменения весов в другом процессе, не проходит
+OPERATOR_TRY_RESERVE = (
+    update(Operator)
+    .where(
+        Operator.id == bindparam("operator_id"),
+        Operator.is_active,
+        Operator.active_load + bindparam("amount") <= Operator.max_load,
+        select(SourceWeight.id)
+        .where(
+            SourceWeight.source_id == bindparam("source_id"),
+            SourceWeight.operator_id == Operator.id,
+        )
+        .exists(),
+    )
+    .values(active_load=Operator.active_load + bindparam("amount"))
+    .execution_options(synchronize_session=False)
+)
+
+SOURCE_ROUTING_STRATEGY = select(Source.routing_strategy).where(
+    Source.id == bindparam("source_id")
+)
+
+# Веса активных операторов источника для таблицы маршрутизации
+SOURCE_ROUTE_ROWS = (
+    select(
+        SourceWeight.operator_id,
+        SourceWeight.weight,
+        Operator.max_load,
+        Operator.active_load,
+    )
+    .join(Operator, Operator.id == SourceWeight.operator_id)
+    .where(
+        SourceWeight.source_id == bindparam("source_id"),
+        SourceWeight.weight > 0,
+        Operator.is_active,
+    )
+    .order_by(SourceWeight.operator_id)
+)
+
+# Кандидаты на распределение: активные операторы с весом и свободным слотом
+SOURCE_CANDIDATES = (
+    select(Operator, SourceWeight.weight, Operator.active_load)
+    .join(SourceWeight, SourceWeight.operator_id == Operator.id)
+    .where(
+        SourceWeight.source_id == bindparam("source_id"),
+        SourceWeight.weight > 0,
+        Operator.is_active,
+        Operator.active_load < Operator.max_load,
+    )
+    .order_by(Operator.id)
+)
+
+SOURCE_CANDIDATES_EXCLUDING = SOURCE_CANDIDATES.where(
+    Operator.id != bindparam("exclude_operator_id")
+)
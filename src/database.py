@@ -1,16 +1,104 @@
-from sqlalchemy import create_engine
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+from sqlalchemy import Engine, create_engine, event, inspect, literal
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+
+from config import Settings, settings
+
+# PRAGMA профиля в порядке применения: busy_timeout первым, чтобы смена
+# journal_mode дождалась блокировок других подключений
+SQLITE_PRAGMAS = (
+    "busy_timeout",
+    "journal_mode",
+    "synchronous",
+    "mmap_size",
+    "cache_size",
+    "temp_store",
+)
+
+
+# Числовые коды, которые SQLite возвращает при чтении PRAGMA
+SQLITE_PRAGMA_NAMES = {
+    "synchronous": {0: "off", 1: "normal", 2: "full", 3: "extra"},
+    "temp_store": {0: "default", 1: "file", 2: "memory"},
+}
+
+
+def sqlite_profile(config: Settings = settings) -> Dict[str, Any]:
+    """Значения PRAGMA профиля SQLite из настроек"""
+    return {
+        "busy_timeout": config.sqlite_busy_timeout_ms,
+        "journal_mode": config.sqlite_journal_mode,
+        "synchronous": config.sqlite_synchronous,
+        "mmap_size": config.sqlite_mmap_size,
+        "cache_size": config.sqlite_cache_size,
+        "temp_store": config.sqlite_temp_store,
+    }
+
+
+def sqlite_read_profile(config: Settings = settings) -> Dict[str, Any]:
+    """
+    Профиль движка чтения: без смены журнала и синхронизации (на read-only
+    подключении они недоступны), запись запрещена через query_only.
+    """
+    profile = sqlite_profile(config)
+    del profile["journal_mode"], profile["synchronous"]
+    profile["query_only"] = 1
+    return profile
+
+
+def apply_sqlite_profile(engine: Engine, profile: Dict[str, Any]) -> None:
+    """Выполнять PRAGMA профиля при каждом новом подключении к SQLite"""
+    if engine.dialect.name != "sqlite":
+        return
+    names = [name for name in SQLITE_PRAGMAS if name in profile]
+    names += [name for name in profile if name not in SQLITE_PRAGMAS]
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name in names:
+            cursor.execute(f"PRAGMA {name}={profile[name]}")
+        cursor.close()
+
+
+def sqlite_pragma_report(engine: Engine) -> Dict[str, Any]:
+    """Действующие значения PRAGMA профиля (для отчета при старте)"""
+    if engine.dialect.name != "sqlite":
+        return {}
+    report = {}
+    with engine.connect() as connection:
+        for name in SQLITE_PRAGMAS:
+            value = connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+            report[name] = SQLITE_PRAGMA_NAMES.get(name, {}).get(value, value)
+    return report
 
-from config import settings
 
 engine = create_engine(
     settings.database_url, connect_args={"check_same_thread": False}, echo=False
 )
+apply_sqlite_profile(engine, sqlite_profile())
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+if settings.read_database_url:
+    read_engine = create_engine(
+        settings.read_database_url,
+        connect_args={"check_same_thread": False},
+        echo=False,
+    )
+    apply_sqlite_profile(read_engine, sqlite_read_profile())
+else:
+    read_engine = engine
+# Сессии только для чтения (GET-запросы, выгрузки)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
 Base = declarative_base()
 
+# Ключ session.info: сессия находится внутри единицы работы
+UNIT_OF_WORK = "unit_of_work"
+
 
 def get_db():
     db = SessionLocal()
@@ -18,3 +106,130 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+class StatementCounter:
+    """Счетчик SQL-выражений, отправленных в БД"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+
+
+@contextmanager
+def count_statements(db: Session) -> Iterator[StatementCounter]:
+    """
+    Подсчет SQL-выражений, выполненных внутри блока.
+
+    Слушатель вешается на движок сессии, поэтому в счетчик попадают и запросы
+    других сессий этого движка, выполненные параллельно.
+    """
+    counter = StatementCounter()
+    bind = db.get_bind()
+    event.listen(bind, "before_cursor_execute", counter)
+    try:
+        yield counter
+    finally:
+        event.remove(bind, "before_cursor_execute", counter)
+
+
+@contextmanager
+def unit_of_work(db: Session) -> Iterator[Session]:
+    """
+    Единица работы: все изменения внутри блока фиксируются одним коммитом.
+
+    CRUD-методы внутри блока только сбрасывают изменения в транзакцию
+    (commit_or_flush). При исключении транзакция откатывается. Вложенный блок
+    присоединяется к внешнему.
+    """
+    if db.info.get(UNIT_OF_WORK):
+        yield db
+        return
+
+    db.info[UNIT_OF_WORK] = True
+    try:
+        yield db
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    finally:
+        db.info.pop(UNIT_OF_WORK, None)
+
+
+def commit_or_flush(db: Session, *refresh) -> None:
+    """
+    Фиксация изменений CRUD-метода.
+
+    Вне единицы работы — commit и refresh переданных объектов. Внутри — только
+    flush: id и значения по умолчанию приходят через RETURNING, коммит
+    выполнит unit_of_work.
+    """
+    if db.info.get(UNIT_OF_WORK):
+        db.flush()
+        return
+    db.commit()
+    for obj in refresh:
+        db.refresh(obj)
+
+
+def explain(db: Session, statement) -> List[str]:
+    """План выполнения запроса (EXPLAIN QUERY PLAN в SQLite, EXPLAIN в остальных)"""
+    bind = db.get_bind()
+    compiled = statement.compile(dialect=bind.dialect)
+    if compiled.positional:
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+    else:
+        params = compiled.params
+    prefix = "EXPLAIN QUERY PLAN" if bind.dialect.name == "sqlite" else "EXPLAIN"
+    rows = db.connection().exec_driver_sql(f"{prefix} {compiled}", params)
+    # В SQLite описание шага — последняя колонка строки плана
+    return [str(row[-1]) for row in rows]
+
+
+def upgrade_schema(engine: Engine) -> List[str]:
+    """
+    Доводит существующие таблицы до текущих моделей.
+
+    create_all создает только отсутствующие таблицы: в уже существующие он не
+    добавляет ни новые колонки, ни индексы. Недостающие колонки добавляются
+    через ALTER TABLE ADD COLUMN со значением по умолчанию модели, индексы —
+    через CREATE INDEX IF NOT EXISTS. Повторный вызов ничего не меняет.
+    Возвращает добавленные колонки в виде "таблица.колонка".
+    """
+    inspector = inspect(engine)
+    existing = set(inspector.get_table_names())
+    added = []
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing:
+                continue
+            present = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in present:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} "
+                ddl += column.type.compile(dialect=engine.dialect)
+                if column.default is not None and column.default.is_scalar:
+                    value = literal(column.default.arg).compile(
+                        dialect=engine.dialect,
+                        compile_kwargs={"literal_binds": True},
+                    )
+                    ddl += f" DEFAULT {value}"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+                connection.exec_driver_sql(ddl)
+                added.append(f"{table.name}.{column.name}")
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+    return added
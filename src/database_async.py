@@ -0,0 +1,79 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from config import settings
+from database import UNIT_OF_WORK, apply_sqlite_profile, sqlite_profile
+
+# Асинхронный драйвер для диалекта из DATABASE_URL
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+
+def async_url(url: str) -> str:
+    """URL с асинхронным драйвером: sqlite → aiosqlite, postgresql → asyncpg"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver for {backend}")
+    return parsed.set(
+        drivername=f"{backend}+{ASYNC_DRIVERS[backend]}"
+    ).render_as_string(hide_password=False)
+
+
+async_engine = create_async_engine(async_url(settings.database_url), echo=False)
+apply_sqlite_profile(async_engine.sync_engine, sqlite_profile())
+# Объекты не истекают после коммита: ленивая загрузка вне greenlet невозможна
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
+
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+@asynccontextmanager
+async def async_unit_of_work(db: AsyncSession) -> AsyncIterator[AsyncSession]:
+    """Единица работы для AsyncSession (см. database.unit_of_work)"""
+    if db.info.get(UNIT_OF_WORK):
+        yield db
+        return
+
+    db.info[UNIT_OF_WORK] = True
+    try:
+        yield db
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        raise
+    finally:
+        db.info.pop(UNIT_OF_WORK, None)
+
+
+class AsyncProxy:
+    """
+    Асинхронный интерфейс CRUD-объекта или сервиса.
+
+    Методы, принимающие сессию первым аргументом, выполняются через
+    AsyncSession.run_sync: тот же код работает с синхронной сессией внутри
+    greenlet, а ввод-вывод идет через асинхронный драйвер, не занимая поток
+    пула. Остальные атрибуты возвращаются как есть.
+    """
+
+    def __init__(self, target):
+        self._target = target
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        async def method(db: AsyncSession, *args, **kwargs):
+            return await db.run_sync(attr, *args, **kwargs)
+
+        method.__name__ = name
+        method.__doc__ = attr.__doc__
+        return method
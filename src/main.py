@@ -1,39 +1,107 @@
+import logging
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 
+from api.dependencies import mark_writes
 from api.routers import contacts, leads, operators, sources
-from database import Base, engine
+from config import settings
+from crud.operator import operator as operator_crud
+from database import (
+    Base,
+    SessionLocal,
+    engine,
+    sqlite_pragma_report,
+    upgrade_schema,
+)
+from services.dispatcher import pending_dispatcher
+from services.spool import contact_spool
+from services.sweeper import idle_sweeper
+
+logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Создаем таблицы при старте
     Base.metadata.create_all(bind=engine)
+    # Новые колонки и индексы в таблицах, созданных прежней версией
+    added = upgrade_schema(engine)
+    if added:
+        logger.info("Схема обновлена: %s", ", ".join(added))
+    if "operators.active_load" in added:
+        # Счетчик нагрузки заполняется по активным контактам
+        with SessionLocal() as db:
+            operator_crud.reconcile_load(db)
+    # Обращения без оператора, созданные до появления очереди ожидания
+    pending_dispatcher.backfill()
+    pragmas = sqlite_pragma_report(engine)
+    if pragmas:
+        logger.info(
+            "SQLite: %s",
+            ", ".join(f"{name}={value}" for name, value in pragmas.items()),
+        )
+    # Журнал приема: восстанавливаем записи, не примененные до остановки
+    if settings.spool_path:
+        contact_spool.configure(settings.spool_path)
+        contact_spool.start()
+    # Фоновое обслуживание: автозакрытие (при IDLE_CLOSE_TTL_SECONDS) и
+    # удаление устаревших ключей идемпотентности
+    idle_sweeper.configure(
+        settings.idle_close_ttl_seconds,
+        settings.idle_sweep_interval_seconds,
+        settings.idle_sweep_batch_size,
+    )
+    idle_sweeper.start()
     yield
     # Очистка при остановке
-    pass
+    if idle_sweeper.running:
+        idle_sweeper.stop()
+    if contact_spool.running:
+        contact_spool.stop()
+    if app.state.async_database:
+        from database_async import async_engine
 
+        await async_engine.dispose()
 
-app = FastAPI(
-    title="CRM Lead Distribution API",
-    description="Мини-CRM для распределения лидов между операторами",
-    version="1.0.0",
-    lifespan=lifespan,
-)
 
-# Подключаем роутеры
-app.include_router(operators.router, prefix="/api/v1", tags=["operators"])
-app.include_router(leads.router, prefix="/api/v1", tags=["leads"])
-app.include_router(sources.router, prefix="/api/v1", tags=["sources"])
-app.include_router(contacts.router, prefix="/api/v1", tags=["contacts"])
+def create_app(async_database: bool = settings.async_database) -> FastAPI:
+    app = FastAPI(
+        title="CRM Lead Distribution API",
+        description="Мини-CRM для распределения лидов между операторами",
+        version="1.0.0",
+        lifespan=lifespan,
+    )
+    app.state.async_database = async_database
+    if settings.read_database_url:
+        # Защита от устаревшего чтения: запись клиента отправляет его GET
+        # в основной движок на READ_YOUR_WRITES_SECONDS
+        app.middleware("http")(mark_writes)
+
+    if async_database:
+        # Импорт по требованию: асинхронный драйвер нужен только в этом режиме.
+        # Роутер подключается первым и перекрывает синхронные маршруты контактов
+        from api.routers import contacts_async
+
+        app.include_router(contacts_async.router, prefix="/api/v1", tags=["contacts"])
+
+    # Подключаем роутеры
+    app.include_router(operators.router, prefix="/api/v1", tags=["operators"])
+    app.include_router(leads.router, prefix="/api/v1", tags=["leads"])
+    app.include_router(sources.router, prefix="/api/v1", tags=["sources"])
+    app.include_router(contacts.router, prefix="/api/v1", tags=["contacts"])
+
+    app.add_api_route("/", root, methods=["GET"])
+    app.add_api_route("/health", health_check, methods=["GET"])
+    return app
 
 
-@app.get("/")
 async def root():
     return {"message": "CRM Lead Distribution API"}
 
 
-@app.get("/health")
 async def health_check():
     return {"status": "healthy"}
+
+
+app = create_app()
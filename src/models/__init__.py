@@ -1,7 +1,20 @@
 from .base import BaseModel
 from .contact import Contact
+from .idempotency_key import IdempotencyKey
 from .lead import Lead
 from .operator import Operator
+from .pending_assignment import PendingAssignment
 from .source import Source, SourceWeight
+from .spool_receipt import SpoolReceipt
 
-__all__ = ["BaseModel", "Operator", "Lead", "Source", "SourceWeight", "Contact"]
+__all__ = [
+    "BaseModel",
+    "Operator",
+    "Lead",
+    "Source",
+    "SourceWeight",
+    "Contact",
+    "PendingAssignment",
+    "SpoolReceipt",
+    "IdempotencyKey",
+]
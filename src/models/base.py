@@ -1,4 +1,4 @@
-from sqlalchemy import Column, DateTime, Integer, func
+from sqlalchemy import Column, DateTime, Integer, func, insert_sentinel
 from sqlalchemy.ext.declarative import declared_attr
 
 from database import Base
@@ -13,6 +13,10 @@ class BaseModel(Base):
         DateTime, default=func.now(), onupdate=func.now(), nullable=False
     )
 
+    # Служебная колонка для сопоставления строк RETURNING массовой вставки с
+    # параметрами (sort_by_parameter_order) пачкой, а не построчно, в SQLite
+    _sentinel = insert_sentinel("_sentinel")
+
     @declared_attr
     def __tablename__(cls):
         return cls.__name__.lower()
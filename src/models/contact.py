@@ -1,4 +1,13 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Text
+from sqlalchemy import (
+    Boolean,
+    Column,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+    text,
+)
 from sqlalchemy.orm import relationship
 
 from .base import BaseModel
@@ -6,6 +15,22 @@ from .base import BaseModel
 
 class Contact(BaseModel):
     __tablename__ = "contacts"
+    __table_args__ = (
+        # Keyset-пагинация обращений лида и оператора
+        Index("ix_contacts_lead_id_id", "lead_id", "id"),
+        Index("ix_contacts_operator_id_id", "operator_id", "id"),
+        # Поиск контактов (CRUDContact.apply_filters)
+        Index("ix_contacts_operator_id_is_active", "operator_id", "is_active"),
+        Index("ix_contacts_source_id_created_at", "source_id", "created_at"),
+        Index("ix_contacts_status_created_at", "status", "created_at"),
+        # Автозакрытие простаивающих (CRUDContact.close_idle)
+        Index(
+            "ix_contacts_active_updated_at",
+            "updated_at",
+            sqlite_where=text("is_active = 1"),
+            postgresql_where=text("is_active"),
+        ),
+    )
 
     lead_id = Column(Integer, ForeignKey("leads.id"), nullable=False)
     source_id = Column(Integer, ForeignKey("sources.id"), nullable=False)
@@ -0,0 +1,15 @@
+from sqlalchemy import Column, ForeignKey, Integer, String, Text
+
+from .base import BaseModel
+
+
+class IdempotencyKey(BaseModel):
+    """Исходный ответ на создание обращения по ключу идемпотентности"""
+
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String, unique=True, nullable=False)
+    contact_id = Column(Integer, ForeignKey("contacts.id"), nullable=False)
+    response = Column(Text, nullable=False)
+    # Отпечаток тела запроса: повтор ключа с другим телом отклоняется
+    fingerprint = Column(String, nullable=True)
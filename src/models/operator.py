@@ -11,9 +11,16 @@ class Operator(BaseModel):
     email = Column(String, unique=True, index=True, nullable=False)
     is_active = Column(Boolean, default=True)
     max_load = Column(Integer, default=10)  # Максимальное количество активных лидов
+    # Денормализованный счетчик активных контактов, ведется в одной транзакции
+    # с созданием и закрытием контактов
+    active_load = Column(Integer, default=0, nullable=False)
 
     # Отношения
     source_weights = relationship(
         "SourceWeight", back_populates="operator", cascade="all, delete-orphan"
     )
     contacts = relationship("Contact", back_populates="operator")
+
+    @property
+    def current_load(self) -> int:
+        return self.active_load or 0
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, ForeignKey, Index, Integer
+
+from .base import BaseModel
+
+
+class PendingAssignment(BaseModel):
+    """Очередь обращений, ожидающих оператора (порядок — по id)"""
+
+    __tablename__ = "pending_assignments"
+    __table_args__ = (Index("ix_pending_assignments_source_id_id", "source_id", "id"),)
+
+    contact_id = Column(Integer, ForeignKey("contacts.id"), unique=True, nullable=False)
+    source_id = Column(Integer, ForeignKey("sources.id"), nullable=False)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey, Integer, String
+from sqlalchemy import Column, ForeignKey, Index, Integer, String
 from sqlalchemy.orm import relationship
 
 from .base import BaseModel
@@ -10,6 +10,8 @@ class Source(BaseModel):
     name = Column(String, nullable=False)
     bot_token = Column(String, unique=True, nullable=False)
     description = Column(String)
+    # Стратегия распределения: random, smooth_wrr, least_loaded, sticky
+    routing_strategy = Column(String, default="random", nullable=False)
 
     # Отношения
     source_weights = relationship(
@@ -23,6 +25,10 @@ class Source(BaseModel):
 
 class SourceWeight(BaseModel):
     __tablename__ = "source_weights"
+    __table_args__ = (
+        # Проверка веса при резервировании (OPERATOR_TRY_RESERVE) и кандидаты
+        Index("ix_source_weights_source_id_operator_id", "source_id", "operator_id"),
+    )
 
     source_id = Column(Integer, ForeignKey("sources.id"), nullable=False)
     operator_id = Column(Integer, ForeignKey("operators.id"), nullable=False)
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, ForeignKey, Integer, String
+
+from .base import BaseModel
+
+
+class SpoolReceipt(BaseModel):
+    """Результат применения обращения из журнала приема (по tracking_id)"""
+
+    __tablename__ = "spool_receipts"
+
+    tracking_id = Column(String, unique=True, nullable=False)
+    contact_id = Column(Integer, ForeignKey("contacts.id"), nullable=True)
+    error = Column(String, nullable=True)
@@ -1,7 +1,10 @@
 from datetime import datetime
-from typing import Optional
+from typing import List, Literal, Optional
 
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+
+# Максимальное число обращений в POST /contacts/batch
+MAX_BATCH_SIZE = 1000
 
 
 class ContactBase(BaseModel):
@@ -17,6 +20,27 @@ class ContactCreate(ContactBase):
     pass
 
 
+class PendingContact(BaseModel):
+    """Обращение в пачке для одного источника"""
+
+    lead_external_id: str
+    message: Optional[str] = None
+    phone: Optional[str] = None
+    email: Optional[str] = None
+    full_name: Optional[str] = None
+
+
+class ContactDistributeBatch(BaseModel):
+    source_id: int
+    contacts: List[PendingContact] = Field(max_length=MAX_BATCH_SIZE)
+
+
+class ContactBatch(BaseModel):
+    """Пачка обращений из разных источников"""
+
+    contacts: List[ContactCreate] = Field(max_length=MAX_BATCH_SIZE)
+
+
 class ContactCreateDB(BaseModel):
     """Схема для создания контакта в БД (используется внутри системы)"""
 
@@ -42,6 +66,75 @@ class ContactResponse(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class ContactFilter(BaseModel):
+    """Условия поиска контактов; created_at в полуинтервале [from, to)"""
+
+    status: Optional[str] = None
+    is_active: Optional[bool] = None
+    source_id: Optional[int] = None
+    operator_id: Optional[int] = None
+    created_from: Optional[datetime] = None
+    created_to: Optional[datetime] = None
+
+
+class ContactQueryPlan(BaseModel):
+    sql: str
+    plan: List[str]
+
+
+class ContactBatchItemResult(BaseModel):
+    """Результат обработки одного обращения пачки: контакт или ошибка"""
+
+    index: int
+    contact: Optional[ContactResponse] = None
+    error: Optional[str] = None
+
+
+class ContactBatchResult(BaseModel):
+    created: int
+    failed: int
+    results: List[ContactBatchItemResult]
+
+
+class ContactBulkClose(BaseModel):
+    """Условия массового закрытия обращений (объединяются по И)"""
+
+    ids: Optional[List[int]] = Field(default=None, max_length=MAX_BATCH_SIZE)
+    operator_id: Optional[int] = None
+    source_id: Optional[int] = None
+
+    @model_validator(mode="after")
+    def check_criteria(self):
+        if self.ids is None and self.operator_id is None and self.source_id is None:
+            raise ValueError("One of ids, operator_id or source_id is required")
+        return self
+
+
+class ContactBulkCloseResult(BaseModel):
+    closed: int
+
+
+class IdempotencyStats(BaseModel):
+    """Счетчики повторов POST /contacts/ с момента запуска"""
+
+    memory_hits: int
+    store_hits: int
+    misses: int
+    cached: int
+
+
+class SpoolAck(BaseModel):
+    tracking_id: str
+    status: str = "pending"
+
+
+class SpoolStatus(BaseModel):
+    tracking_id: str
+    status: Literal["pending", "applied", "failed"]
+    contact_id: Optional[int] = None
+    error: Optional[str] = None
+
+
 class ContactWithDetails(ContactResponse):
     lead_external_id: str
     lead_phone: Optional[str]
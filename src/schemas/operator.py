@@ -32,3 +32,15 @@ class OperatorResponse(OperatorBase):
 
 class OperatorWithLoad(OperatorResponse):
     current_load: int = 0
+
+
+class OperatorLoadDrift(BaseModel):
+    operator_id: int
+    recorded_load: int
+    actual_load: int
+
+
+class OperatorDrainSummary(BaseModel):
+    operator_id: int
+    moved: int
+    unassignable: int
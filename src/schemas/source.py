@@ -1,13 +1,16 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 from pydantic import BaseModel, ConfigDict
 
+RoutingStrategyName = Literal["random", "smooth_wrr", "least_loaded", "sticky"]
+
 
 class SourceBase(BaseModel):
     name: str
     bot_token: str
     description: Optional[str] = None
+    routing_strategy: RoutingStrategyName = "random"
 
 
 class SourceCreate(SourceBase):
@@ -18,6 +21,7 @@ class SourceUpdate(BaseModel):
     name: Optional[str] = None
     bot_token: Optional[str] = None
     description: Optional[str] = None
+    routing_strategy: Optional[RoutingStrategyName] = None
 
 
 class SourceResponse(SourceBase):
@@ -48,3 +52,10 @@ class SourceWeightResponse(SourceWeightBase):
 
 class SourceWithWeights(SourceResponse):
     weights: List[SourceWeightResponse] = []
+
+
+class SourceRoutingStats(BaseModel):
+    source_id: int
+    routing_strategy: str
+    preferred: int
+    fallback: int
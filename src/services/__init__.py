@@ -1,3 +1,15 @@
+from .dispatcher import pending_dispatcher
 from .distribution import distribution_service
+from .export import exporter
+from .idempotency import idempotency_cache
+from .spool import contact_spool
+from .sweeper import idle_sweeper
 
-__all__ = ["distribution_service"]
+__all__ = [
+    "contact_spool",
+    "distribution_service",
+    "exporter",
+    "idempotency_cache",
+    "idle_sweeper",
+    "pending_dispatcher",
+]
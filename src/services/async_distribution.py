@@ -0,0 +1,10 @@
+from database_async import AsyncProxy
+
+from .distribution import distribution_service
+from .idempotency import idempotency_cache
+from .routing_index import routing_index
+
+# Асинхронные версии сервисов для AsyncSession (ASYNC_DATABASE=true)
+async_distribution_service = AsyncProxy(distribution_service)
+async_idempotency_cache = AsyncProxy(idempotency_cache)
+async_routing_index = AsyncProxy(routing_index)
@@ -0,0 +1,103 @@
+import logging
+from typing import Iterable, Tuple
+
+from sqlalchemy.orm import Session
+
+from crud.contact import contact as contact_crud
+from crud.operator import operator as operator_crud
+from crud.pending_assignment import pending_assignment as pending_crud
+from database import SessionLocal
+
+from .distribution import distribution_service
+
+logger = logging.getLogger(__name__)
+
+# Сколько обращений из очереди разбираем за один проход
+DRAIN_BATCH_SIZE = 100
+
+
+class PendingDispatcher:
+    """
+    Разбор очереди обращений, ожидающих оператора.
+
+    Запускается событиями, после которых появляется свободная емкость:
+    закрытие обращения, увеличение max_load, активация оператора, добавление
+    веса. Опроса по таймеру нет.
+    """
+
+    def __init__(
+        self, session_factory=SessionLocal, batch_size: int = DRAIN_BATCH_SIZE
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+
+    def drain_source(
+        self, db: Session, source_id: int, limit: int = DRAIN_BATCH_SIZE
+    ) -> Tuple[int, int]:
+        """
+        Назначить операторов первым в очереди источника.
+
+        Останавливается на первом обращении, для которого нет свободного
+        оператора. Возвращает (назначено, снято с очереди): снятые включают
+        обращения, закрытые или назначенные параллельно.
+        """
+        assigned = removed = 0
+        for item in pending_crud.get_batch(db, source_id, limit):
+            operator_id = distribution_service.reserve_operator(db, source_id)
+            if operator_id is None:
+                break
+            if contact_crud.assign_pending(db, item.contact_id, operator_id):
+                assigned += 1
+            else:
+                # Обращение закрыли или назначили параллельно: слот возвращаем
+                operator_crud.change_load(db, operator_id, -1)
+            pending_crud.remove_for_contact(db, item.contact_id)
+            removed += 1
+        db.commit()
+        return assigned, removed
+
+    def drain(self, source_ids: Iterable[int]) -> int:
+        """
+        Разобрать очереди источников, пока есть емкость.
+
+        Источник разбирается, пока пачка снимает с очереди хоть одно
+        обращение: пачка из устаревших записей не останавливает разбор.
+        """
+        total = 0
+        with self.session_factory() as db:
+            for source_id in source_ids:
+                while True:
+                    assigned, removed = self.drain_source(
+                        db, source_id, self.batch_size
+                    )
+                    total += assigned
+                    if not removed:
+                        break
+        if total:
+            logger.info("Назначено из очереди ожидания: %s", total)
+        return total
+
+    def backfill(self) -> int:
+        """
+        Поставить в очередь ожидающие обращения, которых в ней нет (созданные
+        до появления очереди), и разобрать их. Вызывается при старте.
+        """
+        with self.session_factory() as db:
+            source_ids = pending_crud.backfill(db)
+            db.commit()
+        if source_ids:
+            logger.info("Очередь ожидания дополнена для источников: %s", source_ids)
+        return self.drain(source_ids)
+
+    def on_source_capacity(self, source_id: int) -> int:
+        """У источника появился оператор (например, добавлен вес)"""
+        return self.drain([source_id])
+
+    def on_operator_capacity(self, operator_id: int) -> int:
+        """У оператора освободился слот, вырос лимит или он снова активен"""
+        with self.session_factory() as db:
+            source_ids = pending_crud.sources_for_operator(db, operator_id)
+        return self.drain(source_ids)
+
+
+pending_dispatcher = PendingDispatcher()
@@ -1,72 +1,396 @@
+import logging
 import random
-from typing import Optional
+from collections import defaultdict
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
 
 from sqlalchemy.orm import Session
 
 from crud.contact import contact as contact_crud
 from crud.operator import operator as operator_crud
+from crud.pending_assignment import pending_assignment as pending_crud
+from database import count_statements
 from models.operator import Operator
-from models.source import SourceWeight
+
+from .routing_index import routing_index
+from .strategies import rendezvous_order
+
+try:
+    import numpy as np
+except ImportError:  # NumPy необязателен: без него работает чистый Python
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Сколько раз отбрасываем занятых операторов до перехода к полной выборке
+MAX_REJECTIONS = 4
+# Сколько кандидатов из полной выборки пробуем зарезервировать
+MAX_RESERVATION_RETRIES = 8
+# Раунды перераспределения пачки при конфликтах резервирования
+MAX_BATCH_ROUNDS = 3
+
+T = TypeVar("T")
 
 
 class DistributionService:
     @staticmethod
     def select_operator(
-        db: Session, source_id: int, exclude_operator_id: Optional[int] = None
+        db: Session,
+        source_id: int,
+        exclude_operator_id: Optional[int] = None,
+        routing_key: Optional[str] = None,
     ) -> Optional[Operator]:
         """
         Выбор оператора для источника с учетом весов и нагрузки.
 
         Алгоритм:
-        1. Получаем все веса операторов для источника
-        2. Фильтруем активных операторов, не превысивших лимит
-        3. Выбираем оператора по весам (вероятностный выбор)
+        1. Выбираем оператора стратегией источника (routing_strategy) по
+           кэшированной таблице маршрутизации; routing_key (external_id лида)
+           используется стратегией sticky
+        2. Проверяем его доступность одним запросом по первичному ключу;
+           занятых операторов отбрасываем и повторяем выбор
+        3. После MAX_REJECTIONS отказов одним запросом получаем всех доступных
+           операторов источника и выбираем среди них по весам
+        """
+        return DistributionService._traced(
+            "select_operator",
+            db,
+            source_id,
+            DistributionService._select_operator,
+            exclude_operator_id,
+            routing_key,
+        )
+
+    @staticmethod
+    def reserve_operator(
+        db: Session,
+        source_id: int,
+        exclude_operator_id: Optional[int] = None,
+        routing_key: Optional[str] = None,
+    ) -> Optional[int]:
         """
-        # Получаем веса операторов для источника
-        weights = (
-            db.query(SourceWeight).filter(SourceWeight.source_id == source_id).all()
+        Выбор оператора с атомарным резервированием слота нагрузки.
+
+        Слот занимается условным UPDATE (active_load < max_load) в текущей
+        транзакции; если оператора успели заполнить, пробуем следующего
+        кандидата. Транзакцию фиксирует вызывающий код вместе с контактом.
+        Возвращает id оператора или None.
+        """
+        return DistributionService._traced(
+            "reserve_operator",
+            db,
+            source_id,
+            DistributionService._reserve_operator,
+            exclude_operator_id,
+            routing_key,
         )
 
-        if not weights:
+    @staticmethod
+    def _traced(label: str, db: Session, source_id: int, func, *args):
+        """Вызов выбора с записью числа SQL-выражений в DEBUG-лог"""
+        if not logger.isEnabledFor(logging.DEBUG):
+            return func(db, source_id, *args)
+
+        with count_statements(db) as counter:
+            result = func(db, source_id, *args)
+        logger.debug(
+            "%s source_id=%s result=%s statements=%s",
+            label,
+            source_id,
+            getattr(result, "id", result),
+            counter.count,
+        )
+        return result
+
+    @staticmethod
+    def _select_operator(
+        db: Session,
+        source_id: int,
+        exclude_operator_id: Optional[int],
+        routing_key: Optional[str] = None,
+    ) -> Optional[Operator]:
+        return DistributionService._route(
+            db,
+            source_id,
+            exclude_operator_id,
+            routing_key,
+            lambda operator_id: operator_crud.get_if_available(db, operator_id),
+        )
+
+    @staticmethod
+    def _reserve_operator(
+        db: Session,
+        source_id: int,
+        exclude_operator_id: Optional[int],
+        routing_key: Optional[str] = None,
+    ) -> Optional[int]:
+        return DistributionService._route(
+            db,
+            source_id,
+            exclude_operator_id,
+            routing_key,
+            lambda operator_id: (
+                operator_id
+                if operator_crud.try_reserve(db, operator_id, source_id=source_id)
+                else None
+            ),
+        )
+
+    @staticmethod
+    def _route(
+        db: Session,
+        source_id: int,
+        exclude_operator_id: Optional[int],
+        routing_key: Optional[str],
+        claim: Callable[[int], Optional[T]],
+    ) -> Optional[T]:
+        """
+        Общий цикл выбора оператора.
+
+        Стратегия источника предлагает оператора, claim подтверждает его
+        доступность (проверкой или резервированием слота). Занятых операторов
+        отбрасываем; после MAX_REJECTIONS отказов перебираем актуальный набор
+        кандидатов, прочитанный одним запросом.
+        """
+        route = routing_index.get_route(db, source_id)
+        if route is None:
             return None
 
-        # Подготовка данных для выбора
-        available_operators = []
-        available_weights = []
-
-        for weight in weights:
-            # Получаем оператора с текущей нагрузкой
-            op = operator_crud.get_with_load(db, weight.operator_id)
-
-            # Проверяем условия
-            if (
-                op
-                and op.is_active
-                and op.current_load < op.max_load
-                and op.id != exclude_operator_id
-            ):
-                available_operators.append(op)
-                available_weights.append(weight.weight)
-
-        if not available_operators:
+        sticky = routing_key is not None and route.strategy.name == "sticky"
+        rejected = set()
+        if exclude_operator_id is not None:
+            rejected.add(exclude_operator_id)
+
+        for attempt in range(min(MAX_REJECTIONS, len(route.entries))):
+            entry = route.pick(rejected, routing_key)
+            if entry is None:
+                continue
+            result = claim(entry.operator_id)
+            if result is not None:
+                if sticky:
+                    routing_index.record_sticky(source_id, fallback=attempt > 0)
+                return result
+            route.reject(entry.operator_id)
+            rejected.add(entry.operator_id)
+
+        if sticky:
+            routing_index.record_sticky(source_id, fallback=True)
+
+        candidates = [
+            (op.id, weight)
+            for op, weight, _ in operator_crud.get_candidates_for_source(
+                db, source_id, exclude_operator_id=exclude_operator_id
+            )
+        ]
+        if not route.matches(candidates):
+            # Веса источника изменил другой процесс: таблица устарела
+            routing_index.discard(source_id)
+        if sticky:
+            # Детерминированный порядок по рангу рандеву-хеширования
+            order = iter(rendezvous_order(routing_key, candidates))
+        else:
+            order = DistributionService._weighted_order(candidates)
+        for _, operator_id in zip(range(MAX_RESERVATION_RETRIES), order):
+            result = claim(operator_id)
+            if result is not None:
+                return result
+        return None
+
+    @staticmethod
+    def _weighted_order(candidates: List[Tuple[int, int]]) -> Iterator[int]:
+        """Кандидаты в порядке последовательных взвешенных розыгрышей"""
+        candidates = list(candidates)
+        while candidates:
+            operator_id = DistributionService.weighted_choice(candidates)
+            if operator_id is None:
+                return
+            yield operator_id
+            candidates = [c for c in candidates if c[0] != operator_id]
+
+    @staticmethod
+    def weighted_choice(candidates: Sequence[Tuple[T, int]]) -> Optional[T]:
+        """Вероятностный выбор: вероятность = вес / сумма весов"""
+        if not candidates:
             return None
 
-        # Вероятностный выбор оператора на основе весов
-        total_weight = sum(available_weights)
-        if total_weight == 0:
+        total_weight = sum(weight for _, weight in candidates)
+        if total_weight <= 0:
             return None
 
-        # Выбор случайного оператора с учетом весов
         rand = random.uniform(0, total_weight)
         cumulative = 0
 
-        for i, weight in enumerate(available_weights):
+        for item, weight in candidates:
             cumulative += weight
             if rand <= cumulative:
-                return available_operators[i]
+                return item
 
         # На всякий случай возвращаем первого
-        return available_operators[0]
+        return candidates[0][0]
+
+    @staticmethod
+    def reserve_batch(
+        db: Session,
+        source_id: int,
+        count: int,
+        exclude_operator_id: Optional[int] = None,
+    ) -> List[Optional[int]]:
+        """
+        Распределение пачки контактов источника за один проход.
+
+        Кандидаты читаются одним запросом, количество контактов на оператора
+        разыгрывается по весам с учетом оставшейся емкости, а слоты занимаются
+        одним условным UPDATE на оператора. Если емкость оператора успели
+        занять параллельно, его доля перераспределяется на следующем раунде.
+        Возвращает id оператора (или None) для каждого из count контактов в
+        случайном порядке; транзакцию фиксирует вызывающий код.
+        """
+        assigned: List[Optional[int]] = []
+        remaining = count
+        for _ in range(MAX_BATCH_ROUNDS):
+            if remaining <= 0:
+                break
+            candidates = operator_crud.get_candidates_for_source(
+                db, source_id, exclude_operator_id=exclude_operator_id
+            )
+            if not candidates:
+                break
+
+            allocation = DistributionService.allocate(
+                [weight for _, weight, _ in candidates],
+                [op.max_load - load for op, _, load in candidates],
+                remaining,
+            )
+            conflicts = False
+            for (op, _, _), amount in zip(candidates, allocation):
+                if not amount:
+                    continue
+                if operator_crud.try_reserve(db, op.id, amount, source_id=source_id):
+                    assigned.extend([op.id] * amount)
+                    remaining -= amount
+                else:
+                    conflicts = True
+            if not conflicts:
+                # Все, что помещалось, распределено
+                break
+
+        assigned.extend([None] * remaining)
+        random.shuffle(assigned)
+        return assigned
+
+    @staticmethod
+    def reserve_for_keys(
+        db: Session, source_id: int, routing_keys: Sequence[Optional[str]]
+    ) -> List[Optional[int]]:
+        """
+        Резервирование операторов для пачки контактов источника.
+
+        Для стратегии sticky каждый контакт маршрутизируется по своему ключу,
+        для остальных — за один проход reserve_batch. Возвращает id оператора
+        (или None) для каждого ключа; транзакцию фиксирует вызывающий код.
+        """
+        route = routing_index.get_route(db, source_id)
+        if route is not None and route.strategy.name == "sticky":
+            return [
+                DistributionService.reserve_operator(db, source_id, routing_key=key)
+                for key in routing_keys
+            ]
+        return DistributionService.reserve_batch(db, source_id, len(routing_keys))
+
+    @staticmethod
+    def drain_operator(db: Session, operator_id: int) -> Dict[str, int]:
+        """Перераспределить активные обращения оператора (см. _drain_operator)"""
+        summary = DistributionService._drain_operator(db, operator_id)
+        db.commit()
+        # Нагрузки в состоянии стратегий изменились пакетно
+        routing_index.invalidate()
+        return summary
+
+    @staticmethod
+    def _drain_operator(db: Session, operator_id: int) -> Dict[str, int]:
+        """
+        Перераспределить все активные обращения оператора (без коммита).
+
+        Обращения группируются по источнику, для каждого источника новые
+        операторы выбираются пакетно (reserve_batch без выводимого оператора),
+        а назначение выполняется UPDATE ... WHERE id IN (...) на каждого нового
+        оператора. Обращения, которым не нашлось оператора, остаются без
+        оператора и попадают в очередь ожидания.
+        """
+        by_source: Dict[int, List[int]] = defaultdict(list)
+        for contact_id, source_id in contact_crud.get_active_ids_by_operator_id(
+            db, operator_id
+        ):
+            by_source[source_id].append(contact_id)
+
+        moved = 0
+        unassignable: List[Tuple[int, int]] = []
+        for source_id, contact_ids in by_source.items():
+            targets = DistributionService.reserve_batch(
+                db, source_id, len(contact_ids), exclude_operator_id=operator_id
+            )
+            by_target: Dict[Optional[int], List[int]] = defaultdict(list)
+            for contact_id, target_id in zip(contact_ids, targets):
+                by_target[target_id].append(contact_id)
+            for target_id, ids in by_target.items():
+                contact_crud.reassign(db, ids, target_id)
+                if target_id is None:
+                    unassignable.extend((contact_id, source_id) for contact_id in ids)
+                else:
+                    moved += len(ids)
+
+        total = moved + len(unassignable)
+        if total:
+            operator_crud.change_load(db, operator_id, -total)
+        pending_crud.enqueue_ids(db, unassignable)
+        return {"moved": moved, "unassignable": len(unassignable)}
+
+    @staticmethod
+    def remove_operator(db: Session, operator_id: int) -> Dict[str, int]:
+        """
+        Удаление оператора с перераспределением его обращений.
+
+        Перераспределение и удаление выполняются одной транзакцией: веса
+        удаляются одним DELETE, в истории обращений ссылка на оператора
+        обнуляется одним UPDATE.
+        """
+        summary = DistributionService._drain_operator(db, operator_id)
+        operator_crud.remove_set_based(db, operator_id)
+        routing_index.invalidate()
+        return summary
+
+    @staticmethod
+    def allocate(
+        weights: Sequence[int], capacities: Sequence[int], count: int
+    ) -> List[int]:
+        """
+        Сколько из count контактов получит каждый кандидат.
+
+        Мультиномиальный розыгрыш по весам среди кандидатов со свободной
+        емкостью; превышение емкости разыгрывается заново среди оставшихся.
+        С NumPy розыгрыш векторизован, без него используется random.choices.
+        """
+        result = [0] * len(weights)
+        free = [max(capacity, 0) for capacity in capacities]
+        remaining = min(count, sum(free))
+        while remaining > 0:
+            open_slots = [
+                i for i, weight in enumerate(weights) if free[i] > 0 and weight > 0
+            ]
+            if not open_slots:
+                break
+            draws = _multinomial(remaining, [weights[i] for i in open_slots])
+            for i, drawn in zip(open_slots, draws):
+                taken = min(drawn, free[i])
+                result[i] += taken
+                free[i] -= taken
+                remaining -= taken
+        return result
+
+    @staticmethod
+    def release_slot(operator_id: Optional[int]) -> None:
+        """Сообщить стратегиям маршрутизации об освобождении слота оператора"""
+        if operator_id is not None:
+            routing_index.release(operator_id)
 
     @staticmethod
     def get_operator_load(db: Session, operator_id: int) -> int:
@@ -74,4 +398,17 @@ class DistributionService:
         return contact_crud.count_active_by_operator_id(db, operator_id)
 
 
+def _multinomial(count: int, weights: Sequence[int]) -> List[int]:
+    """Разыграть count исходов с вероятностями, пропорциональными весам"""
+    if np is not None:
+        probabilities = np.asarray(weights, dtype=float)
+        probabilities /= probabilities.sum()
+        return np.random.multinomial(count, probabilities).tolist()
+
+    draws = [0] * len(weights)
+    for i in random.choices(range(len(weights)), weights=weights, k=count):
+        draws[i] += 1
+    return draws
+
+
 distribution_service = DistributionService()
@@ -0,0 +1,131 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Callable, Iterator, List, Literal, Optional
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Query, Session
+
+from database import ReadSessionLocal
+
+# Строк на одну выборку из курсора и на один отправляемый фрагмент
+EXPORT_BATCH_SIZE = 1000
+
+ExportFormat = Literal["ndjson", "csv"]
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class Exporter:
+    """
+    Потоковая выгрузка строк запроса в NDJSON или CSV.
+
+    Запрос читается через yield_per порциями по EXPORT_BATCH_SIZE, каждая
+    порция сразу уходит клиенту, поэтому память не зависит от размера
+    таблицы. Сессия открывается на время выгрузки: поток продолжается после
+    выхода из обработчика запроса.
+    """
+
+    def __init__(self, session_factory=ReadSessionLocal):
+        self.session_factory = session_factory
+
+    def response(
+        self,
+        build_query: Callable[[Session], Query],
+        fmt: ExportFormat,
+        name: str,
+        *,
+        id_column=None,
+        ids: Optional[List[int]] = None,
+    ) -> StreamingResponse:
+        """
+        Ответ с потоковой выгрузкой в файл name.<fmt>.
+
+        С ids выгружаются только строки с этими id (см. page_ids).
+        """
+        return StreamingResponse(
+            self.stream(build_query, fmt, id_column=id_column, ids=ids),
+            media_type=MEDIA_TYPES[fmt],
+            headers={"Content-Disposition": f'attachment; filename="{name}.{fmt}"'},
+        )
+
+    def page_ids(
+        self, build_query: Callable[[Session], Query], id_column, limit: int
+    ) -> List[int]:
+        """
+        id первых limit строк выгрузки одним keyset-запросом.
+
+        Выгрузка страницы затем читает строки по этим id, поэтому
+        отфильтрованный запрос не просматривается второй раз, а курсор
+        продолжения известен до начала потока.
+        """
+        with self.session_factory() as db:
+            query = build_query(db).with_entities(id_column).limit(limit)
+            return [row[0] for row in query]
+
+    def stream(
+        self,
+        build_query: Callable[[Session], Query],
+        fmt: ExportFormat,
+        *,
+        id_column=None,
+        ids: Optional[List[int]] = None,
+    ) -> Iterator[str]:
+        with self.session_factory() as db:
+            query = build_query(db)
+            columns = [column["name"] for column in query.column_descriptions]
+            render = self._csv_writer(columns) if fmt == "csv" else self._ndjson
+
+            if fmt == "csv":
+                yield render(columns)
+            chunk: List[str] = []
+            for row in self._rows(query, id_column, ids):
+                chunk.append(render(row))
+                if len(chunk) >= EXPORT_BATCH_SIZE:
+                    yield "".join(chunk)
+                    chunk = []
+            if chunk:
+                yield "".join(chunk)
+
+    @staticmethod
+    def _rows(query: Query, id_column, ids: Optional[List[int]]) -> Iterator:
+        if ids is None:
+            yield from query.yield_per(EXPORT_BATCH_SIZE)
+            return
+        # По EXPORT_BATCH_SIZE id на запрос: в пределах лимита параметров SQLite
+        for start in range(0, len(ids), EXPORT_BATCH_SIZE):
+            batch = ids[start : start + EXPORT_BATCH_SIZE]
+            yield from query.filter(id_column.in_(batch))
+
+    @staticmethod
+    def _ndjson(row) -> str:
+        return (
+            json.dumps(dict(row._mapping), default=_json_default, ensure_ascii=False)
+            + "\n"
+        )
+
+    @staticmethod
+    def _csv_writer(columns: List[str]) -> Callable:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        def render(row) -> str:
+            writer.writerow(
+                value.isoformat() if isinstance(value, datetime) else value
+                for value in row
+            )
+            line = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            return line
+
+        return render
+
+
+exporter = Exporter()
@@ -0,0 +1,216 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from datetime import UTC, datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from config import settings
+from crud.idempotency_key import idempotency_key as idempotency_key_crud
+from schemas.contact import ContactCreate, ContactResponse, IdempotencyStats
+
+# Префиксы ключей: заданный клиентом и хеш содержимого обращения
+EXPLICIT_PREFIX = "key:"
+CONTENT_PREFIX = "hash:"
+
+
+def content_key(contact_in: ContactCreate) -> str:
+    """Ключ дедупликации по (lead_external_id, source_id, message)"""
+    payload = json.dumps(
+        [contact_in.lead_external_id, contact_in.source_id, contact_in.message],
+        ensure_ascii=False,
+    )
+    return CONTENT_PREFIX + hashlib.sha256(payload.encode()).hexdigest()
+
+
+def request_fingerprint(contact_in: ContactCreate) -> str:
+    """Отпечаток всего тела запроса: повтор ключа должен прийти с тем же телом"""
+    return hashlib.sha256(contact_in.model_dump_json().encode()).hexdigest()
+
+
+class IdempotencyKeyMismatch(ValueError):
+    """Idempotency-Key повторно использован с другим телом запроса"""
+
+
+def _utcnow() -> datetime:
+    # Как func.now() в SQLite: UTC без часового пояса
+    return datetime.now(UTC).replace(tzinfo=None)
+
+
+class IdempotencyCache:
+    """
+    Исходные ответы POST /contacts/ по ключам идемпотентности.
+
+    Ключи хранятся в таблице idempotency_keys (в транзакции создания
+    обращения) и в ограниченном LRU процесса. Ключ Idempotency-Key действует
+    key_ttl_seconds (None — бессрочно), ключ по содержимому —
+    dedupe_window_seconds (None — выключен). Устаревшие записи удаляет purge.
+    """
+
+    def __init__(
+        self,
+        capacity: int = settings.idempotency_cache_size,
+        dedupe_window_seconds: Optional[int] = settings.dedupe_window_seconds,
+        key_ttl_seconds: Optional[int] = settings.idempotency_key_ttl_seconds,
+    ):
+        self.capacity = capacity
+        self.dedupe_window_seconds = dedupe_window_seconds
+        self.key_ttl_seconds = key_ttl_seconds
+        # Ключ -> (ответ, время создания, отпечаток запроса)
+        self._entries: OrderedDict[
+            str, Tuple[ContactResponse, datetime, Optional[str]]
+        ] = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+
+    def keys_for(
+        self, contact_in: ContactCreate, idempotency_key: Optional[str]
+    ) -> List[str]:
+        """Ключи запроса в порядке приоритета"""
+        keys = []
+        if idempotency_key:
+            keys.append(EXPLICIT_PREFIX + idempotency_key)
+        if self.dedupe_window_seconds:
+            keys.append(content_key(contact_in))
+        return keys
+
+    def lookup(
+        self, db: Session, keys: List[str], fingerprint: Optional[str] = None
+    ) -> Optional[ContactResponse]:
+        """
+        Исходный ответ по любому из ключей: из LRU, затем из таблицы.
+
+        Если Idempotency-Key сохранен с другим отпечатком запроса, вызывает
+        IdempotencyKeyMismatch вместо повтора чужого ответа.
+        """
+        if not keys:
+            return None
+        now = _utcnow()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and self._fresh(key, entry[1], now):
+                    self._check(key, entry[2], fingerprint)
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[0]
+
+        rows = idempotency_key_crud.get_many(db, keys)
+        for key in keys:
+            row = rows.get(key)
+            if row is not None and self._fresh(key, row.created_at, now):
+                self._check(key, row.fingerprint, fingerprint)
+                response = ContactResponse.model_validate_json(row.response)
+                with self._lock:
+                    self.store_hits += 1
+                    self._put(key, response, row.created_at, row.fingerprint)
+                return response
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def record(
+        self,
+        db: Session,
+        keys: List[str],
+        response: ContactResponse,
+        fingerprint: Optional[str] = None,
+    ) -> None:
+        """Сохранить ответ по ключам в транзакции запроса (без коммита)"""
+        now = _utcnow()
+        for key in keys:
+            expire_before = None
+            if key.startswith(CONTENT_PREFIX):
+                # Ключ по содержимому после окна занимается новым ответом
+                expire_before = now - timedelta(seconds=self.dedupe_window_seconds)
+            idempotency_key_crud.add(
+                db,
+                key=key,
+                contact_id=response.id,
+                response=response.model_dump_json(),
+                fingerprint=fingerprint,
+                expire_before=expire_before,
+            )
+
+    def remember(
+        self,
+        keys: List[str],
+        response: ContactResponse,
+        fingerprint: Optional[str] = None,
+    ) -> None:
+        """Положить ответ в LRU после фиксации транзакции"""
+        now = _utcnow()
+        with self._lock:
+            for key in keys:
+                self._put(key, response, now, fingerprint)
+
+    def purge(self, db: Session, now: Optional[datetime] = None) -> int:
+        """Удалить устаревшие ключи из таблицы; возвращает их число"""
+        now = now or _utcnow()
+        removed = 0
+        if self.key_ttl_seconds is not None:
+            removed += idempotency_key_crud.purge(
+                db,
+                prefix=EXPLICIT_PREFIX,
+                before=now - timedelta(seconds=self.key_ttl_seconds),
+            )
+        # Без окна дедупликации ключи по содержимому не нужны вовсе
+        removed += idempotency_key_crud.purge(
+            db,
+            prefix=CONTENT_PREFIX,
+            before=now - timedelta(seconds=self.dedupe_window_seconds or 0),
+        )
+        db.commit()
+        return removed
+
+    def stats(self) -> IdempotencyStats:
+        with self._lock:
+            return IdempotencyStats(
+                memory_hits=self.memory_hits,
+                store_hits=self.store_hits,
+                misses=self.misses,
+                cached=len(self._entries),
+            )
+
+    def clear(self) -> None:
+        """Очистить LRU и счетчики (таблица не меняется)"""
+        with self._lock:
+            self._entries.clear()
+            self.memory_hits = self.store_hits = self.misses = 0
+
+    def _fresh(self, key: str, created_at: datetime, now: datetime) -> bool:
+        if not key.startswith(CONTENT_PREFIX):
+            if self.key_ttl_seconds is None:
+                return True
+            return created_at >= now - timedelta(seconds=self.key_ttl_seconds)
+        if not self.dedupe_window_seconds:
+            return False
+        return created_at >= now - timedelta(seconds=self.dedupe_window_seconds)
+
+    @staticmethod
+    def _check(key: str, stored: Optional[str], fingerprint: Optional[str]) -> None:
+        # Ключ по содержимому совпадает по построению; у старых записей
+        # отпечатка нет
+        if not key.startswith(EXPLICIT_PREFIX) or stored is None:
+            return
+        if fingerprint is not None and stored != fingerprint:
+            raise IdempotencyKeyMismatch(key[len(EXPLICIT_PREFIX) :])
+
+    def _put(
+        self,
+        key: str,
+        response: ContactResponse,
+        created_at: datetime,
+        fingerprint: Optional[str] = None,
+    ) -> None:
+        self._entries[key] = (response, created_at, fingerprint)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+
+idempotency_cache = IdempotencyCache()
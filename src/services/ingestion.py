@@ -0,0 +1,100 @@
+from collections import defaultdict
+from typing import List, Sequence, Union
+
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+
+from crud.contact import contact as contact_crud
+from crud.lead import lead as lead_crud
+from schemas.contact import (
+    ContactBatchItemResult,
+    ContactCreate,
+    ContactCreateDB,
+    ContactResponse,
+    PendingContact,
+)
+from schemas.lead import LeadCreate
+
+from .distribution import distribution_service
+from .routing_index import routing_index
+
+
+def lead_defaults(contact_in: Union[ContactCreate, PendingContact]) -> dict:
+    """Контактные данные лида из обращения"""
+    defaults = {}
+    if contact_in.phone:
+        defaults["phone"] = contact_in.phone
+    if contact_in.email:
+        defaults["email"] = contact_in.email
+    if contact_in.full_name:
+        defaults["full_name"] = contact_in.full_name
+    return defaults
+
+
+def ingest_batch(
+    db: Session, items: Sequence[ContactCreate]
+) -> List[ContactBatchItemResult]:
+    """
+    Создание пачки обращений из разных источников без фиксации транзакции.
+
+    Каждый источник проверяется один раз, лиды создаются одним upsert,
+    операторы резервируются пачкой на источник с учетом емкости, контакты
+    вставляются одним flush. Ошибка отдельного обращения попадает в его
+    результат и не мешает остальным.
+    """
+    results = [ContactBatchItemResult(index=i) for i in range(len(items))]
+
+    # 1. Каждый источник проверяем один раз
+    known_sources = {
+        source_id: routing_index.source_exists(db, source_id)
+        for source_id in {item.source_id for item in items}
+    }
+
+    # 2. Отбираем обращения; данные лида берем из первого обращения
+    accepted = []
+    defaults_by_external_id = {}
+    for i, item in enumerate(items):
+        if not known_sources[item.source_id]:
+            results[i].error = "Source not found"
+            continue
+        if item.lead_external_id not in defaults_by_external_id:
+            defaults = lead_defaults(item)
+            try:
+                LeadCreate(external_id=item.lead_external_id, **defaults)
+            except ValidationError as exc:
+                results[i].error = f"Invalid lead data: {exc.errors()[0]['msg']}"
+                continue
+            defaults_by_external_id[item.lead_external_id] = defaults
+        accepted.append(i)
+    if not accepted:
+        return results
+
+    leads = lead_crud.get_or_create_many(db, defaults_by_external_id)
+
+    # 3. Резервируем операторов пачкой на каждый источник
+    indices_by_source = defaultdict(list)
+    for i in accepted:
+        indices_by_source[items[i].source_id].append(i)
+    operator_ids = {}
+    for source_id, indices in indices_by_source.items():
+        reserved = distribution_service.reserve_for_keys(
+            db, source_id, [items[i].lead_external_id for i in indices]
+        )
+        operator_ids.update(zip(indices, reserved))
+
+    # 4. Вставляем все контакты одним flush
+    contacts = contact_crud.add_batch(
+        db,
+        objs_in=[
+            ContactCreateDB(
+                lead_id=leads[items[i].lead_external_id].id,
+                source_id=items[i].source_id,
+                operator_id=operator_ids[i],
+                message=items[i].message,
+            )
+            for i in accepted
+        ],
+    )
+    for i, contact in zip(accepted, contacts):
+        results[i].contact = ContactResponse.model_validate(contact)
+    return results
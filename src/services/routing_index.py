@@ -0,0 +1,240 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from crud import statements
+from models.operator import Operator
+from models.source import Source, SourceWeight
+
+from .strategies import RouteEntry, build_strategy
+
+# Изменения этих полей оператора влияют на таблицы маршрутизации
+ROUTING_OPERATOR_FIELDS = ("is_active", "max_load")
+# Таблицы, любые массовые изменения которых влияют на маршрутизацию
+ROUTING_TABLES = (Source.__tablename__, SourceWeight.__tablename__)
+# Максимальный возраст таблицы маршрутизации
+ROUTE_TTL_SECONDS = 60
+# Максимальное число таблиц в кэше (вытесняются давно не использованные)
+MAX_ROUTES = 1024
+
+
+class SourceRoute:
+    """Таблица маршрутизации источника: активные операторы и состояние стратегии"""
+
+    def __init__(
+        self,
+        version: int,
+        entries: List[RouteEntry],
+        strategy_name: Optional[str] = None,
+        loads: Optional[Dict[int, int]] = None,
+        source_exists: bool = True,
+    ):
+        self.version = version
+        self.source_exists = source_exists
+        self.built_at = time.monotonic()
+        self.entries = entries
+        self.operator_ids = {entry.operator_id for entry in entries}
+        self.strategy = build_strategy(strategy_name, entries, loads or {})
+        self._lock = threading.Lock()
+
+    def pick(
+        self, rejected: Set[int], key: Optional[str] = None
+    ) -> Optional[RouteEntry]:
+        with self._lock:
+            return self.strategy.pick(rejected, key)
+
+    def reject(self, operator_id: int) -> None:
+        with self._lock:
+            self.strategy.reject(operator_id)
+
+    def release(self, operator_id: int) -> None:
+        with self._lock:
+            self.strategy.release(operator_id)
+
+    def matches(self, candidates: List[Tuple[int, int]]) -> bool:
+        """Согласована ли таблица с актуальными парами (operator_id, weight)"""
+        weights = {entry.operator_id: entry.weight for entry in self.entries}
+        return all(weights.get(op_id) == weight for op_id, weight in candidates)
+
+
+class RoutingIndex:
+    """
+    Процессный кэш таблиц маршрутизации по source_id.
+
+    Таблица строится лениво и считается устаревшей, если ее версия не совпадает
+    с текущей. Версия увеличивается после коммита транзакции, изменившей веса,
+    источники или поля is_active/max_load операторов. Нагрузка в состоянии
+    стратегий — приближение (ее меняют и другие процессы), поэтому таблица
+    также перестраивается не реже раза в ROUTE_TTL_SECONDS.
+
+    Кэш ограничен capacity таблицами (LRU). Отсутствующие источники не
+    кэшируются: иначе запросы к несуществующим source_id раздували бы кэш, а
+    источник, созданный другим процессом, до истечения TTL считался бы
+    отсутствующим.
+    """
+
+    def __init__(self, capacity: int = MAX_ROUTES):
+        self.capacity = capacity
+        self._version = 0
+        self._routes: "OrderedDict[int, SourceRoute]" = OrderedDict()
+        self._sticky_stats: Dict[int, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._version += 1
+
+    def discard(self, source_id: int) -> None:
+        """
+        Убрать таблицу источника из кэша: следующий выбор ее перестроит.
+        Нужно, когда устаревание замечено по данным БД (веса изменил другой
+        процесс, а версия кэша процессная).
+        """
+        with self._lock:
+            self._routes.pop(source_id, None)
+
+    def get_route(self, db: Session, source_id: int) -> Optional[SourceRoute]:
+        """Таблица источника или None, если назначать некого"""
+        route = self._fresh_route(db, source_id)
+        return route if route.entries else None
+
+    def source_exists(self, db: Session, source_id: int) -> bool:
+        """
+        Проверка существования источника по кэшу таблиц маршрутизации.
+
+        Таблица все равно нужна для выбора оператора, поэтому проверка не
+        добавляет запросов к БД.
+        """
+        return self._fresh_route(db, source_id).source_exists
+
+    def _fresh_route(self, db: Session, source_id: int) -> SourceRoute:
+        with self._lock:
+            route = self._routes.get(source_id)
+            if route is not None:
+                self._routes.move_to_end(source_id)
+        if (
+            route is None
+            or route.version != self._version
+            or time.monotonic() - route.built_at > ROUTE_TTL_SECONDS
+        ):
+            route = self._build(db, source_id)
+            with self._lock:
+                if route.source_exists:
+                    self._routes[source_id] = route
+                    self._routes.move_to_end(source_id)
+                    while len(self._routes) > self.capacity:
+                        self._routes.popitem(last=False)
+                else:
+                    self._routes.pop(source_id, None)
+        return route
+
+    @property
+    def cached(self) -> int:
+        """Число таблиц в кэше"""
+        return len(self._routes)
+
+    def release(self, operator_id: int) -> None:
+        """Сообщить стратегиям, что у оператора освободился слот"""
+        with self._lock:
+            routes = list(self._routes.values())
+        for route in routes:
+            if operator_id in route.operator_ids:
+                route.release(operator_id)
+
+    def record_sticky(self, source_id: int, fallback: bool) -> None:
+        """Учесть назначение по ключу: предпочтительному оператору или нет"""
+        with self._lock:
+            stats = self._sticky_stats.setdefault(
+                source_id, {"preferred": 0, "fallback": 0}
+            )
+            stats["fallback" if fallback else "preferred"] += 1
+
+    def sticky_stats(self, source_id: int) -> Dict[str, int]:
+        """Счетчики назначений по ключу для источника с момента запуска"""
+        with self._lock:
+            return dict(
+                self._sticky_stats.get(source_id, {"preferred": 0, "fallback": 0})
+            )
+
+    def _build(self, db: Session, source_id: int) -> SourceRoute:
+        # Версию фиксируем до чтения: инвалидация во время построения
+        # приведет к повторной сборке при следующем обращении
+        version = self._version
+        params = {"source_id": source_id}
+        strategy_name = db.scalar(statements.SOURCE_ROUTING_STRATEGY, params)
+        rows = db.execute(statements.SOURCE_ROUTE_ROWS, params).all()
+        entries = [
+            RouteEntry(operator_id=operator_id, weight=weight, max_load=max_load)
+            for operator_id, weight, max_load, _ in rows
+        ]
+        loads = {operator_id: load for operator_id, _, _, load in rows}
+        return SourceRoute(
+            version,
+            entries,
+            strategy_name,
+            loads,
+            source_exists=strategy_name is not None,
+        )
+
+
+routing_index = RoutingIndex()
+
+
+def _affects_routing(obj) -> bool:
+    if isinstance(obj, (Source, SourceWeight)):
+        return True
+    if isinstance(obj, Operator):
+        state = inspect(obj)
+        return any(
+            state.attrs[field].history.has_changes()
+            for field in ROUTING_OPERATOR_FIELDS
+        )
+    return False
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_routing_changes(session, flush_context):
+    if session.info.get("routing_dirty"):
+        return
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if _affects_routing(obj):
+            session.info["routing_dirty"] = True
+            return
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_bulk_routing_changes(orm_execute_state):
+    # Массовые INSERT/UPDATE/DELETE минуют after_flush. UPDATE операторов
+    # не учитываем: так меняется только нагрузка (резервирование слотов)
+    if not (
+        orm_execute_state.is_insert
+        or orm_execute_state.is_update
+        or orm_execute_state.is_delete
+    ):
+        return
+    table = getattr(orm_execute_state.statement, "table", None)
+    if table is None:
+        return
+    if table.name in ROUTING_TABLES or (
+        table.name == Operator.__tablename__ and not orm_execute_state.is_update
+    ):
+        orm_execute_state.session.info["routing_dirty"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    if session.info.pop("routing_dirty", False):
+        routing_index.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop("routing_dirty", None)
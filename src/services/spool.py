@@ -0,0 +1,468 @@
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import UTC, datetime, timedelta
+from itertools import islice
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from config import settings
+from crud.spool_receipt import spool_receipt as spool_receipt_crud
+from database import SessionLocal, unit_of_work
+from schemas.contact import ContactCreate, SpoolStatus
+
+from .ingestion import ingest_batch
+
+try:
+    import fcntl
+except ImportError:  # Без fcntl (Windows) журнал не блокируется: один процесс
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Сколько записей журнала применяем одной транзакцией
+APPLY_BATCH_SIZE = 200
+# Как часто applier проверяет журнал без новых записей, сек
+APPLY_INTERVAL_SECONDS = 0.5
+# Сколько раз запись может упасть при доступной БД до переноса в .dead
+MAX_APPLY_ATTEMPTS = 5
+# Сколько журналов процессов пробуем занять: spool_path, spool_path.1, ...
+MAX_JOURNALS = 64
+# С какого размера журнал сжимается до непримененных записей, байт
+COMPACT_MIN_BYTES = 4 * 1024 * 1024
+
+
+class IngestionSpool:
+    """
+    Журнал приема обращений: подтверждение без ожидания блокировок БД.
+
+    submit дописывает обращение в локальный append-only файл и возвращает
+    tracking_id после fsync. fsync группируется: один вызов покрывает все
+    записи, дописанные к этому моменту параллельными запросами. Фоновый
+    applier переносит записи в БД транзакциями по APPLY_BATCH_SIZE и пишет
+    квитанции (spool_receipts) в той же транзакции, поэтому повторное
+    применение после сбоя ничего не дублирует. Когда все записи применены,
+    журнал обнуляется, а под постоянной нагрузкой сжимается: при росте
+    вдвое с прошлого сжатия (и не меньше COMPACT_MIN_BYTES) он атомарно
+    заменяется файлом только с непримененными записями. При старте
+    непримененные записи восстанавливаются.
+
+    Каждый процесс пишет в свой журнал, занятый блокировкой файла .lock:
+    первый свободный из spool_path, spool_path.1, ... Поэтому обнуление не
+    затрагивает записи других процессов. Номер журнала входит в tracking_id,
+    и статус записи, еще не примененной другим процессом, читается из его
+    журнала. Если пачка не применяется, записи
+    применяются по одной; запись, упавшая MAX_APPLY_ATTEMPTS раз при
+    доступной БД, переносится в файл .dead и получает квитанцию failed.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        session_factory=SessionLocal,
+        receipt_ttl_seconds: Optional[int] = settings.spool_receipt_ttl_seconds,
+    ):
+        self.path = Path(path) if path else None
+        self.session_factory = session_factory
+        self.receipt_ttl_seconds = receipt_ttl_seconds
+        # Журнал этого процесса и его блокировка (заняты между start и stop)
+        self.journal_path: Optional[Path] = None
+        self._journal_index = 0
+        self._lock_file = None
+        self._file = None
+        self._pending: OrderedDict[str, dict] = OrderedDict()
+        # Неудачные попытки применения записей по tracking_id
+        self._attempts: Dict[str, int] = {}
+        self._written = 0
+        self._synced = 0
+        # Размер журнала после последнего сжатия
+        self._compacted_size = 0
+        # Запись в журнал и очередь непримененных записей
+        self._lock = threading.Lock()
+        # Групповой fsync
+        self._sync_lock = threading.Lock()
+        # Одновременно применяет журнал только один поток
+        self._apply_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._file is not None
+
+    def configure(self, path: str) -> None:
+        if self.running:
+            raise RuntimeError("Spool is already started")
+        self.path = Path(path)
+
+    def start(self, background: bool = True) -> int:
+        """
+        Открыть журнал, восстановить непримененные записи и запустить applier.
+
+        Возвращает число восстановленных записей.
+        """
+        if self.path is None:
+            raise RuntimeError("Spool path is not configured")
+        with self._lock:
+            if self._file is not None:
+                return 0
+            self._journal_index, self._lock_file = self._acquire()
+            self.journal_path = self._journal_path(self._journal_index)
+            self._pending = self._load()
+            self._attempts = {}
+            # Журнал открыт все время работы и закрывается в stop(), поэтому
+            # не в контекстном менеджере
+            self._file = open(self.journal_path, "ab")  # noqa: SIM115
+            self._compacted_size = os.fstat(self._file.fileno()).st_size
+        if self._pending:
+            logger.info("Журнал приема: к применению %s записей", len(self._pending))
+        if background:
+            self._stopping.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="ingestion-spool", daemon=True
+            )
+            self._thread.start()
+            self._wakeup.set()
+        return len(self._pending)
+
+    def stop(self) -> None:
+        """Остановить applier, применив накопленные записи"""
+        if self._thread is not None:
+            self._stopping.set()
+            self._wakeup.set()
+            self._thread.join()
+            self._thread = None
+        try:
+            self.apply_pending()
+        finally:
+            with self._lock:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                if self._lock_file is not None:
+                    # Закрытие файла снимает блокировку журнала
+                    self._lock_file.close()
+                    self._lock_file = None
+
+    def submit(self, contact_in: ContactCreate) -> str:
+        """Записать обращение в журнал; возвращает tracking_id после fsync"""
+        contact = contact_in.model_dump()
+        with self._lock:
+            if self._file is None:
+                raise RuntimeError("Spool is not started")
+            # Номер журнала в tracking_id: по нему статус находит запись
+            tracking_id = f"{self._journal_index}-{uuid.uuid4().hex}"
+            self._file.write(self._entry(tracking_id, contact))
+            self._file.flush()
+            self._written += 1
+            sequence = self._written
+            self._pending[tracking_id] = contact
+        self._sync(sequence)
+        self._wakeup.set()
+        return tracking_id
+
+    def status(self, db: Session, tracking_id: str) -> Optional[SpoolStatus]:
+        """
+        Состояние записи: pending, applied или failed; None — неизвестна.
+
+        pending — только если запись есть в журнале, номер которого указан в
+        tracking_id: своем или другого процесса.
+        """
+        with self._lock:
+            if tracking_id in self._pending:
+                return SpoolStatus(tracking_id=tracking_id, status="pending")
+        receipt = spool_receipt_crud.get_by_tracking_id(db, tracking_id)
+        if receipt is None and self._in_journal(tracking_id):
+            # Запись могли применить и убрать из журнала между проверками:
+            # перечитываем квитанцию в новой транзакции (новый снимок БД)
+            db.rollback()
+            receipt = spool_receipt_crud.get_by_tracking_id(db, tracking_id)
+            if receipt is None:
+                return SpoolStatus(tracking_id=tracking_id, status="pending")
+        if receipt is None:
+            return None
+        return SpoolStatus(
+            tracking_id=tracking_id,
+            status="failed" if receipt.error else "applied",
+            contact_id=receipt.contact_id,
+            error=receipt.error,
+        )
+
+    def apply_pending(self) -> int:
+        """
+        Применить накопленные записи; возвращает число снятых с журнала.
+
+        Записи, которые не удалось применить, остаются в журнале до
+        следующего прохода.
+        """
+        applied = 0
+        # Записи, упавшие в этом проходе: повторяем их в следующем
+        skipped = set()
+        with self._apply_lock:
+            while True:
+                with self._lock:
+                    pending = (
+                        item for item in self._pending.items() if item[0] not in skipped
+                    )
+                    batch = list(islice(pending, APPLY_BATCH_SIZE))
+                if not batch:
+                    break
+                try:
+                    self._apply(batch)
+                    done = batch
+                except Exception:
+                    logger.exception("Ошибка применения пачки журнала приема")
+                    done = self._apply_each(batch)
+                    if not done:
+                        break
+                    skipped.update(tracking_id for tracking_id, _ in batch)
+                applied += len(done)
+                with self._lock:
+                    for tracking_id, _ in done:
+                        self._pending.pop(tracking_id, None)
+                    if not self._pending and self._file is not None:
+                        # Все записи журнала в БД: начинаем его заново
+                        self._file.truncate(0)
+                        self._compacted_size = 0
+                self._compact_if_grown()
+        return applied
+
+    def purge_receipts(self, db: Session, now: Optional[datetime] = None) -> int:
+        """Удалить квитанции старше receipt_ttl_seconds; возвращает их число"""
+        if self.receipt_ttl_seconds is None:
+            return 0
+        now = now or datetime.now(UTC).replace(tzinfo=None)
+        removed = spool_receipt_crud.purge(
+            db, before=now - timedelta(seconds=self.receipt_ttl_seconds)
+        )
+        db.commit()
+        return removed
+
+    def _apply(self, batch: List[Tuple[str, dict]]) -> None:
+        with self.session_factory() as db, unit_of_work(db):
+            done = spool_receipt_crud.applied(
+                db, [tracking_id for tracking_id, _ in batch]
+            )
+            receipts = []
+            todo = []
+            for tracking_id, contact in batch:
+                if tracking_id in done:
+                    continue
+                try:
+                    todo.append((tracking_id, ContactCreate(**contact)))
+                except ValidationError as exc:
+                    receipts.append(
+                        {
+                            "tracking_id": tracking_id,
+                            "contact_id": None,
+                            "error": str(exc.errors()[0]["msg"]),
+                        }
+                    )
+
+            results = ingest_batch(db, [contact for _, contact in todo])
+            receipts.extend(
+                {
+                    "tracking_id": tracking_id,
+                    "contact_id": result.contact.id if result.contact else None,
+                    "error": result.error,
+                }
+                for (tracking_id, _), result in zip(todo, results)
+            )
+            spool_receipt_crud.add_many(db, receipts)
+
+    def _apply_each(self, batch: List[Tuple[str, dict]]) -> List[Tuple[str, dict]]:
+        """
+        Применить записи пачки по одной, чтобы сбойная запись не держала
+        остальные. Возвращает записи, снятые с журнала (в том числе
+        перенесенные в .dead).
+        """
+        done = []
+        for tracking_id, contact in batch:
+            try:
+                self._apply([(tracking_id, contact)])
+            except Exception as exc:
+                logger.exception("Журнал приема: запись %s не применена", tracking_id)
+                if not self._database_available():
+                    # БД недоступна: попытка не засчитывается, ждем следующего прохода
+                    break
+                attempts = self._attempts.get(tracking_id, 0) + 1
+                self._attempts[tracking_id] = attempts
+                if attempts < MAX_APPLY_ATTEMPTS:
+                    continue
+                self._dead_letter(tracking_id, contact, exc)
+            self._attempts.pop(tracking_id, None)
+            done.append((tracking_id, contact))
+        return done
+
+    def _database_available(self) -> bool:
+        try:
+            with self.session_factory() as db:
+                db.execute(text("SELECT 1"))
+        except SQLAlchemyError:
+            return False
+        return True
+
+    def _dead_letter(self, tracking_id: str, contact: dict, exc: Exception) -> None:
+        """Перенести запись в файл .dead и записать квитанцию об ошибке"""
+        logger.error(
+            "Журнал приема: запись %s перенесена в .dead после %s попыток",
+            tracking_id,
+            MAX_APPLY_ATTEMPTS,
+        )
+        line = json.dumps(
+            {"tracking_id": tracking_id, "contact": contact, "error": repr(exc)},
+            ensure_ascii=False,
+        )
+        dead_path = self.journal_path.with_name(self.journal_path.name + ".dead")
+        with open(dead_path, "ab") as dead:
+            dead.write(line.encode() + b"\n")
+            dead.flush()
+            os.fsync(dead.fileno())
+        try:
+            with self.session_factory() as db, unit_of_work(db):
+                spool_receipt_crud.add_many(
+                    db,
+                    [
+                        {
+                            "tracking_id": tracking_id,
+                            "contact_id": None,
+                            "error": "Apply failed",
+                        }
+                    ],
+                )
+        except Exception:
+            logger.exception("Журнал приема: квитанция %s не записана", tracking_id)
+
+    def _acquire(self) -> Tuple[int, Optional[object]]:
+        """Занять первый журнал, не заблокированный другим процессом"""
+        for index in range(MAX_JOURNALS):
+            path = self._journal_path(index)
+            if fcntl is None:
+                return index, None
+            # Файл блокировки держится открытым до stop()
+            lock_file = open(path.with_name(path.name + ".lock"), "ab")  # noqa: SIM115
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                continue
+            return index, lock_file
+        raise RuntimeError("All spool journals are in use")
+
+    def _compact_if_grown(self) -> None:
+        """
+        Заменить журнал файлом только с непримененными записями, если он
+        вырос вдвое с прошлого сжатия: под постоянной нагрузкой очередь не
+        пустеет, и без сжатия журнал растет бесконечно.
+        """
+        # Порядок блокировок как в _sync: fsync не должен попасть на
+        # закрытый при замене дескриптор
+        with self._sync_lock, self._lock:
+            if self._file is None:
+                return
+            size = os.fstat(self._file.fileno()).st_size
+            if size < max(COMPACT_MIN_BYTES, 2 * self._compacted_size):
+                return
+            compacted = self.journal_path.with_name(self.journal_path.name + ".tmp")
+            with open(compacted, "wb") as journal:
+                for tracking_id, contact in self._pending.items():
+                    journal.write(self._entry(tracking_id, contact))
+                journal.flush()
+                os.fsync(journal.fileno())
+            os.replace(compacted, self.journal_path)
+            self._fsync_directory()
+            self._file.close()
+            self._file = open(self.journal_path, "ab")  # noqa: SIM115
+            self._compacted_size = os.fstat(self._file.fileno()).st_size
+            # Все подтвержденные записи уже в новом файле на диске
+            self._synced = self._written
+        logger.info("Журнал приема сжат: %s -> %s байт", size, self._compacted_size)
+
+    def _fsync_directory(self) -> None:
+        if not hasattr(os, "O_DIRECTORY"):
+            return
+        fd = os.open(self.journal_path.parent, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _in_journal(self, tracking_id: str) -> bool:
+        """Есть ли запись в журнале, номер которого указан в tracking_id"""
+        index, _, _ = tracking_id.partition("-")
+        if self.path is None or not index.isdigit() or int(index) >= MAX_JOURNALS:
+            return False
+        # Строка журнала начинается с tracking_id: см. _entry
+        needle = json.dumps({"tracking_id": tracking_id})[:-1].encode() + b","
+        try:
+            with open(self._journal_path(int(index)), "rb") as journal:
+                return any(line.startswith(needle) for line in journal)
+        except FileNotFoundError:
+            return False
+
+    @staticmethod
+    def _entry(tracking_id: str, contact: Optional[dict]) -> bytes:
+        line = json.dumps(
+            {"tracking_id": tracking_id, "contact": contact}, ensure_ascii=False
+        )
+        return line.encode() + b"\n"
+
+    def _journal_path(self, index: int) -> Path:
+        if not index:
+            return self.path
+        return self.path.with_name(f"{self.path.name}.{index}")
+
+    def _sync(self, sequence: int) -> None:
+        with self._sync_lock:
+            if self._synced >= sequence:
+                # Запись уже покрыта fsync другого запроса
+                return
+            with self._lock:
+                target = self._written
+                fd = self._file.fileno()
+            os.fsync(fd)
+            self._synced = target
+
+    def _load(self) -> OrderedDict[str, dict]:
+        """Прочитать журнал, отбросив оборванную последнюю запись"""
+        pending: OrderedDict[str, dict] = OrderedDict()
+        if not self.journal_path.exists():
+            return pending
+
+        valid_size = 0
+        with open(self.journal_path, "rb") as journal:
+            for line in journal:
+                if not line.endswith(b"\n"):
+                    # Сбой во время записи: такая запись не была подтверждена
+                    break
+                valid_size += len(line)
+                try:
+                    entry = json.loads(line)
+                    pending[entry["tracking_id"]] = entry["contact"]
+                except (ValueError, KeyError):
+                    logger.warning("Журнал приема: пропущена поврежденная запись")
+        if valid_size < self.journal_path.stat().st_size:
+            os.truncate(self.journal_path, valid_size)
+        return pending
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wakeup.wait(APPLY_INTERVAL_SECONDS)
+            self._wakeup.clear()
+            try:
+                self.apply_pending()
+            except Exception:
+                # Записи остаются в журнале и будут применены следующим проходом
+                logger.exception("Ошибка применения журнала приема")
+
+
+contact_spool = IngestionSpool()
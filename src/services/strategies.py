@@ -0,0 +1,263 @@
+import hashlib
+import heapq
+import math
+import random
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Set, Tuple, Type
+
+
+@dataclass(frozen=True)
+class RouteEntry:
+    operator_id: int
+    weight: int
+    max_load: int
+
+
+class AliasTable:
+    """Таблица псевдонимов Уолкера: выбор индекса по весам за O(1)"""
+
+    def __init__(self, weights: Sequence[int]):
+        size = len(weights)
+        total = sum(weights)
+        self.size = size
+        self.prob = [0.0] * size
+        self.alias = list(range(size))
+
+        scaled = [weight * size / total for weight in weights]
+        small = [i for i, value in enumerate(scaled) if value < 1.0]
+        large = [i for i, value in enumerate(scaled) if value >= 1.0]
+
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            self.prob[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] = scaled[more] + scaled[less] - 1.0
+            if scaled[more] < 1.0:
+                small.append(more)
+            else:
+                large.append(more)
+
+        # Остатки из-за погрешности округления
+        for i in small + large:
+            self.prob[i] = 1.0
+
+    def sample(self, rng: random.Random = random) -> int:
+        i = int(rng.random() * self.size)
+        return i if rng.random() < self.prob[i] else self.alias[i]
+
+
+class RoutingStrategy:
+    """
+    Стратегия выбора оператора внутри таблицы маршрутизации источника.
+
+    Состояние стратегии обновляется инкрементально: pick не перестраивает
+    таблицу маршрутизации. Доступность оператора окончательно подтверждается
+    резервированием в БД; при отказе вызывается reject. Ключ маршрутизации
+    key учитывают только стратегии с привязкой (sticky).
+    """
+
+    name: str
+
+    def __init__(self, entries: List[RouteEntry], loads: Dict[int, int]):
+        self.entries = entries
+
+    def pick(
+        self, rejected: Set[int], key: Optional[str] = None
+    ) -> Optional[RouteEntry]:
+        raise NotImplementedError
+
+    def reject(self, operator_id: int) -> None:
+        """Оператор оказался занят"""
+
+    def release(self, operator_id: int) -> None:
+        """У оператора освободился слот"""
+
+
+class WeightedRandomStrategy(RoutingStrategy):
+    """Вероятностный выбор по весам через таблицу псевдонимов"""
+
+    name = "random"
+
+    def __init__(self, entries: List[RouteEntry], loads: Dict[int, int]):
+        super().__init__(entries, loads)
+        self._alias = AliasTable([entry.weight for entry in entries])
+
+    def pick(
+        self, rejected: Set[int], key: Optional[str] = None
+    ) -> Optional[RouteEntry]:
+        if len(rejected) >= len(self.entries):
+            return None
+        entry = self.entries[self._alias.sample()]
+        # Отвергнутых отбрасываем, число попыток ограничивает вызывающий код
+        return None if entry.operator_id in rejected else entry
+
+
+class SmoothWeightedRoundRobinStrategy(RoutingStrategy):
+    """
+    Плавный взвешенный round-robin (smooth WRR nginx).
+
+    На каждом выборе текущий вес доступных операторов растет на их вес,
+    выбирается оператор с наибольшим текущим весом, и его текущий вес
+    уменьшается на сумму весов доступных. Выдачи равномерно перемешаны, а
+    занятый оператор в выборе не участвует и не копит ходы: освободившись,
+    он не получает пачку обращений подряд.
+    """
+
+    name = "smooth_wrr"
+
+    def __init__(self, entries: List[RouteEntry], loads: Dict[int, int]):
+        super().__init__(entries, loads)
+        self._current = [0] * len(entries)
+
+    def pick(
+        self, rejected: Set[int], key: Optional[str] = None
+    ) -> Optional[RouteEntry]:
+        best = None
+        total = 0
+        for i, entry in enumerate(self.entries):
+            if entry.operator_id in rejected:
+                continue
+            self._current[i] += entry.weight
+            total += entry.weight
+            if best is None or self._current[i] > self._current[best]:
+                best = i
+        if best is None:
+            return None
+        self._current[best] -= total
+        return self.entries[best]
+
+
+class LeastLoadedStrategy(RoutingStrategy):
+    """
+    Наименее загруженный оператор относительно веса.
+
+    Куча упорядочена по нагрузке/весу (при равенстве выигрывает больший вес).
+    Устаревшие элементы кучи отбрасываются лениво по номеру версии оператора.
+    """
+
+    name = "least_loaded"
+
+    def __init__(self, entries: List[RouteEntry], loads: Dict[int, int]):
+        super().__init__(entries, loads)
+        self._index = {entry.operator_id: i for i, entry in enumerate(entries)}
+        self._loads = [loads.get(entry.operator_id, 0) for entry in entries]
+        self._stamps = [0] * len(entries)
+        self._heap = [
+            self._heap_item(i)
+            for i, entry in enumerate(entries)
+            if self._loads[i] < entry.max_load
+        ]
+        heapq.heapify(self._heap)
+
+    def _heap_item(self, i: int) -> Tuple[float, int, int, int]:
+        entry = self.entries[i]
+        return (self._loads[i] / entry.weight, -entry.weight, i, self._stamps[i])
+
+    def _set_load(self, i: int, load: int) -> None:
+        self._loads[i] = max(load, 0)
+        self._stamps[i] += 1
+        if self._loads[i] < self.entries[i].max_load:
+            heapq.heappush(self._heap, self._heap_item(i))
+
+    def pick(
+        self, rejected: Set[int], key: Optional[str] = None
+    ) -> Optional[RouteEntry]:
+        skipped = []
+        picked = None
+        while self._heap:
+            item = heapq.heappop(self._heap)
+            i, stamp = item[2], item[3]
+            if stamp != self._stamps[i]:
+                continue
+            if self.entries[i].operator_id in rejected:
+                skipped.append(item)
+                continue
+            picked = self.entries[i]
+            self._set_load(i, self._loads[i] + 1)
+            break
+        for item in skipped:
+            heapq.heappush(self._heap, item)
+        return picked
+
+    def reject(self, operator_id: int) -> None:
+        i = self._index.get(operator_id)
+        if i is not None:
+            # Откатываем учтенный в pick слот и помечаем оператора полным
+            self._set_load(i, self.entries[i].max_load)
+
+    def release(self, operator_id: int) -> None:
+        i = self._index.get(operator_id)
+        if i is not None:
+            self._set_load(i, self._loads[i] - 1)
+
+
+def rendezvous_score(key: str, operator_id: int, weight: int) -> float:
+    """
+    Взвешенный ранг рандеву-хеширования (HRW) пары ключ-оператор.
+
+    Хеш отображается в u из (0, 1), ранг равен weight / -ln(u): оператор
+    выигрывает у ключа с вероятностью, пропорциональной весу, а удаление
+    оператора переназначает только ключи, которые были закреплены за ним.
+    """
+    digest = hashlib.blake2b(f"{key}:{operator_id}".encode(), digest_size=8).digest()
+    u = (int.from_bytes(digest, "big") + 0.5) / 2**64
+    return weight / -math.log(u)
+
+
+def rendezvous_order(key: str, candidates: Sequence[Tuple[int, int]]) -> List[int]:
+    """id операторов из пар (operator_id, weight) по убыванию ранга для ключа"""
+    return [
+        operator_id
+        for operator_id, _ in sorted(
+            candidates,
+            key=lambda candidate: rendezvous_score(key, *candidate),
+            reverse=True,
+        )
+    ]
+
+
+class RendezvousStrategy(WeightedRandomStrategy):
+    """
+    Привязка ключа (external_id лида) к оператору рандеву-хешированием.
+
+    Повторные обращения одного лида попадают к тому же оператору, пока он
+    доступен; занятый оператор отбрасывается и ключ уходит к следующему по
+    рангу. Без ключа выбор вероятностный по весам.
+    """
+
+    name = "sticky"
+
+    def pick(
+        self, rejected: Set[int], key: Optional[str] = None
+    ) -> Optional[RouteEntry]:
+        if key is None:
+            return super().pick(rejected)
+        best = None
+        best_score = -1.0
+        for entry in self.entries:
+            if entry.operator_id in rejected:
+                continue
+            score = rendezvous_score(key, entry.operator_id, entry.weight)
+            if score > best_score:
+                best, best_score = entry, score
+        return best
+
+
+STRATEGIES: Dict[str, Type[RoutingStrategy]] = {
+    strategy.name: strategy
+    for strategy in (
+        WeightedRandomStrategy,
+        SmoothWeightedRoundRobinStrategy,
+        LeastLoadedStrategy,
+        RendezvousStrategy,
+    )
+}
+DEFAULT_STRATEGY = WeightedRandomStrategy.name
+
+
+def build_strategy(
+    name: Optional[str], entries: List[RouteEntry], loads: Dict[int, int]
+) -> RoutingStrategy:
+    strategy_class = STRATEGIES.get(name or DEFAULT_STRATEGY, WeightedRandomStrategy)
+    return strategy_class(entries, loads)
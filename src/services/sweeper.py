@@ -0,0 +1,129 @@
+import logging
+import threading
+from datetime import UTC, datetime, timedelta
+from typing import Dict, Optional
+
+from crud.contact import contact as contact_crud
+from database import SessionLocal
+
+from .dispatcher import pending_dispatcher
+from .distribution import distribution_service
+from .idempotency import idempotency_cache
+from .spool import contact_spool
+
+logger = logging.getLogger(__name__)
+
+
+class IdleContactSweeper:
+    """
+    Фоновое закрытие обращений, не менявшихся дольше ttl.
+
+    Обращения закрываются пачками по batch_size, каждая пачка — отдельная
+    короткая транзакция, поэтому блокировка записи не удерживается надолго.
+    Освободившиеся слоты сразу отдаются очереди ожидания. Без ttl
+    обращения не закрываются. На каждом проходе удаляются устаревшие
+    ключи идемпотентности и квитанции журнала приема.
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        dispatcher=pending_dispatcher,
+        idempotency=idempotency_cache,
+        spool=contact_spool,
+        ttl_seconds: Optional[int] = None,
+        interval_seconds: float = 60,
+        batch_size: int = 500,
+    ):
+        self.session_factory = session_factory
+        self.dispatcher = dispatcher
+        self.idempotency = idempotency
+        self.spool = spool
+        self.ttl_seconds = ttl_seconds
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def configure(
+        self, ttl_seconds: Optional[int], interval_seconds: float, batch_size: int
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="idle-contact-sweeper", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join()
+            self._thread = None
+
+    def sweep(self, now: Optional[datetime] = None) -> int:
+        """Закрыть все простаивающие обращения; возвращает их число"""
+        if self.ttl_seconds is None:
+            return 0
+        now = now or datetime.now(UTC).replace(tzinfo=None)
+        before = now - timedelta(seconds=self.ttl_seconds)
+        released: Dict[int, int] = {}
+        total = 0
+        while not self._stopping.is_set():
+            with self.session_factory() as db:
+                closed = contact_crud.close_idle(
+                    db, before=before, limit=self.batch_size
+                )
+            count = sum(closed.values())
+            total += count
+            for operator_id, slots in closed.items():
+                if operator_id is not None:
+                    released[operator_id] = released.get(operator_id, 0) + slots
+            if count < self.batch_size:
+                break
+
+        for operator_id, slots in released.items():
+            for _ in range(slots):
+                distribution_service.release_slot(operator_id)
+            self.dispatcher.on_operator_capacity(operator_id)
+        if total:
+            logger.info("Закрыто простаивающих обращений: %s", total)
+        return total
+
+    def purge(self, now: Optional[datetime] = None) -> int:
+        """
+        Удалить устаревшие ключи идемпотентности и квитанции журнала
+        приема; возвращает их общее число
+        """
+        with self.session_factory() as db:
+            removed = self.idempotency.purge(db, now)
+            receipts = self.spool.purge_receipts(db, now)
+        if removed:
+            logger.info("Удалено устаревших ключей идемпотентности: %s", removed)
+        if receipts:
+            logger.info("Удалено устаревших квитанций журнала: %s", receipts)
+        return removed + receipts
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self.interval_seconds):
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Ошибка закрытия простаивающих обращений")
+            try:
+                self.purge()
+            except Exception:
+                logger.exception("Ошибка удаления ключей идемпотентности и квитанций")
+
+
+idle_sweeper = IdleContactSweeper()
@@ -32,6 +32,22 @@ def db():
         Base.metadata.drop_all(bind=engine)
 
 
+@pytest.fixture(scope="function")
+def file_session_factory(tmp_path):
+    """Фабрика сессий к файловой SQLite (для тестов с несколькими потоками)"""
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'test.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+        echo=False,
+    )
+    Base.metadata.create_all(bind=engine)
+    try:
+        yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    finally:
+        Base.metadata.drop_all(bind=engine)
+        engine.dispose()
+
+
 def override_get_db():
     """Локальная функция для переопределения зависимости базы данных"""
     SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
@@ -81,6 +97,42 @@ def sample_operator_data():
     }
 
 
+@pytest.fixture
+def operator_source(client, sample_operator_data):
+    """
+    Фабрика: оператор и источники с весом оператора, созданные через API.
+
+    Возвращает (operator_id, source_id, ...). weight=None — без весов.
+    """
+    created = []
+
+    def create(max_load=10, sources=1, weight=1):
+        operator_id = client.post(
+            "/api/v1/operators/",
+            json={
+                **sample_operator_data,
+                "email": f"operator_{len(created)}@example.com",
+                "max_load": max_load,
+            },
+        ).json()["id"]
+        source_ids = []
+        for _ in range(sources):
+            source_id = client.post(
+                "/api/v1/sources/",
+                json={"name": "Бот", "bot_token": f"bot_{len(created)}"},
+            ).json()["id"]
+            created.append(source_id)
+            if weight is not None:
+                client.post(
+                    f"/api/v1/sources/{source_id}/weights",
+                    json={"operator_id": operator_id, "weight": weight},
+                )
+            source_ids.append(source_id)
+        return (operator_id, *source_ids)
+
+    return create
+
+
 @pytest.fixture
 def sample_source_data():
     """Фикстура с тестовыми данными источника"""
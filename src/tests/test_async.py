@@ -0,0 +1,145 @@
+import inspect
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from api.dependencies import get_async_database, get_database
+from benchmarks import async_path
+from database import Base
+from database_async import async_url
+from main import create_app
+
+
+@pytest.fixture
+def async_client(tmp_path):
+    """Клиент приложения с асинхронными маршрутами над общей файловой БД"""
+    url = f"sqlite:///{tmp_path / 'async.db'}"
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    async_engine = create_async_engine(async_url(url))
+    async_session_factory = async_sessionmaker(async_engine, expire_on_commit=False)
+
+    def override_get_database():
+        with session_factory() as db:
+            yield db
+
+    async def override_get_async_database():
+        async with async_session_factory() as db:
+            yield db
+
+    app = create_app(async_database=True)
+    app.dependency_overrides[get_database] = override_get_database
+    app.dependency_overrides[get_async_database] = override_get_async_database
+    with TestClient(app) as client:
+        yield client
+        # Движок привязан к циклу событий клиента
+        client.portal.call(async_engine.dispose)
+    Base.metadata.drop_all(bind=engine)
+    engine.dispose()
+
+
+class TestAsyncDatabase:
+    """Тесты асинхронного режима работы с БД"""
+
+    def test_async_url(self):
+        """Синхронный URL переводится на асинхронный драйвер"""
+        assert async_url("sqlite:///./crm.db") == "sqlite+aiosqlite:///./crm.db"
+        assert (
+            async_url("postgresql://crm:secret@db/crm")
+            == "postgresql+asyncpg://crm:secret@db/crm"
+        )
+        with pytest.raises(ValueError):
+            async_url("mysql://db/crm")
+
+    def test_async_routes_take_precedence(self):
+        """В асинхронном режиме маршруты контактов обслуживают корутины"""
+        app = create_app(async_database=True)
+        endpoints = []
+
+        @app.middleware("http")
+        async def capture_endpoint(request, call_next):
+            response = await call_next(request)
+            endpoints.append(request.scope.get("endpoint"))
+            return response
+
+        client = TestClient(app)
+        client.post("/api/v1/contacts/", json={})
+        client.get("/api/v1/contacts/search", params={"limit": "all"})
+
+        assert [endpoint.__name__ for endpoint in endpoints] == [
+            "create_contact_async",
+            "search_contacts",
+        ]
+        assert inspect.iscoroutinefunction(endpoints[0])
+
+    def test_contact_flow(self, async_client, sample_operator_data):
+        """Создание, листинг и закрытие обращений через асинхронные маршруты"""
+        operator_id = async_client.post(
+            "/api/v1/operators/", json=sample_operator_data
+        ).json()["id"]
+        source_id = async_client.post(
+            "/api/v1/sources/", json={"name": "Бот", "bot_token": "bot_async"}
+        ).json()["id"]
+        async_client.post(
+            f"/api/v1/sources/{source_id}/weights",
+            json={"operator_id": operator_id, "weight": 1},
+        )
+
+        created = [
+            async_client.post(
+                "/api/v1/contacts/",
+                json={"lead_external_id": f"async_{i}", "source_id": source_id},
+            )
+            for i in range(3)
+        ]
+        assert [response.status_code for response in created] == [200] * 3
+        assert {response.json()["operator_id"] for response in created} == {operator_id}
+        missing = async_client.post(
+            "/api/v1/contacts/", json={"lead_external_id": "x", "source_id": 999}
+        )
+        assert missing.status_code == 404
+
+        page = async_client.get("/api/v1/contacts/", params={"limit": 2})
+        assert [c["lead_external_id"] for c in page.json()] == ["async_0", "async_1"]
+        assert "X-Next-Cursor" in page.headers
+
+        contact_id = created[0].json()["id"]
+        closed = async_client.put(f"/api/v1/contacts/{contact_id}/close")
+        assert closed.status_code == 200
+        operator = async_client.get(f"/api/v1/operators/{operator_id}").json()
+        assert operator["current_load"] == 2
+        by_operator = async_client.get(f"/api/v1/contacts/by-operator/{operator_id}")
+        assert [c["is_active"] for c in by_operator.json()] == [False, True, True]
+
+    def test_idempotency_key(self, async_client, sample_operator_data):
+        """Повтор с тем же ключом в асинхронном режиме не создает обращение"""
+        from services.idempotency import idempotency_cache
+
+        idempotency_cache.clear()
+        source_id = async_client.post(
+            "/api/v1/sources/", json={"name": "Бот", "bot_token": "bot_async_key"}
+        ).json()["id"]
+        payload = {"lead_external_id": "async_retry", "source_id": source_id}
+        headers = {"Idempotency-Key": "async-1"}
+
+        first = async_client.post("/api/v1/contacts/", json=payload, headers=headers)
+        retry = async_client.post("/api/v1/contacts/", json=payload, headers=headers)
+        idempotency_cache.clear()
+
+        assert retry.json() == first.json()
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        assert len(async_client.get("/api/v1/contacts/").json()) == 1
+
+    def test_benchmark_report(self, capsys):
+        """Бенчмарк прогоняет одинаковую нагрузку через оба режима"""
+        reports = async_path.main(
+            ["--contacts", "20", "--concurrency", "4", "--operators", "2", "--json"]
+        )
+
+        assert [report["mode"] for report in reports] == ["sync", "async"]
+        assert [report["created"] for report in reports] == [20, 20]
+        assert '"requests_per_second"' in capsys.readouterr().out
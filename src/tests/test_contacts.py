@@ -1,4 +1,13 @@
+from datetime import datetime
+
+import pytest
 from fastapi import status
+from sqlalchemy import event
+
+import database
+from config import settings
+from models import IdempotencyKey, Lead
+from services.idempotency import idempotency_cache
 
 
 class TestContacts:
@@ -308,3 +317,450 @@ class TestContacts:
         # Может быть 404 или 200 с сообщением об ошибке
         if response.status_code != status.HTTP_200_OK:
             assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_contacts_by_operator_paginated(self, client, operator_source):
+        """История оператора отдается страницами"""
+        operator_id, source_id = operator_source()
+        for i in range(3):
+            client.post(
+                "/api/v1/contacts/",
+                json={"lead_external_id": f"page_lead_{i}", "source_id": source_id},
+            )
+
+        first = client.get(
+            f"/api/v1/contacts/by-operator/{operator_id}", params={"limit": 2}
+        )
+        second = client.get(
+            f"/api/v1/contacts/by-operator/{operator_id}",
+            params={"limit": 2, "cursor": first.headers["X-Next-Cursor"]},
+        )
+
+        assert len(first.json()) == 2
+        assert len(second.json()) == 1
+        assert "X-Next-Cursor" not in second.headers
+        ids = [c["id"] for c in first.json() + second.json()]
+        assert ids == sorted(set(ids))
+
+
+class TestContactUnitOfWork:
+    """Тесты единицы работы при создании обращения"""
+
+    def test_single_commit_per_request(self, client, operator_source):
+        """Лид, резервирование и контакт фиксируются одним коммитом"""
+        _, source_id = operator_source()
+        commits = database.StatementCounter()
+        statements = database.StatementCounter()
+        event.listen(database.engine, "commit", commits)
+        event.listen(database.engine, "before_cursor_execute", statements)
+        try:
+            response = client.post(
+                "/api/v1/contacts/",
+                json={"lead_external_id": "uow_lead", "source_id": source_id},
+            )
+        finally:
+            event.remove(database.engine, "commit", commits)
+            event.remove(database.engine, "before_cursor_execute", statements)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["operator_id"] is not None
+        assert commits.count == 1
+        # Построение таблицы маршрутизации (2), upsert лида, резервирование
+        # слота, вставка контакта; без refresh после коммита
+        assert statements.count <= 5
+
+    def test_unknown_source_leaves_no_lead(self, client):
+        """При ошибке транзакция откатывается целиком"""
+        response = client.post(
+            "/api/v1/contacts/",
+            json={"lead_external_id": "orphan_lead", "source_id": 999},
+        )
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        with database.SessionLocal() as db:
+            assert db.query(Lead).filter(Lead.external_id == "orphan_lead").count() == 0
+
+
+class TestContactDetailsQueries:
+    """Регрессионные тесты числа запросов списков с деталями"""
+
+    def test_listing_is_single_query(
+        self, client, sample_operator_data, operator_source
+    ):
+        """Страница контактов с деталями читается одним запросом"""
+        operator_id, source_id = operator_source(max_load=20)
+        for i in range(10):
+            client.post(
+                "/api/v1/contacts/",
+                json={
+                    "lead_external_id": f"details_lead_{i % 3}",
+                    "source_id": source_id,
+                    "phone": "+7000",
+                },
+            )
+
+        for url in (
+            "/api/v1/contacts/",
+            "/api/v1/contacts/by-lead/1",
+            f"/api/v1/contacts/by-operator/{operator_id}",
+        ):
+            statements = database.StatementCounter()
+            event.listen(database.engine, "before_cursor_execute", statements)
+            try:
+                response = client.get(url)
+            finally:
+                event.remove(database.engine, "before_cursor_execute", statements)
+
+            assert response.status_code == status.HTTP_200_OK
+            assert response.json()
+            assert statements.count == 1, url
+
+        contact = client.get("/api/v1/contacts/").json()[0]
+        assert contact["lead_external_id"] == "details_lead_0"
+        assert contact["lead_phone"] == "+7000"
+        assert contact["operator_name"] == sample_operator_data["name"]
+        assert contact["source_name"] == "Бот"
+
+
+class TestContactSearch:
+    """Тесты поиска контактов по фильтрам"""
+
+    def _setup(self, client, operator_source):
+        operator_id, *source_ids = operator_source(max_load=20, sources=2)
+        contact_ids = [
+            client.post(
+                "/api/v1/contacts/",
+                json={
+                    "lead_external_id": f"search_{i}",
+                    "source_id": source_ids[i % 2],
+                },
+            ).json()["id"]
+            for i in range(6)
+        ]
+        client.put(f"/api/v1/contacts/{contact_ids[0]}/close")
+        return operator_id, source_ids, contact_ids
+
+    def test_filters_combine(self, client, operator_source):
+        """Фильтры по источнику и статусу сочетаются"""
+        operator_id, source_ids, contact_ids = self._setup(client, operator_source)
+
+        response = client.get(
+            "/api/v1/contacts/search",
+            params={"source_id": source_ids[0], "status": "new"},
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert [c["id"] for c in response.json()] == contact_ids[2::2]
+
+        response = client.get(
+            "/api/v1/contacts/search",
+            params={"operator_id": operator_id, "is_active": False},
+        )
+        assert [c["id"] for c in response.json()] == contact_ids[:1]
+
+    def test_created_at_range(self, client, operator_source):
+        """Период создания задается полуинтервалом"""
+        self._setup(client, operator_source)
+
+        past = client.get(
+            "/api/v1/contacts/search", params={"created_to": "2000-01-01T00:00:00"}
+        )
+        recent = client.get(
+            "/api/v1/contacts/search", params={"created_from": "2000-01-01T00:00:00"}
+        )
+
+        assert past.json() == []
+        assert len(recent.json()) == 6
+
+    def test_plan_hidden_without_debug(self, client):
+        """План запроса недоступен вне отладочного режима"""
+        response = client.get("/api/v1/contacts/search/plan")
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_plan_uses_composite_index(self, client, monkeypatch):
+        """В отладочном режиме план показывает использование индекса"""
+        monkeypatch.setattr(settings, "debug", True)
+
+        response = client.get(
+            "/api/v1/contacts/search/plan",
+            params={"status": "new", "created_from": "2024-01-01T00:00:00"},
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        plan = " ".join(response.json()["plan"])
+        assert "ix_contacts_status_created_at" in plan
+
+
+class TestContactBatch:
+    """Тесты пакетного создания обращений"""
+
+    def test_batch_with_item_errors(self, client, operator_source):
+        """Ошибки отдельных обращений не отменяют пачку, емкость учитывается"""
+        operator_id, source_id = operator_source(max_load=2)
+        commits = database.StatementCounter()
+        event.listen(database.engine, "commit", commits)
+        try:
+            response = client.post(
+                "/api/v1/contacts/batch",
+                json={
+                    "contacts": [
+                        {"lead_external_id": "batch_a", "source_id": source_id},
+                        {"lead_external_id": "batch_b", "source_id": 999},
+                        {"lead_external_id": "batch_a", "source_id": source_id},
+                        {
+                            "lead_external_id": "batch_c",
+                            "source_id": source_id,
+                            "email": "not-an-email",
+                        },
+                        {"lead_external_id": "batch_d", "source_id": source_id},
+                    ]
+                },
+            )
+        finally:
+            event.remove(database.engine, "commit", commits)
+
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert (data["created"], data["failed"]) == (3, 2)
+        results = data["results"]
+        assert results[1]["error"] == "Source not found"
+        assert results[3]["error"].startswith("Invalid lead data")
+        created = [results[i]["contact"] for i in (0, 2, 4)]
+        assert created[0]["lead_id"] == created[1]["lead_id"]
+        # Лимит оператора 2: третье обращение ждет в очереди
+        operators = [contact["operator_id"] for contact in created]
+        assert sorted(operators, key=str) == [operator_id, operator_id, None]
+        assert commits.count == 1
+
+    def test_batch_size_limit(self, client):
+        """Слишком большая пачка не проходит валидацию"""
+        response = client.post(
+            "/api/v1/contacts/batch",
+            json={
+                "contacts": [
+                    {"lead_external_id": f"big_{i}", "source_id": 1}
+                    for i in range(1001)
+                ]
+            },
+        )
+
+        assert response.status_code == 422
+
+
+class TestContactBulkClose:
+    """Тесты массового закрытия обращений"""
+
+    def _create(self, client, source_id, external_id):
+        return client.post(
+            "/api/v1/contacts/",
+            json={"lead_external_id": external_id, "source_id": source_id},
+        ).json()
+
+    def test_close_by_operator(self, client, operator_source):
+        """Закрытие всех обращений оператора освобождает его нагрузку"""
+        operator_id, source_id = operator_source(max_load=5)
+        for i in range(3):
+            self._create(client, source_id, f"close_{i}")
+
+        response = client.post(
+            "/api/v1/contacts/close", json={"operator_id": operator_id}
+        )
+
+        assert response.status_code == 200
+        assert response.json() == {"closed": 3}
+        operator = client.get(f"/api/v1/operators/{operator_id}").json()
+        assert operator["current_load"] == 0
+        assert client.post("/api/v1/operators/reconcile-load").json() == []
+        assert client.post(
+            "/api/v1/contacts/close", json={"source_id": source_id}
+        ).json() == {"closed": 0}
+
+    def test_close_by_ids_with_waiting(self, client, operator_source):
+        """Закрытие по id снимает ожидающие обращения с очереди"""
+        operator_id, source_id = operator_source(max_load=1)
+        assigned = self._create(client, source_id, "close_assigned")
+        waiting = self._create(client, source_id, "close_waiting")
+        assert waiting["operator_id"] is None
+
+        response = client.post(
+            "/api/v1/contacts/close", json={"ids": [waiting["id"], 999]}
+        )
+        assert response.json() == {"closed": 1}
+
+        # Освободившийся слот не достается закрытому обращению
+        client.post("/api/v1/contacts/close", json={"ids": [assigned["id"]]})
+        contacts = client.get("/api/v1/contacts/").json()
+        assert [(c["is_active"], c["operator_id"]) for c in contacts] == [
+            (False, operator_id),
+            (False, None),
+        ]
+        assert client.post("/api/v1/operators/reconcile-load").json() == []
+
+    def test_close_requires_criteria(self, client):
+        """Без условий массовое закрытие не выполняется"""
+        response = client.post("/api/v1/contacts/close", json={})
+
+        assert response.status_code == 422
+
+
+class TestContactIdempotency:
+    """Тесты повторной доставки обращений"""
+
+    @pytest.fixture(autouse=True)
+    def clean_cache(self):
+        idempotency_cache.clear()
+        yield
+        idempotency_cache.clear()
+
+    def test_idempotency_key(self, client, operator_source):
+        """Повтор с тем же ключом получает исходный ответ и не занимает слот"""
+        operator_id, source_id = operator_source()
+        payload = {"lead_external_id": "retry_lead", "source_id": source_id}
+        headers = {"Idempotency-Key": "webhook-1"}
+
+        first = client.post("/api/v1/contacts/", json=payload, headers=headers)
+        retry = client.post("/api/v1/contacts/", json=payload, headers=headers)
+        # Повтор после перезапуска процесса: ответ берется из таблицы
+        idempotency_cache.clear()
+        restarted = client.post("/api/v1/contacts/", json=payload, headers=headers)
+
+        assert first.status_code == 200
+        assert "Idempotent-Replayed" not in first.headers
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        assert retry.json() == first.json() == restarted.json()
+        assert len(client.get("/api/v1/contacts/").json()) == 1
+        operator = client.get(f"/api/v1/operators/{operator_id}").json()
+        assert operator["current_load"] == 1
+        assert client.get("/api/v1/contacts/idempotency-stats").json() == {
+            "memory_hits": 0,
+            "store_hits": 1,
+            "misses": 0,
+            "cached": 1,
+        }
+
+    def test_key_reused_with_other_request(self, client, operator_source):
+        """Тот же ключ с другим телом запроса отклоняется, а не повторяется"""
+        _, source_id = operator_source()
+        payload = {"lead_external_id": "retry_lead", "source_id": source_id}
+        headers = {"Idempotency-Key": "webhook-1"}
+        client.post("/api/v1/contacts/", json=payload, headers=headers)
+
+        other = {**payload, "message": "Другое сообщение"}
+        reused = client.post("/api/v1/contacts/", json=other, headers=headers)
+        idempotency_cache.clear()
+        restarted = client.post("/api/v1/contacts/", json=other, headers=headers)
+
+        assert reused.status_code == 422
+        assert restarted.status_code == 422
+        assert len(client.get("/api/v1/contacts/").json()) == 1
+
+    def test_new_key_creates_contact(self, client, operator_source):
+        """Без ключа и окна дедупликации каждое обращение создается"""
+        _, source_id = operator_source()
+        payload = {"lead_external_id": "retry_lead", "source_id": source_id}
+
+        ids = {
+            client.post("/api/v1/contacts/", json=payload).json()["id"],
+            client.post("/api/v1/contacts/", json=payload).json()["id"],
+            client.post(
+                "/api/v1/contacts/", json=payload, headers={"Idempotency-Key": "a"}
+            ).json()["id"],
+            client.post(
+                "/api/v1/contacts/", json=payload, headers={"Idempotency-Key": "b"}
+            ).json()["id"],
+        }
+
+        assert len(ids) == 4
+        stats = client.get("/api/v1/contacts/idempotency-stats").json()
+        assert stats["misses"] == 2
+
+    def test_dedupe_window(self, client, operator_source, monkeypatch):
+        """В пределах окна одинаковое содержимое считается повтором"""
+        monkeypatch.setattr(idempotency_cache, "dedupe_window_seconds", 60)
+        _, source_id = operator_source()
+        payload = {
+            "lead_external_id": "retry_lead",
+            "source_id": source_id,
+            "message": "Здравствуйте",
+        }
+
+        first = client.post("/api/v1/contacts/", json=payload).json()
+        retry = client.post("/api/v1/contacts/", json=payload).json()
+        other = client.post(
+            "/api/v1/contacts/", json={**payload, "message": "Еще вопрос"}
+        ).json()
+
+        assert retry == first
+        assert other["id"] != first["id"]
+        assert (
+            client.get("/api/v1/contacts/idempotency-stats").json()["memory_hits"] == 1
+        )
+
+    def test_concurrent_key_conflict(self, client, operator_source, monkeypatch):
+        """Проигравший гонку запрос с тем же ключом получает исходный ответ"""
+        _, source_id = operator_source()
+        payload = {"lead_external_id": "retry_lead", "source_id": source_id}
+        headers = {"Idempotency-Key": "race"}
+        first = client.post("/api/v1/contacts/", json=payload, headers=headers)
+        # Второй запрос не видел ключа при проверке: LRU пуст, таблица — нет
+        idempotency_cache.clear()
+        lookup = idempotency_cache.lookup
+        calls = []
+
+        def miss_once(db, keys, fingerprint=None):
+            calls.append(keys)
+            return None if len(calls) == 1 else lookup(db, keys, fingerprint)
+
+        monkeypatch.setattr(idempotency_cache, "lookup", miss_once)
+        retry = client.post("/api/v1/contacts/", json=payload, headers=headers)
+
+        assert retry.status_code == 200
+        assert retry.json() == first.json()
+        assert len(calls) == 2
+        assert len(client.get("/api/v1/contacts/").json()) == 1
+
+    def test_concurrent_content_conflict(self, client, operator_source, monkeypatch):
+        """Параллельные одинаковые обращения в окне создают одно обращение"""
+        monkeypatch.setattr(idempotency_cache, "dedupe_window_seconds", 60)
+        _, source_id = operator_source()
+        payload = {"lead_external_id": "retry_lead", "source_id": source_id}
+        first = client.post("/api/v1/contacts/", json=payload)
+        # Второй запрос проверял ключ до фиксации первого
+        idempotency_cache.clear()
+        lookup = idempotency_cache.lookup
+        calls = []
+
+        def miss_once(db, keys, fingerprint=None):
+            calls.append(keys)
+            return None if len(calls) == 1 else lookup(db, keys, fingerprint)
+
+        monkeypatch.setattr(idempotency_cache, "lookup", miss_once)
+        retry = client.post("/api/v1/contacts/", json=payload)
+
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        assert retry.json() == first.json()
+        assert len(client.get("/api/v1/contacts/").json()) == 1
+
+    def test_content_key_reused_after_window(
+        self, client, operator_source, monkeypatch
+    ):
+        """После окна то же содержимое создает новое обращение"""
+        monkeypatch.setattr(idempotency_cache, "dedupe_window_seconds", 60)
+        _, source_id = operator_source()
+        payload = {"lead_external_id": "retry_lead", "source_id": source_id}
+        first = client.post("/api/v1/contacts/", json=payload).json()
+        idempotency_cache.clear()
+        # Запись ключа создана раньше окна
+        db = database.SessionLocal()
+        try:
+            db.query(IdempotencyKey).update(
+                {IdempotencyKey.created_at: datetime(2000, 1, 1)}
+            )
+            db.commit()
+        finally:
+            db.close()
+
+        second = client.post("/api/v1/contacts/", json=payload)
+
+        assert second.status_code == 200
+        assert "Idempotent-Replayed" not in second.headers
+        assert second.json()["id"] != first["id"]
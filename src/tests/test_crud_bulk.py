@@ -0,0 +1,88 @@
+from crud.lead import lead as lead_crud
+from crud.operator import operator as operator_crud
+from crud.source import source as source_crud
+from database import count_statements
+from models.lead import Lead
+from models.operator import Operator
+from schemas.lead import LeadCreate
+from schemas.operator import OperatorCreate
+from schemas.source import SourceCreate
+from services.routing_index import routing_index
+
+
+class TestBulkCrud:
+    """Тесты массовой вставки и upsert в CRUDBase"""
+
+    def test_create_many_returns_ids_in_order(self, db):
+        """Ключи возвращаются в порядке входных объектов без повторных SELECT"""
+        leads_in = [LeadCreate(external_id=f"bulk_{i}") for i in range(25)]
+
+        with count_statements(db) as counter:
+            ids = lead_crud.create_many(db, objs_in=leads_in, chunk_size=10)
+
+        assert len(ids) == 25
+        # Одна вставка на пачку: 3 пачки
+        assert counter.count == 3
+        stored = dict(db.query(Lead.id, Lead.external_id))
+        assert [stored[lead_id] for lead_id in ids] == [
+            lead_in.external_id for lead_in in leads_in
+        ]
+
+    def test_create_many_applies_defaults(self, db):
+        """Колонки со значениями по умолчанию заполняются"""
+        (operator_id,) = operator_crud.create_many(
+            db, objs_in=[OperatorCreate(name="Оператор", email="bulk@test.com")]
+        )
+
+        operator = operator_crud.get(db, id=operator_id)
+        assert operator.active_load == 0
+        assert operator.created_at is not None
+
+    def test_upsert_many_updates_by_natural_key(self, db):
+        """Существующие строки обновляются и сохраняют свой id"""
+        (existing_id,) = operator_crud.create_many(
+            db,
+            objs_in=[OperatorCreate(name="Старое", email="a@test.com", max_load=1)],
+        )
+
+        ids = operator_crud.upsert_many(
+            db,
+            objs_in=[
+                OperatorCreate(name="Новое", email="a@test.com", max_load=5),
+                OperatorCreate(name="Второй", email="b@test.com"),
+                OperatorCreate(name="Последнее", email="a@test.com", max_load=7),
+            ],
+        )
+
+        assert ids[0] == ids[2] == existing_id
+        assert ids[1] != existing_id
+        assert db.query(Operator).count() == 2
+        db.expire_all()
+        operator = operator_crud.get(db, id=existing_id)
+        assert (operator.name, operator.max_load) == ("Последнее", 7)
+
+    def test_upsert_many_limited_fields(self, db):
+        """update_fields ограничивает обновляемые колонки"""
+        lead_crud.create_many(
+            db, objs_in=[LeadCreate(external_id="lead_1", full_name="Иван")]
+        )
+
+        lead_crud.upsert_many(
+            db,
+            objs_in=[LeadCreate(external_id="lead_1", phone="+7000")],
+            update_fields=["phone"],
+        )
+
+        db.expire_all()
+        lead = lead_crud.get_by_external_id(db, "lead_1")
+        assert (lead.full_name, lead.phone) == ("Иван", "+7000")
+
+    def test_bulk_source_insert_invalidates_routing(self, db):
+        """Массовая вставка источников сбрасывает таблицы маршрутизации"""
+        version = routing_index.version
+
+        source_crud.upsert_many(
+            db, objs_in=[SourceCreate(name="Бот", bot_token="bulk_bot")]
+        )
+
+        assert routing_index.version > version
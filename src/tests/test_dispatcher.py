@@ -0,0 +1,121 @@
+from fastapi import status
+
+from database import SessionLocal
+from models import Contact, PendingAssignment, SourceWeight
+from services.dispatcher import PendingDispatcher
+
+
+def _pending_count():
+    with SessionLocal() as db:
+        return db.query(PendingAssignment).count()
+
+
+class TestPendingDispatcher:
+    """Тесты очереди ожидания и ее разбора по событиям"""
+
+    def _send(self, client, source_id, count):
+        return [
+            client.post(
+                "/api/v1/contacts/",
+                json={"lead_external_id": f"pending_{i}", "source_id": source_id},
+            ).json()
+            for i in range(count)
+        ]
+
+    def _operator_of(self, client, contact_id):
+        contacts = client.get("/api/v1/contacts/").json()
+        return next(c for c in contacts if c["id"] == contact_id)["operator_id"]
+
+    def test_close_assigns_oldest_pending(self, client, operator_source):
+        """Закрытие обращения отдает слот самому раннему ожидающему"""
+        operator_id, source_id = operator_source(max_load=1)
+        first, second, third = self._send(client, source_id, 3)
+        assert first["operator_id"] == operator_id
+        assert second["operator_id"] is None and third["operator_id"] is None
+        assert _pending_count() == 2
+
+        response = client.put(f"/api/v1/contacts/{first['id']}/close")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert self._operator_of(client, second["id"]) == operator_id
+        assert self._operator_of(client, third["id"]) is None
+        assert _pending_count() == 1
+        operator = client.get(f"/api/v1/operators/{operator_id}").json()
+        assert operator["current_load"] == 1
+
+    def test_max_load_increase_drains_queue(self, client, operator_source):
+        """Рост лимита оператора разбирает очередь"""
+        operator_id, source_id = operator_source(max_load=1)
+        contacts = self._send(client, source_id, 3)
+
+        client.put(f"/api/v1/operators/{operator_id}", json={"max_load": 3})
+
+        assert all(self._operator_of(client, c["id"]) == operator_id for c in contacts)
+        assert _pending_count() == 0
+
+    def test_reactivation_drains_queue(self, client, operator_source):
+        """Активация оператора разбирает очередь"""
+        operator_id, source_id = operator_source(max_load=1)
+        client.put(f"/api/v1/operators/{operator_id}", json={"is_active": False})
+        (contact,) = self._send(client, source_id, 1)
+        assert contact["operator_id"] is None
+
+        client.put(f"/api/v1/operators/{operator_id}", json={"is_active": True})
+
+        assert self._operator_of(client, contact["id"]) == operator_id
+
+    def test_weight_addition_drains_queue(self, client, operator_source):
+        """Добавление веса источнику разбирает очередь"""
+        operator_id, source_id = operator_source(max_load=1, weight=None)
+        (contact,) = self._send(client, source_id, 1)
+        assert contact["operator_id"] is None
+
+        client.post(
+            f"/api/v1/sources/{source_id}/weights",
+            json={"operator_id": operator_id, "weight": 1},
+        )
+
+        assert self._operator_of(client, contact["id"]) == operator_id
+        assert _pending_count() == 0
+
+    def test_stale_batch_does_not_stop_drain(self, client, operator_source):
+        """Пачка из устаревших записей очереди не останавливает разбор"""
+        operator_id, source_id = operator_source(max_load=1, weight=None)
+        stale, waiting, _ = self._send(client, source_id, 3)
+        with SessionLocal() as db:
+            # Обращение закрыто в обход очереди: его запись устарела
+            db.get(Contact, stale["id"]).is_active = False
+            db.add(SourceWeight(source_id=source_id, operator_id=operator_id, weight=1))
+            db.commit()
+
+        assert PendingDispatcher(SessionLocal, batch_size=1).drain([source_id]) == 1
+
+        assert self._operator_of(client, waiting["id"]) == operator_id
+        assert _pending_count() == 1
+
+    def test_backfill_enqueues_unassigned(self, client, operator_source):
+        """При старте в очередь попадают обращения, созданные до нее"""
+        operator_id, source_id = operator_source(max_load=1, weight=None)
+        (contact,) = self._send(client, source_id, 1)
+        with SessionLocal() as db:
+            db.query(PendingAssignment).delete()
+            db.commit()
+        client.post(
+            f"/api/v1/sources/{source_id}/weights",
+            json={"operator_id": operator_id, "weight": 1},
+        )
+        assert self._operator_of(client, contact["id"]) is None
+
+        assert PendingDispatcher(SessionLocal).backfill() == 1
+
+        assert self._operator_of(client, contact["id"]) == operator_id
+        assert _pending_count() == 0
+
+    def test_closed_pending_leaves_queue(self, client, operator_source):
+        """Закрытое ожидающее обращение удаляется из очереди"""
+        _, source_id = operator_source(max_load=1, weight=None)
+        (contact,) = self._send(client, source_id, 1)
+
+        client.put(f"/api/v1/contacts/{contact['id']}/close")
+
+        assert _pending_count() == 0
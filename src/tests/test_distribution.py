@@ -1,4 +1,22 @@
+import random
+import threading
+
+import pytest
 from fastapi import status
+from sqlalchemy import func
+
+from benchmarks import distribution as simulator
+from crud.contact import contact as contact_crud
+from crud.operator import operator as operator_crud
+from crud.source import source as source_crud
+from database import count_statements
+from models import Contact, Lead, Operator, Source, SourceWeight
+from schemas.contact import MAX_BATCH_SIZE, ContactCreateDB
+from schemas.source import SourceWeightCreate
+from services import distribution as distribution_module
+from services.distribution import DistributionService, distribution_service
+from services.routing_index import RoutingIndex, routing_index
+from services.strategies import AliasTable
 
 
 class TestDistributionLogic:
@@ -270,3 +288,342 @@ class TestDistributionLogic:
         ]
 
         assert len(user_leads) == 1
+
+
+class TestSelectOperatorQueries:
+    """Тесты стоимости выбора оператора в SQL-запросах"""
+
+    @staticmethod
+    def _make_source(db, operators_count, max_load=10):
+        source = Source(name="Бот", bot_token=f"bot_queries_{operators_count}")
+        db.add(source)
+        db.flush()
+        for i in range(operators_count):
+            operator = Operator(
+                name=f"Оператор {i}",
+                email=f"queries_{operators_count}_{i}@test.com",
+                max_load=max_load,
+            )
+            db.add(operator)
+            db.flush()
+            db.add(SourceWeight(source_id=source.id, operator_id=operator.id, weight=1))
+        db.commit()
+        return source
+
+    def test_statement_count_is_constant(self, db):
+        """Выбор оператора выполняет один запрос независимо от числа операторов"""
+        small_id = self._make_source(db, 3).id
+        large_id = self._make_source(db, 60).id
+        # Прогреваем таблицы маршрутизации
+        distribution_service.select_operator(db, small_id)
+        distribution_service.select_operator(db, large_id)
+
+        with count_statements(db) as small_counter:
+            assert distribution_service.select_operator(db, small_id) is not None
+        with count_statements(db) as large_counter:
+            assert distribution_service.select_operator(db, large_id) is not None
+
+        assert small_counter.count == large_counter.count == 1
+
+    def test_candidates_filtered(self, db):
+        """В кандидаты не попадают неактивные, перегруженные и исключенные"""
+        source = self._make_source(db, 4, max_load=1)
+        operators = db.query(Operator).order_by(Operator.id).all()
+        operators[0].is_active = False
+        operators[1].active_load = 1
+        db.commit()
+
+        candidates = operator_crud.get_candidates_for_source(
+            db, source.id, exclude_operator_id=operators[2].id
+        )
+
+        assert [op.id for op, _, _ in candidates] == [operators[3].id]
+        assert candidates[0][1:] == (1, 0)
+
+
+class TestRoutingIndex:
+    """Тесты кэша таблиц маршрутизации"""
+
+    def test_alias_table_follows_weights(self):
+        """Частоты выбора по таблице псевдонимов соответствуют весам"""
+        table = AliasTable([70, 20, 10])
+        rng = random.Random(42)
+        counts = [0, 0, 0]
+        for _ in range(20000):
+            counts[table.sample(rng)] += 1
+
+        shares = [count / 20000 for count in counts]
+        assert shares == pytest.approx([0.7, 0.2, 0.1], abs=0.02)
+
+    def test_invalidated_by_weight_changes(self, db):
+        """Добавление и удаление веса перестраивает таблицу источника"""
+        source_id = TestSelectOperatorQueries._make_source(db, 2).id
+        operator = Operator(name="Новый", email="routing_new@test.com")
+        db.add(operator)
+        db.commit()
+        assert len(routing_index.get_route(db, source_id).entries) == 2
+
+        source_crud.add_weight(
+            db, source_id, SourceWeightCreate(operator_id=operator.id, weight=5)
+        )
+        assert len(routing_index.get_route(db, source_id).entries) == 3
+
+        source_crud.remove_weight(db, source_id, operator.id)
+        assert len(routing_index.get_route(db, source_id).entries) == 2
+
+    def test_invalidated_by_operator_deactivation(self, db):
+        """Деактивация оператора исключает его из таблицы"""
+        source_id = TestSelectOperatorQueries._make_source(db, 2).id
+        routing_index.get_route(db, source_id)
+        version = routing_index.version
+
+        operator = db.query(Operator).order_by(Operator.id).first()
+        operator_crud.update(db, db_obj=operator, obj_in={"is_active": False})
+
+        assert routing_index.version > version
+        entries = routing_index.get_route(db, source_id).entries
+        assert operator.id not in [entry.operator_id for entry in entries]
+
+    def test_full_operators_rejected_without_rebuild(self, db):
+        """Оператор на пределе пропускается без перестройки таблицы"""
+        source_id = TestSelectOperatorQueries._make_source(db, 2, max_load=1).id
+        full, free = db.query(Operator).order_by(Operator.id).all()
+        full.active_load = 1
+        db.commit()
+        version = routing_index.version
+
+        for _ in range(20):
+            assert distribution_service.select_operator(db, source_id).id == free.id
+        assert routing_index.version == version
+
+    def test_weights_changed_in_other_process(self, db):
+        """Оператор, убранный из источника другим процессом, не резервируется"""
+        source_id = TestSelectOperatorQueries._make_source(db, 1, max_load=50).id
+        added = Operator(name="Новый", email="other_process@test.com", max_load=50)
+        db.add(added)
+        db.commit()
+        (removed,) = routing_index.get_route(db, source_id).entries
+        version = routing_index.version
+        # Мимо ORM: версия кэша этого процесса не меняется
+        weights = SourceWeight.__table__
+        connection = db.connection()
+        connection.execute(weights.delete())
+        connection.execute(
+            weights.insert().values(source_id=source_id, operator_id=added.id, weight=1)
+        )
+        db.commit()
+
+        reserved = [
+            distribution_service.reserve_operator(db, source_id) for _ in range(5)
+        ]
+
+        assert reserved == [added.id] * 5
+        assert routing_index.version == version
+        # Расхождение с БД замечено: таблица перестроена по новым весам
+        route = routing_index.get_route(db, source_id)
+        assert route.operator_ids == {added.id} != {removed.operator_id}
+
+    def test_missing_sources_not_cached(self, db):
+        """Отсутствующий источник не кэшируется и виден сразу после создания"""
+        index = RoutingIndex()
+        for source_id in range(1000, 1100):
+            assert not index.source_exists(db, source_id)
+        assert index.cached == 0
+
+        source_id = TestSelectOperatorQueries._make_source(db, 1).id
+        assert index.source_exists(db, source_id)
+        assert index.cached == 1
+
+    def test_cache_is_bounded(self, db):
+        """Сверх capacity вытесняются давно не использованные таблицы"""
+        index = RoutingIndex(capacity=2)
+        first, second, third = (
+            TestSelectOperatorQueries._make_source(db, count).id for count in (1, 2, 3)
+        )
+        index.get_route(db, first)
+        index.get_route(db, second)
+        index.get_route(db, first)
+        index.get_route(db, third)
+
+        assert index.cached == 2
+        assert list(index._routes) == [first, third]
+
+
+class TestConcurrentReservation:
+    """Нагрузочный тест резервирования слотов в нескольких потоках"""
+
+    def test_max_load_never_exceeded(self, file_session_factory):
+        """Параллельное создание контактов не превышает max_load операторов"""
+        threads_count = 8
+        contacts_per_thread = 20
+
+        with file_session_factory() as db:
+            source = Source(name="Стресс", bot_token="bot_stress")
+            db.add(source)
+            db.flush()
+            for i in range(3):
+                operator = Operator(
+                    name=f"Оператор {i}", email=f"stress_{i}@test.com", max_load=5
+                )
+                db.add(operator)
+                db.flush()
+                db.add(
+                    SourceWeight(source_id=source.id, operator_id=operator.id, weight=1)
+                )
+            lead = Lead(external_id="stress_lead")
+            db.add(lead)
+            db.commit()
+            source_id, lead_id = source.id, lead.id
+
+        barrier = threading.Barrier(threads_count)
+        errors = []
+
+        def worker():
+            barrier.wait()
+            for _ in range(contacts_per_thread):
+                with file_session_factory() as session:
+                    try:
+                        operator_id = distribution_service.reserve_operator(
+                            session, source_id
+                        )
+                        contact_crud.create(
+                            session,
+                            obj_in=ContactCreateDB(
+                                lead_id=lead_id,
+                                source_id=source_id,
+                                operator_id=operator_id,
+                            ),
+                            load_reserved=True,
+                        )
+                    except Exception as exc:  # noqa: BLE001
+                        errors.append(exc)
+
+        threads = [threading.Thread(target=worker) for _ in range(threads_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        with file_session_factory() as db:
+            loads = dict(
+                db.query(Contact.operator_id, func.count(Contact.id))
+                .filter(Contact.operator_id.isnot(None), Contact.is_active)
+                .group_by(Contact.operator_id)
+                .all()
+            )
+            operators = db.query(Operator).all()
+            assert sum(loads.values()) == 15
+            for operator in operators:
+                assert loads.get(operator.id, 0) <= operator.max_load
+                assert operator.active_load == loads.get(operator.id, 0)
+            unassigned = (
+                db.query(func.count(Contact.id))
+                .filter(Contact.operator_id.is_(None))
+                .scalar()
+            )
+            assert unassigned == threads_count * contacts_per_thread - 15
+
+
+class TestBatchDistribution:
+    """Тесты пакетного распределения"""
+
+    def test_distribute_batch_respects_capacity(self, client):
+        """Пачка распределяется в пределах емкости операторов"""
+        operators = []
+        for i, max_load in enumerate((10, 5)):
+            response = client.post(
+                "/api/v1/operators/",
+                json={
+                    "name": f"Оператор пачки {i}",
+                    "email": f"batch_{i}@test.com",
+                    "max_load": max_load,
+                },
+            )
+            operators.append(response.json())
+        source_id = client.post(
+            "/api/v1/sources/",
+            json={"name": "Пакетный бот", "bot_token": "bot_batch"},
+        ).json()["id"]
+        for operator, weight in zip(operators, (70, 30)):
+            client.post(
+                f"/api/v1/sources/{source_id}/weights",
+                json={"operator_id": operator["id"], "weight": weight},
+            )
+
+        response = client.post(
+            "/api/v1/contacts/distribute",
+            json={
+                "source_id": source_id,
+                "contacts": [
+                    {"lead_external_id": f"batch_user_{i % 12}", "message": str(i)}
+                    for i in range(20)
+                ],
+            },
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert len(data) == 20
+        assert len({contact["lead_id"] for contact in data}) == 12
+        for operator in operators:
+            assigned = [c for c in data if c["operator_id"] == operator["id"]]
+            assert len(assigned) == operator["max_load"]
+            load = client.get(f"/api/v1/operators/{operator['id']}").json()
+            assert load["current_load"] == operator["max_load"]
+        assert sum(1 for c in data if c["operator_id"] is None) == 5
+
+    def test_distribute_batch_unknown_source(self, client):
+        """Пачка для несуществующего источника"""
+        response = client.post(
+            "/api/v1/contacts/distribute",
+            json={"source_id": 999, "contacts": [{"lead_external_id": "x"}]},
+        )
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_distribute_batch_size_limit(self, client):
+        """Пачка больше MAX_BATCH_SIZE отклоняется валидацией"""
+        contacts = [{"lead_external_id": f"x{i}"} for i in range(MAX_BATCH_SIZE + 1)]
+
+        response = client.post(
+            "/api/v1/contacts/distribute",
+            json={"source_id": 1, "contacts": contacts},
+        )
+
+        assert response.status_code == 422
+
+    def test_allocate_without_numpy(self, monkeypatch):
+        """Розыгрыш на чистом Python учитывает емкость и веса"""
+        monkeypatch.setattr(distribution_module, "np", None)
+        random.seed(7)
+
+        allocation = DistributionService.allocate([1, 1, 0], [3, 100, 100], 50)
+        assert allocation == [3, 47, 0]
+
+        allocation = DistributionService.allocate([70, 30], [20000, 20000], 10000)
+        assert sum(allocation) == 10000
+        assert allocation[0] / 10000 == pytest.approx(0.7, abs=0.02)
+
+    def test_allocate_with_numpy(self):
+        """Векторизованный розыгрыш через NumPy"""
+        pytest.importorskip("numpy")
+
+        allocation = DistributionService.allocate([70, 30], [5, 1000], 100)
+        assert allocation == [5, 95]
+
+
+class TestSimulator:
+    """Дымовой тест симулятора распределения"""
+
+    def test_simulator_report(self, capsys):
+        """Симулятор прогоняет поток и считает метрики"""
+        report = simulator.main(
+            ["--operators", "5", "--sources", "2", "--contacts", "50", "--json"]
+        )
+
+        assert report["unassigned"] == 0
+        assert report["selections_per_second"] > 0
+        assert report["statements_per_selection"]["mean"] >= 1
+        assert set(report["latency_ms"]) == {"p50", "p95", "p99", "max"}
+        assert '"max_share_deviation"' in capsys.readouterr().out
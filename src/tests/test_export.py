@@ -0,0 +1,106 @@
+import csv
+import io
+import json
+
+from fastapi import status
+
+from api.pagination import NEXT_CURSOR_HEADER, encode_cursor
+from services import export as export_module
+
+
+def _setup(client, operator_source, contacts=5):
+    operator_id, source_id = operator_source(max_load=50)
+    for i in range(contacts):
+        client.post(
+            "/api/v1/contacts/",
+            json={"lead_external_id": f"export_{i}", "source_id": source_id},
+        )
+    return operator_id, source_id
+
+
+class TestExport:
+    """Тесты потоковой выгрузки контактов и лидов"""
+
+    def test_contacts_ndjson(self, client, operator_source, monkeypatch):
+        """NDJSON содержит строки с деталями, порции не зависят от размера"""
+        monkeypatch.setattr(export_module, "EXPORT_BATCH_SIZE", 2)
+        _setup(client, operator_source)
+
+        response = client.get("/api/v1/contacts/export")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [row["lead_external_id"] for row in rows] == [
+            f"export_{i}" for i in range(5)
+        ]
+        assert rows[0]["operator_name"] == "Тестовый Оператор"
+        assert rows[0]["source_name"] == "Бот"
+
+    def test_contacts_csv_with_filters_and_resume(self, client, operator_source):
+        """CSV учитывает фильтры и продолжается с курсора"""
+        _, source_id = _setup(client, operator_source)
+        client.put("/api/v1/contacts/1/close")
+
+        response = client.get(
+            "/api/v1/contacts/export",
+            params={"format": "csv", "is_active": True, "cursor": encode_cursor(2)},
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert 'filename="contacts.csv"' in response.headers["content-disposition"]
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert [int(row["id"]) for row in rows] == [3, 4, 5]
+        assert {row["source_id"] for row in rows} == {str(source_id)}
+
+    def test_leads_export(self, client, operator_source):
+        """Лиды выгружаются и продолжаются с курсора"""
+        _setup(client, operator_source, contacts=3)
+
+        response = client.get(
+            "/api/v1/leads/export", params={"cursor": encode_cursor(1)}
+        )
+
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [row["external_id"] for row in rows] == ["export_1", "export_2"]
+
+    def test_export_in_chunks(self, client, operator_source):
+        """С limit выгрузка продолжается по X-Next-Cursor, как списки"""
+        _setup(client, operator_source)
+
+        ids, params = [], {"limit": 2}
+        while True:
+            response = client.get("/api/v1/contacts/export", params=params)
+            ids += [json.loads(line)["id"] for line in response.text.splitlines()]
+            if NEXT_CURSOR_HEADER not in response.headers:
+                break
+            params["cursor"] = response.headers[NEXT_CURSOR_HEADER]
+
+        assert ids == [1, 2, 3, 4, 5]
+
+    def test_page_read_by_ids(self, client, operator_source, monkeypatch):
+        """Страница с фильтрами читается по id порциями, курсор — последний id"""
+        monkeypatch.setattr(export_module, "EXPORT_BATCH_SIZE", 2)
+        _setup(client, operator_source)
+        client.put("/api/v1/contacts/2/close")
+
+        response = client.get(
+            "/api/v1/contacts/export",
+            params={"format": "csv", "is_active": True, "limit": 3},
+        )
+
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert [int(row["id"]) for row in rows] == [1, 3, 4]
+        assert response.headers[NEXT_CURSOR_HEADER] == encode_cursor(4)
+
+    def test_invalid_cursor(self, client):
+        """Непрозрачный курсор проверяется так же, как у списков"""
+        response = client.get("/api/v1/leads/export", params={"cursor": "1"})
+
+        assert response.status_code == 400
+
+    def test_unknown_format(self, client):
+        """Неизвестный формат не проходит валидацию"""
+        response = client.get("/api/v1/leads/export", params={"format": "xml"})
+
+        assert response.status_code == 422
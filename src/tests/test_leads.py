@@ -1,5 +1,10 @@
+import threading
+
 from fastapi import status
 
+from crud.lead import lead as lead_crud
+from models import Lead
+
 
 class TestLeads:
     """Тесты для эндпоинтов лидов"""
@@ -118,3 +123,82 @@ class TestLeads:
         response = client.put("/api/v1/leads/999", json=update_data)
 
         assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+class TestLeadPagination:
+    """Тесты курсорной пагинации списков"""
+
+    def test_cursor_walks_all_pages(self, client):
+        """Курсоры обходят весь список без пропусков и повторов"""
+        for i in range(5):
+            client.post("/api/v1/leads/", json={"external_id": f"page_{i}"})
+
+        seen = []
+        params = {"limit": 2}
+        while True:
+            response = client.get("/api/v1/leads/", params=params)
+            assert response.status_code == status.HTTP_200_OK
+            seen.extend(lead["external_id"] for lead in response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                break
+            params = {"limit": 2, "cursor": cursor}
+
+        assert seen == [f"page_{i}" for i in range(5)]
+
+    def test_invalid_cursor(self, client):
+        """Поврежденный курсор — 400"""
+        response = client.get("/api/v1/leads/", params={"cursor": "garbage"})
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_page_size_is_bounded(self, client):
+        """Размер страницы ограничен сверху"""
+        response = client.get("/api/v1/leads/", params={"limit": 100000})
+
+        assert response.status_code == 422
+
+
+class TestLeadGetOrCreate:
+    """Тесты поиска или создания лида"""
+
+    def test_defaults_apply_only_to_new_lead(self, db):
+        """Повторный вызов возвращает ту же строку и не меняет данные"""
+        first = lead_crud.get_or_create_by_external_id(
+            db, "upsert_lead", defaults={"phone": "+7001"}
+        )
+        second = lead_crud.get_or_create_by_external_id(
+            db, "upsert_lead", defaults={"phone": "+7002"}
+        )
+
+        assert second.id == first.id
+        assert second.phone == "+7001"
+
+    def test_concurrent_first_contacts(self, file_session_factory):
+        """Одновременные первые обращения одного лида не конфликтуют"""
+        threads_count = 16
+        barrier = threading.Barrier(threads_count)
+        ids, errors = [], []
+
+        def worker():
+            with file_session_factory() as session:
+                barrier.wait()
+                try:
+                    lead = lead_crud.get_or_create_by_external_id(
+                        session, "race_lead", defaults={"full_name": "Гонка"}
+                    )
+                    ids.append(lead.id)
+                except Exception as exc:  # noqa: BLE001
+                    errors.append(exc)
+
+        threads = [threading.Thread(target=worker) for _ in range(threads_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        assert len(ids) == threads_count
+        assert len(set(ids)) == 1
+        with file_session_factory() as db:
+            assert db.query(Lead).filter(Lead.external_id == "race_lead").count() == 1
@@ -1,5 +1,10 @@
 from fastapi import status
 
+from crud.operator import operator as operator_crud
+from database import SessionLocal, count_statements
+from models import Contact, Lead, Operator, PendingAssignment, Source, SourceWeight
+from services.distribution import distribution_service
+
 
 class TestOperators:
     """Тесты для эндпоинтов операторов"""
@@ -220,3 +225,138 @@ class TestOperators:
         response = client.delete("/api/v1/operators/999")
 
         assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_reconcile_load(self, client, operator_source):
+        """Тест пересчета счетчика нагрузки после рассинхронизации"""
+        operator_id, source_id = operator_source(weight=100)
+        for i in range(2):
+            client.post(
+                "/api/v1/contacts/",
+                json={"lead_external_id": f"reconcile_{i}", "source_id": source_id},
+            )
+
+        # Портим счетчик в обход API
+        with SessionLocal() as db:
+            db.query(Operator).filter(Operator.id == operator_id).update(
+                {Operator.active_load: 7}
+            )
+            db.commit()
+
+        response = client.post("/api/v1/operators/reconcile-load")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == [
+            {"operator_id": operator_id, "recorded_load": 7, "actual_load": 2}
+        ]
+        assert (
+            client.get(f"/api/v1/operators/{operator_id}").json()["current_load"] == 2
+        )
+        assert client.post("/api/v1/operators/reconcile-load").json() == []
+
+
+class TestOperatorDrain:
+    """Тесты перераспределения обращений при выводе оператора"""
+
+    def _setup(self, client, operator_source):
+        leaving, source_id = operator_source(max_load=5)
+        staying = client.post(
+            "/api/v1/operators/",
+            json={"name": "Остающийся", "email": "staying@test.com", "max_load": 2},
+        ).json()["id"]
+        contacts = [
+            client.post(
+                "/api/v1/contacts/",
+                json={"lead_external_id": f"drain_{i}", "source_id": source_id},
+            ).json()
+            for i in range(3)
+        ]
+        assert all(c["operator_id"] == leaving for c in contacts)
+        client.post(
+            f"/api/v1/sources/{source_id}/weights",
+            json={"operator_id": staying, "weight": 1},
+        )
+        return leaving, staying, contacts
+
+    def _load(self, client, operator_id):
+        return client.get(f"/api/v1/operators/{operator_id}").json()["current_load"]
+
+    def test_deactivation_drains_contacts(self, client, operator_source):
+        """Деактивация переносит обращения на других операторов источника"""
+        leaving, staying, _ = self._setup(client, operator_source)
+
+        response = client.put(f"/api/v1/operators/{leaving}", json={"is_active": False})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert self._load(client, leaving) == 0
+        assert self._load(client, staying) == 2
+        by_operator = client.get(f"/api/v1/contacts/by-operator/{staying}").json()
+        assert len(by_operator) == 2
+        with SessionLocal() as db:
+            assert db.query(PendingAssignment).count() == 1
+
+    def test_drain_endpoint(self, client, operator_source):
+        """Ручное перераспределение возвращает сводку"""
+        leaving, staying, _ = self._setup(client, operator_source)
+
+        response = client.post(f"/api/v1/operators/{leaving}/drain")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {
+            "operator_id": leaving,
+            "moved": 2,
+            "unassignable": 1,
+        }
+        assert self._load(client, staying) == 2
+        assert client.post("/api/v1/operators/reconcile-load").json() == []
+
+    def test_delete_drains_and_removes_weights(self, client, operator_source):
+        """Удаление оператора переносит обращения и удаляет его веса"""
+        leaving, staying, contacts = self._setup(client, operator_source)
+        client.put(f"/api/v1/contacts/{contacts[0]['id']}/close")
+
+        response = client.delete(f"/api/v1/operators/{leaving}")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["moved"] == 2
+        assert response.json()["unassignable"] == 0
+        assert self._load(client, staying) == 2
+        source = client.get("/api/v1/sources/").json()[0]
+        weights = client.get(f"/api/v1/sources/{source['id']}").json()["weights"]
+        assert [w["operator_id"] for w in weights] == [staying]
+        # В истории закрытого обращения ссылка на оператора обнулена
+        closed = next(
+            c
+            for c in client.get("/api/v1/contacts/").json()
+            if c["id"] == contacts[0]["id"]
+        )
+        assert closed["operator_id"] is None
+
+    def test_drain_statement_count_is_set_based(self, db):
+        """Число SQL-выражений не растет линейно с числом обращений"""
+        source = Source(name="Бот", bot_token="bot_drain_many")
+        leaving = Operator(name="Уходящий", email="many@test.com", max_load=5000)
+        staying = Operator(name="Остающийся", email="many2@test.com", max_load=5000)
+        lead = Lead(external_id="drain_many")
+        db.add_all([source, leaving, staying, lead])
+        db.flush()
+        db.add_all(
+            [
+                SourceWeight(source_id=source.id, operator_id=leaving.id, weight=1),
+                SourceWeight(source_id=source.id, operator_id=staying.id, weight=1),
+            ]
+        )
+        db.add_all(
+            Contact(lead_id=lead.id, source_id=source.id, operator_id=leaving.id)
+            for _ in range(1200)
+        )
+        leaving.active_load = 1200
+        db.commit()
+        leaving_id, staying_id = leaving.id, staying.id
+
+        with count_statements(db) as counter:
+            summary = distribution_service.drain_operator(db, leaving_id)
+
+        assert summary == {"moved": 1200, "unassignable": 0}
+        assert counter.count < 15
+        assert operator_crud.get(db, id=staying_id).active_load == 1200
+        assert operator_crud.get(db, id=leaving_id).active_load == 0
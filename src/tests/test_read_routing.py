@@ -0,0 +1,85 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+import database
+from config import settings
+from database import Base, apply_sqlite_profile, sqlite_read_profile
+from main import create_app
+from models import Operator
+
+
+@pytest.fixture
+def replica(tmp_path):
+    """Реплика с отстающими данными: один оператор, которого нет в основной БД"""
+    url = f"sqlite:///{tmp_path / 'replica.db'}"
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        db.add(Operator(name="Реплика", email="replica@example.com", max_load=1))
+        db.commit()
+    engine.dispose()
+
+    read_engine = create_engine(url, connect_args={"check_same_thread": False})
+    apply_sqlite_profile(read_engine, sqlite_read_profile())
+    yield sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+    read_engine.dispose()
+
+
+@pytest.fixture
+def routed_client(replica, monkeypatch):
+    """Клиент приложения с движком чтения, указывающим на реплику"""
+    monkeypatch.setattr(settings, "read_database_url", "sqlite:///replica.db")
+    monkeypatch.setattr(database, "ReadSessionLocal", replica)
+    Base.metadata.create_all(bind=database.engine)
+    with TestClient(create_app()) as client:
+        yield client
+    Base.metadata.drop_all(bind=database.engine)
+
+
+def operator_names(client, **kwargs):
+    return [
+        operator["name"]
+        for operator in client.get("/api/v1/operators/", **kwargs).json()
+    ]
+
+
+class TestReadRouting:
+    """Тесты маршрутизации чтения на движок чтения"""
+
+    def test_reads_go_to_read_engine(self, routed_client, sample_operator_data):
+        """GET читает реплику, запись идет в основную БД"""
+        assert operator_names(routed_client) == ["Реплика"]
+
+        response = routed_client.post("/api/v1/operators/", json=sample_operator_data)
+        assert response.status_code == 200
+        assert "X-Last-Write" in response.headers
+
+        # Клиент только что писал: читает свою запись из основной БД
+        assert operator_names(routed_client) == [sample_operator_data["name"]]
+        # Другой клиент без метки записи читает реплику
+        routed_client.cookies.clear()
+        assert operator_names(routed_client) == ["Реплика"]
+        # Метку можно передать заголовком
+        assert operator_names(
+            routed_client, headers={"X-Last-Write": response.headers["X-Last-Write"]}
+        ) == [sample_operator_data["name"]]
+
+    def test_stale_mark_reads_replica(self, routed_client, monkeypatch):
+        """После окна READ_YOUR_WRITES_SECONDS чтение снова идет в реплику"""
+        monkeypatch.setattr(settings, "read_your_writes_seconds", 0)
+        routed_client.post(
+            "/api/v1/operators/",
+            json={"name": "Новый", "email": "new@example.com", "max_load": 1},
+        )
+
+        assert operator_names(routed_client) == ["Реплика"]
+
+    def test_read_engine_is_read_only(self, replica):
+        """Движок чтения не принимает запись"""
+        with replica() as db:
+            db.add(Operator(name="Запись", email="write@example.com", max_load=1))
+            with pytest.raises(OperationalError):
+                db.commit()
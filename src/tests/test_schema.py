@@ -0,0 +1,105 @@
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import sessionmaker
+
+from crud.operator import operator as operator_crud
+from database import Base, upgrade_schema
+from models.operator import Operator
+from models.source import Source
+
+# Таблицы в том виде, в котором их создавала первая версия
+LEGACY_SCHEMA = (
+    """CREATE TABLE leads (
+        external_id VARCHAR NOT NULL, phone VARCHAR, email VARCHAR,
+        full_name VARCHAR, notes TEXT, id INTEGER NOT NULL,
+        created_at DATETIME NOT NULL, updated_at DATETIME NOT NULL,
+        PRIMARY KEY (id))""",
+    """CREATE TABLE operators (
+        name VARCHAR NOT NULL, email VARCHAR NOT NULL, is_active BOOLEAN,
+        max_load INTEGER, id INTEGER NOT NULL,
+        created_at DATETIME NOT NULL, updated_at DATETIME NOT NULL,
+        PRIMARY KEY (id))""",
+    """CREATE TABLE sources (
+        name VARCHAR NOT NULL, bot_token VARCHAR NOT NULL, description VARCHAR,
+        id INTEGER NOT NULL,
+        created_at DATETIME NOT NULL, updated_at DATETIME NOT NULL,
+        PRIMARY KEY (id), UNIQUE (bot_token))""",
+    """CREATE TABLE contacts (
+        lead_id INTEGER NOT NULL, source_id INTEGER NOT NULL,
+        operator_id INTEGER, message TEXT, status VARCHAR, is_active BOOLEAN,
+        id INTEGER NOT NULL,
+        created_at DATETIME NOT NULL, updated_at DATETIME NOT NULL,
+        PRIMARY KEY (id))""",
+    (
+        "INSERT INTO leads VALUES ('lead_1', NULL, NULL, NULL, NULL, 1, "
+        "'2024-01-01', '2024-01-01')"
+    ),
+    (
+        "INSERT INTO operators VALUES ('Оператор', 'op@example.com', 1, 10, 1, "
+        "'2024-01-01', '2024-01-01')"
+    ),
+    "INSERT INTO sources VALUES ('Бот', 'bot_1', NULL, 1, '2024-01-01', '2024-01-01')",
+    (
+        "INSERT INTO contacts VALUES (1, 1, 1, NULL, 'active', 1, 1, "
+        "'2024-01-01', '2024-01-01')"
+    ),
+    (
+        "INSERT INTO contacts VALUES (1, 1, 1, NULL, 'active', 1, 2, "
+        "'2024-01-01', '2024-01-01')"
+    ),
+    (
+        "INSERT INTO contacts VALUES (1, 1, 1, NULL, 'closed', 0, 3, "
+        "'2024-01-01', '2024-01-01')"
+    ),
+)
+
+
+class TestUpgradeSchema:
+    """Тесты обновления схемы базы, созданной прежней версией"""
+
+    def _legacy_engine(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+        with engine.begin() as connection:
+            for statement in LEGACY_SCHEMA:
+                connection.exec_driver_sql(statement)
+        return engine
+
+    def test_adds_columns_and_indexes(self, tmp_path):
+        """Недостающие колонки и индексы добавляются, повторный вызов — пустой"""
+        engine = self._legacy_engine(tmp_path)
+        try:
+            Base.metadata.create_all(bind=engine)
+            added = upgrade_schema(engine)
+
+            assert "operators.active_load" in added
+            assert "sources.routing_strategy" in added
+            assert upgrade_schema(engine) == []
+            indexes = {
+                index["name"] for index in inspect(engine).get_indexes("contacts")
+            }
+            assert {
+                "ix_contacts_lead_id_id",
+                "ix_contacts_operator_id_is_active",
+                "ix_contacts_status_created_at",
+            } <= indexes
+        finally:
+            engine.dispose()
+
+    def test_existing_rows_get_defaults_and_load(self, tmp_path):
+        """Старые строки получают значения по умолчанию, нагрузка пересчитывается"""
+        engine = self._legacy_engine(tmp_path)
+        try:
+            Base.metadata.create_all(bind=engine)
+            upgrade_schema(engine)
+            with sessionmaker(bind=engine)() as db:
+                assert db.get(Operator, 1).active_load == 0
+                assert db.get(Source, 1).routing_strategy == "random"
+
+                drift = operator_crud.reconcile_load(db)
+
+                assert drift == [
+                    {"operator_id": 1, "recorded_load": 0, "actual_load": 2}
+                ]
+                db.expire_all()
+                assert db.get(Operator, 1).active_load == 2
+        finally:
+            engine.dispose()
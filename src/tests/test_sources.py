@@ -29,6 +29,29 @@ class TestSources:
         assert response.status_code == status.HTTP_400_BAD_REQUEST
         assert "already exists" in response.json()["detail"]
 
+    def test_update_source_duplicate_bot_token(self, client, sample_source_data):
+        """Тест обновления источника на bot_token другого источника"""
+        client.post("/api/v1/sources/", json=sample_source_data)
+        other = client.post(
+            "/api/v1/sources/",
+            json={**sample_source_data, "bot_token": "other_bot_token"},
+        ).json()
+
+        response = client.put(
+            f"/api/v1/sources/{other['id']}",
+            json={"bot_token": sample_source_data["bot_token"]},
+        )
+        # Собственный токен можно передать повторно
+        same = client.put(
+            f"/api/v1/sources/{other['id']}",
+            json={"bot_token": "other_bot_token", "name": "Новое имя"},
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "already exists" in response.json()["detail"]
+        assert same.status_code == status.HTTP_200_OK
+        assert same.json()["name"] == "Новое имя"
+
     def test_get_sources(self, client, sample_source_data):
         """Тест получения списка источников"""
         # Создаем несколько источников
@@ -0,0 +1,272 @@
+import json
+import time
+from datetime import UTC, datetime, timedelta
+
+import pytest
+
+from models import Contact, Operator, Source, SourceWeight
+from models.spool_receipt import SpoolReceipt
+from schemas.contact import ContactCreate
+from services import spool as spool_module
+from services.spool import MAX_APPLY_ATTEMPTS, IngestionSpool, contact_spool
+
+
+@pytest.fixture
+def seeded_factory(file_session_factory):
+    """Файловая БД с источником и оператором"""
+    with file_session_factory() as db:
+        source = Source(name="Бот", bot_token="bot_spool")
+        operator = Operator(name="Оператор", email="spool@example.com", max_load=10)
+        db.add_all([source, operator])
+        db.flush()
+        db.add(SourceWeight(source_id=source.id, operator_id=operator.id, weight=1))
+        db.commit()
+        source_id = source.id
+    file_session_factory.source_id = source_id
+    return file_session_factory
+
+
+def make_contact(source_id, external_id="spool_lead"):
+    return ContactCreate(lead_external_id=external_id, source_id=source_id)
+
+
+class TestIngestionSpool:
+    """Тесты журнала приема обращений"""
+
+    def test_submit_and_apply(self, tmp_path, seeded_factory):
+        """Обращение подтверждается до записи в БД и применяется applier'ом"""
+        spool = IngestionSpool(tmp_path / "spool.log", seeded_factory)
+        spool.start(background=False)
+        tracking_id = spool.submit(make_contact(seeded_factory.source_id))
+
+        with seeded_factory() as db:
+            assert spool.status(db, tracking_id).status == "pending"
+            assert db.query(Contact).count() == 0
+
+        assert spool.apply_pending() == 1
+        with seeded_factory() as db:
+            status = spool.status(db, tracking_id)
+            assert status.status == "applied"
+            contact = db.get(Contact, status.contact_id)
+            assert contact.operator_id is not None
+            assert spool.status(db, "unknown") is None
+        spool.stop()
+        assert (tmp_path / "spool.log").stat().st_size == 0
+
+    def test_failed_entry(self, tmp_path, seeded_factory):
+        """Ошибка обращения записывается в квитанцию"""
+        spool = IngestionSpool(tmp_path / "spool.log", seeded_factory)
+        spool.start(background=False)
+        tracking_id = spool.submit(make_contact(999))
+        spool.stop()
+
+        with seeded_factory() as db:
+            status = spool.status(db, tracking_id)
+            assert status.status == "failed"
+            assert status.error == "Source not found"
+
+    def test_replay_after_crash(self, tmp_path, seeded_factory):
+        """Непримененные записи восстанавливаются, оборванная запись отбрасывается"""
+        path = tmp_path / "spool.log"
+        crashed = IngestionSpool(path, seeded_factory)
+        crashed.start(background=False)
+        ids = [
+            crashed.submit(make_contact(seeded_factory.source_id, f"crash_{i}"))
+            for i in range(3)
+        ]
+        # Процесс упал посреди записи: applier не успел, последняя строка оборвана
+        with open(path, "ab") as journal:
+            journal.write(b'{"tracking_id": "torn", "cont')
+        # При падении ОС закрывает файлы процесса и снимает блокировку журнала
+        crashed._file.close()
+        crashed._lock_file.close()
+
+        spool = IngestionSpool(path, seeded_factory)
+        assert spool.start(background=False) == 3
+        spool.stop()
+
+        with seeded_factory() as db:
+            assert [spool.status(db, i).status for i in ids] == ["applied"] * 3
+            assert db.query(Contact).count() == 3
+
+    def test_replay_is_idempotent(self, tmp_path, seeded_factory):
+        """Запись, примененная до сбоя, не применяется повторно"""
+        path = tmp_path / "spool.log"
+        spool = IngestionSpool(path, seeded_factory)
+        spool.start(background=False)
+        tracking_id = spool.submit(make_contact(seeded_factory.source_id))
+        journal = path.read_bytes()
+        spool.stop()
+        # Сбой после коммита, но до обнуления журнала
+        path.write_bytes(journal)
+
+        replayed = IngestionSpool(path, seeded_factory)
+        assert replayed.start(background=False) == 1
+        replayed.stop()
+
+        with seeded_factory() as db:
+            assert db.query(Contact).count() == 1
+            assert db.query(SpoolReceipt).count() == 1
+            assert json.loads(journal)["tracking_id"] == tracking_id
+
+    def test_journal_per_process(self, tmp_path, seeded_factory):
+        """Процессы с общим spool_path пишут в разные журналы"""
+        path = tmp_path / "spool.log"
+        first = IngestionSpool(path, seeded_factory)
+        second = IngestionSpool(path, seeded_factory)
+        first.start(background=False)
+        second.start(background=False)
+        assert second.journal_path == tmp_path / "spool.log.1"
+
+        second.submit(make_contact(seeded_factory.source_id, "second"))
+        first.submit(make_contact(seeded_factory.source_id, "first"))
+        # Обнуление журнала первого процесса не теряет запись второго
+        assert first.apply_pending() == 1
+        assert path.stat().st_size == 0
+        assert second.journal_path.stat().st_size > 0
+        second.stop()
+        first.stop()
+
+        with seeded_factory() as db:
+            assert db.query(Contact).count() == 2
+
+    def test_status_from_other_journal(self, tmp_path, seeded_factory):
+        """Запись, еще не примененная другим процессом, в статусе pending"""
+        path = tmp_path / "spool.log"
+        first = IngestionSpool(path, seeded_factory)
+        second = IngestionSpool(path, seeded_factory)
+        first.start(background=False)
+        second.start(background=False)
+        tracking_id = second.submit(make_contact(seeded_factory.source_id))
+        assert tracking_id.startswith("1-")
+
+        with seeded_factory() as db:
+            assert first.status(db, tracking_id).status == "pending"
+            assert first.status(db, "1-" + "0" * 32) is None
+            assert first.status(db, "99-" + "0" * 32) is None
+        second.stop()
+        with seeded_factory() as db:
+            assert first.status(db, tracking_id).status == "applied"
+        first.stop()
+
+    def test_journal_compacted_under_load(self, tmp_path, seeded_factory, monkeypatch):
+        """Журнал, который не пустеет, сжимается до непримененных записей"""
+        ingest_batch = spool_module.ingest_batch
+
+        def failing_ingest(db, contacts):
+            if any(c.lead_external_id == "stuck" for c in contacts):
+                raise RuntimeError("stuck")
+            return ingest_batch(db, contacts)
+
+        monkeypatch.setattr(spool_module, "ingest_batch", failing_ingest)
+        monkeypatch.setattr(spool_module, "MAX_APPLY_ATTEMPTS", 1000)
+        monkeypatch.setattr(spool_module, "COMPACT_MIN_BYTES", 1024)
+        path = tmp_path / "spool.log"
+        spool = IngestionSpool(path, seeded_factory)
+        spool.start(background=False)
+        stuck = spool.submit(make_contact(seeded_factory.source_id, "stuck"))
+        for round_ in range(10):
+            for i in range(10):
+                spool.submit(make_contact(seeded_factory.source_id, f"l{round_}_{i}"))
+            spool.apply_pending()
+            # Очередь не пустеет, но журнал не растет без предела
+            assert path.stat().st_size < 4096
+        spool.stop()
+
+        replayed = IngestionSpool(path, seeded_factory)
+        assert replayed.start(background=False) == 1
+        with seeded_factory() as db:
+            assert replayed.status(db, stuck).status == "pending"
+            assert db.query(Contact).count() == 100
+        replayed.stop()
+
+    def test_poison_entry_dead_lettered(self, tmp_path, seeded_factory, monkeypatch):
+        """Запись, падающая при доступной БД, не держит остальные и уходит в .dead"""
+        ingest_batch = spool_module.ingest_batch
+
+        def failing_ingest(db, contacts):
+            if any(c.lead_external_id == "poison" for c in contacts):
+                raise RuntimeError("poison")
+            return ingest_batch(db, contacts)
+
+        monkeypatch.setattr(spool_module, "ingest_batch", failing_ingest)
+        spool = IngestionSpool(tmp_path / "spool.log", seeded_factory)
+        spool.start(background=False)
+        poison = spool.submit(make_contact(seeded_factory.source_id, "poison"))
+        healthy = spool.submit(make_contact(seeded_factory.source_id, "healthy"))
+
+        assert spool.apply_pending() == 1
+        with seeded_factory() as db:
+            assert spool.status(db, healthy).status == "applied"
+            assert spool.status(db, poison).status == "pending"
+
+        for _ in range(MAX_APPLY_ATTEMPTS - 1):
+            spool.apply_pending()
+        spool.stop()
+
+        with seeded_factory() as db:
+            assert spool.status(db, poison).status == "failed"
+        dead = (tmp_path / "spool.log.dead").read_bytes().splitlines()
+        assert [json.loads(line)["tracking_id"] for line in dead] == [poison]
+        assert (tmp_path / "spool.log").stat().st_size == 0
+
+    def test_purge_receipts(self, tmp_path, seeded_factory):
+        """Квитанции старше срока хранения удаляются"""
+        now = datetime.now(UTC).replace(tzinfo=None)
+        with seeded_factory() as db:
+            db.add_all(
+                [
+                    SpoolReceipt(
+                        tracking_id="old", error="x", created_at=now - timedelta(days=8)
+                    ),
+                    SpoolReceipt(tracking_id="new", error="x", created_at=now),
+                ]
+            )
+            db.commit()
+
+        spool = IngestionSpool(tmp_path / "spool.log", seeded_factory)
+        with seeded_factory() as db:
+            assert spool.purge_receipts(db, now) == 1
+            assert [r.tracking_id for r in db.query(SpoolReceipt)] == ["new"]
+
+
+class TestSpoolEndpoints:
+    """Тесты API журнала приема"""
+
+    def test_spool_disabled(self, client):
+        """Без настроенного журнала прием через него недоступен"""
+        response = client.post(
+            "/api/v1/contacts/spool", json={"lead_external_id": "x", "source_id": 1}
+        )
+
+        assert response.status_code == 503
+
+    def test_spool_roundtrip(self, client, tmp_path, operator_source):
+        """Принятое обращение появляется в БД и получает статус applied"""
+        operator_id, source_id = operator_source()
+
+        contact_spool.configure(tmp_path / "spool.log")
+        contact_spool.start()
+        try:
+            response = client.post(
+                "/api/v1/contacts/spool",
+                json={"lead_external_id": "spool_api", "source_id": source_id},
+            )
+            assert response.status_code == 202
+            tracking_id = response.json()["tracking_id"]
+
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline:
+                status = client.get(f"/api/v1/contacts/spool/{tracking_id}").json()
+                if status["status"] != "pending":
+                    break
+                time.sleep(0.01)
+        finally:
+            contact_spool.stop()
+
+        assert status["status"] == "applied"
+        contacts = client.get("/api/v1/contacts/").json()
+        assert [(c["id"], c["operator_id"]) for c in contacts] == [
+            (status["contact_id"], operator_id)
+        ]
+        assert client.get("/api/v1/contacts/spool/unknown").status_code == 404
@@ -0,0 +1,42 @@
+from sqlalchemy import create_engine
+
+from benchmarks import sqlite_profiles
+from config import Settings
+from database import apply_sqlite_profile, sqlite_pragma_report, sqlite_profile
+
+
+class TestSqliteProfile:
+    """Тесты профиля PRAGMA SQLite"""
+
+    def test_profile_applied_on_connect(self, tmp_path):
+        """PRAGMA профиля действуют в каждом подключении"""
+        profile = sqlite_profile(
+            Settings(sqlite_synchronous="full", sqlite_busy_timeout_ms=1234)
+        )
+        engine = create_engine(f"sqlite:///{tmp_path / 'profile.db'}")
+        apply_sqlite_profile(engine, profile)
+        try:
+            report = sqlite_pragma_report(engine)
+        finally:
+            engine.dispose()
+
+        assert report == {
+            "busy_timeout": 1234,
+            "journal_mode": "wal",
+            "synchronous": "full",
+            "mmap_size": 256 * 1024 * 1024,
+            "cache_size": -64000,
+            "temp_store": "memory",
+        }
+
+    def test_benchmark_report(self, capsys):
+        """Бенчмарк профилей прогоняет поток из нескольких потоков"""
+        reports = sqlite_profiles.main(
+            ["--contacts", "40", "--threads", "4", "--profile", "settings", "--json"]
+        )
+
+        assert [report["profile"] for report in reports] == ["settings"]
+        assert reports[0]["created"] == 40
+        assert reports[0]["errors"] == 0
+        assert reports[0]["pragmas"]["journal_mode"] == "wal"
+        assert '"ingest_per_second"' in capsys.readouterr().out
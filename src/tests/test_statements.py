@@ -0,0 +1,91 @@
+from sqlalchemy import event
+
+from benchmarks import statements as statements_benchmark
+from crud import statements
+from crud.lead import lead as lead_crud
+from crud.operator import operator as operator_crud
+from crud.source import source as source_crud
+from models.lead import Lead
+from models.operator import Operator
+from models.source import Source, SourceWeight
+
+
+class TestStatementRegistry:
+    """Тесты реестра готовых выражений горячих запросов"""
+
+    def _seed(self, db):
+        source = Source(name="Источник", bot_token="registry_bot")
+        operator = Operator(name="Оператор", email="registry@example.com", max_load=2)
+        db.add_all([source, operator, Lead(external_id="registry_lead")])
+        db.flush()
+        db.add(SourceWeight(source_id=source.id, operator_id=operator.id, weight=5))
+        db.commit()
+        return source, operator
+
+    def test_cache_key_is_memoized(self):
+        """Ключ кэша выражения вычисляется один раз и не зависит от параметров"""
+        for stmt in (
+            statements.LEAD_BY_EXTERNAL_ID,
+            statements.SOURCE_BY_BOT_TOKEN,
+            statements.OPERATOR_BY_ID,
+            statements.SOURCE_CANDIDATES,
+        ):
+            assert stmt._generate_cache_key() is stmt._generate_cache_key()
+
+    def test_repeated_calls_hit_compiled_cache(self, db):
+        """Повторные вызовы берут скомпилированное выражение из кэша движка"""
+        source, operator = self._seed(db)
+        hits = []
+
+        def lookups():
+            for value in ("registry_lead", "missing"):
+                lead_crud.get_by_external_id(db, value)
+                source_crud.get_by_bot_token(db, value)
+            operator_crud.get_with_load(db, operator.id)
+            operator_crud.get_candidates_for_source(db, source.id)
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            hits.append(context.cache_hit == context.dialect.CACHE_HIT)
+
+        # Первый проход компилирует, дальше только подставляются параметры
+        lookups()
+        engine = db.get_bind()
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            lookups()
+            lookups()
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+
+        assert len(hits) == 12
+        assert all(hits)
+
+    def test_results_match_legacy_queries(self, db):
+        """Выражения реестра возвращают то же, что прежние запросы"""
+        source, operator = self._seed(db)
+
+        assert lead_crud.get_by_external_id(db, "registry_lead").external_id == (
+            "registry_lead"
+        )
+        assert source_crud.get_by_bot_token(db, "registry_bot").id == source.id
+        assert source_crud.get_by_bot_token(db, "missing") is None
+        assert operator_crud.try_reserve(db, operator.id, source_id=source.id)
+        db.expire(operator)
+        assert operator_crud.get_with_load(db, operator.id).active_load == 1
+        assert [
+            candidate.id
+            for candidate, _, _ in operator_crud.get_candidates_for_source(
+                db, source.id
+            )
+        ] == [operator.id]
+
+    def test_benchmark_report(self, capsys):
+        """Микробенчмарк сравнивает сборку Query и реестр по всем запросам"""
+        reports = statements_benchmark.main(["--calls", "20", "--json"])
+
+        assert [report["query"] for report in reports] == list(
+            statements_benchmark.CASES
+        )
+        for report in reports:
+            assert report["prepare_us"]["after"] < report["prepare_us"]["before"]
+        assert '"call_us"' in capsys.readouterr().out
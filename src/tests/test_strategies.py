@@ -0,0 +1,227 @@
+from collections import Counter
+
+from fastapi import status
+
+from services.strategies import (
+    LeastLoadedStrategy,
+    RendezvousStrategy,
+    RouteEntry,
+    SmoothWeightedRoundRobinStrategy,
+    build_strategy,
+)
+
+
+def _entries(*weights, max_load=100):
+    return [
+        RouteEntry(operator_id=i + 1, weight=weight, max_load=max_load)
+        for i, weight in enumerate(weights)
+    ]
+
+
+class TestStrategies:
+    """Тесты стратегий распределения"""
+
+    def test_smooth_wrr_interleaves(self):
+        """Плавный round-robin соблюдает веса и не выдает пачек подряд"""
+        strategy = SmoothWeightedRoundRobinStrategy(_entries(5, 1, 1), {})
+
+        picks = [strategy.pick(set()).operator_id for _ in range(14)]
+
+        # Каждый период из сумма_весов выдач содержит точные доли
+        assert Counter(picks[:7]) == {1: 5, 2: 1, 3: 1}
+        assert Counter(picks[7:]) == {1: 5, 2: 1, 3: 1}
+        # Частый оператор не получает весь период подряд
+        assert picks[:5] != [1] * 5
+
+    def test_smooth_wrr_skips_rejected(self):
+        """Занятый оператор пропускается, очередь остальных не сбивается"""
+        strategy = SmoothWeightedRoundRobinStrategy(_entries(1, 1), {})
+
+        assert [strategy.pick({1}).operator_id for _ in range(3)] == [2, 2, 2]
+        assert strategy.pick(set()).operator_id == 1
+
+    def test_smooth_wrr_matches_nginx(self):
+        """Порядок выдач совпадает с smooth WRR nginx"""
+        strategy = SmoothWeightedRoundRobinStrategy(_entries(5, 1, 1), {})
+
+        picks = [strategy.pick(set()).operator_id for _ in range(7)]
+
+        assert picks == [1, 1, 2, 1, 3, 1, 1]
+
+    def test_smooth_wrr_no_catch_up_after_reject(self):
+        """Освободившийся оператор не получает пачку обращений за пропуски"""
+        strategy = SmoothWeightedRoundRobinStrategy(_entries(1, 1), {})
+        for _ in range(20):
+            strategy.pick({1})
+
+        picks = [strategy.pick(set()).operator_id for _ in range(6)]
+
+        assert picks == [1, 2, 1, 2, 1, 2]
+
+    def test_least_loaded_prefers_lowest_load_per_weight(self):
+        """Выбирается оператор с наименьшей нагрузкой на единицу веса"""
+        strategy = LeastLoadedStrategy(_entries(1, 2, max_load=3), {1: 0, 2: 2})
+
+        picks = [strategy.pick(set()).operator_id for _ in range(4)]
+
+        # Нагрузка/вес: 0/1 < 2/2; затем 1/1 = 2/2 — выигрывает больший вес
+        assert picks == [1, 2, 1, 1]
+        assert strategy.pick(set()) is None
+
+    def test_least_loaded_release_and_reject(self):
+        """Освобождение слота возвращает оператора, отказ исключает его"""
+        strategy = LeastLoadedStrategy(_entries(1, 1, max_load=1), {1: 1, 2: 0})
+
+        assert strategy.pick(set()).operator_id == 2
+        assert strategy.pick(set()) is None
+
+        strategy.release(1)
+        assert strategy.pick(set()).operator_id == 1
+
+        strategy.release(2)
+        strategy.reject(2)
+        assert strategy.pick(set()) is None
+
+    def test_sticky_is_deterministic_and_weighted(self):
+        """Ключ всегда попадает к одному оператору, доли ключей следуют весам"""
+        strategy = RendezvousStrategy(_entries(3, 1), {})
+
+        picks = {f"lead_{i}": strategy.pick(set(), f"lead_{i}") for i in range(2000)}
+
+        assert all(strategy.pick(set(), key) == picks[key] for key in picks)
+        share = Counter(entry.operator_id for entry in picks.values())[1] / 2000
+        assert 0.7 < share < 0.8
+
+    def test_sticky_remaps_only_removed_operator_keys(self):
+        """Удаление оператора переназначает только закрепленные за ним ключи"""
+        keys = [f"lead_{i}" for i in range(500)]
+        before = RendezvousStrategy(_entries(1, 1, 1, 1), {})
+        after = RendezvousStrategy(_entries(1, 1, 1, 1)[:3], {})
+
+        for key in keys:
+            operator_id = before.pick(set(), key).operator_id
+            if operator_id != 4:
+                assert after.pick(set(), key).operator_id == operator_id
+            # Занятый оператор ведет себя как удаленный
+            assert before.pick({4}, key) == after.pick(set(), key)
+
+    def test_unknown_strategy_falls_back_to_random(self):
+        """Неизвестное имя стратегии означает вероятностный выбор"""
+        assert build_strategy("unknown", _entries(1), {}).name == "random"
+
+
+class TestSourceStrategies:
+    """Тесты выбора стратегии для источника через API"""
+
+    def _setup(self, client, strategy, max_loads=(100, 100), weights=(70, 30)):
+        operator_ids = [
+            client.post(
+                "/api/v1/operators/",
+                json={
+                    "name": f"Оператор {i}",
+                    "email": f"strategy_{strategy}_{i}@test.com",
+                    "max_load": max_load,
+                },
+            ).json()["id"]
+            for i, max_load in enumerate(max_loads)
+        ]
+        source_id = client.post(
+            "/api/v1/sources/",
+            json={
+                "name": "Бот стратегии",
+                "bot_token": f"bot_strategy_{strategy}",
+                "routing_strategy": strategy,
+            },
+        ).json()["id"]
+        for operator_id, weight in zip(operator_ids, weights):
+            client.post(
+                f"/api/v1/sources/{source_id}/weights",
+                json={"operator_id": operator_id, "weight": weight},
+            )
+        return source_id, operator_ids
+
+    def _send(self, client, source_id, count):
+        return [
+            client.post(
+                "/api/v1/contacts/",
+                json={"lead_external_id": f"strategy_user_{i}", "source_id": source_id},
+            ).json()["operator_id"]
+            for i in range(count)
+        ]
+
+    def test_smooth_wrr_exact_shares(self, client):
+        """Плавный round-robin дает точные доли на малой выборке"""
+        source_id, operator_ids = self._setup(client, "smooth_wrr")
+
+        counts = Counter(self._send(client, source_id, 10))
+
+        assert counts == {operator_ids[0]: 7, operator_ids[1]: 3}
+
+    def test_least_loaded_balances(self, client):
+        """Наименее загруженный оператор при равных весах чередует операторов"""
+        source_id, operator_ids = self._setup(client, "least_loaded", weights=(1, 1))
+
+        counts = Counter(self._send(client, source_id, 6))
+
+        assert counts == {operator_ids[0]: 3, operator_ids[1]: 3}
+
+    def test_switch_strategy(self, client):
+        """Стратегию источника можно сменить"""
+        source_id, _ = self._setup(client, "random")
+
+        response = client.put(
+            f"/api/v1/sources/{source_id}", json={"routing_strategy": "smooth_wrr"}
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["routing_strategy"] == "smooth_wrr"
+        detail = client.get(f"/api/v1/sources/{source_id}").json()
+        assert detail["routing_strategy"] == "smooth_wrr"
+
+    def test_invalid_strategy_rejected(self, client):
+        """Неизвестная стратегия не проходит валидацию"""
+        response = client.post(
+            "/api/v1/sources/",
+            json={"name": "Бот", "bot_token": "bot_bad", "routing_strategy": "magic"},
+        )
+
+        assert response.status_code == 422
+
+    def test_sticky_keeps_lead_with_operator(self, client):
+        """Повторные обращения лида попадают к тому же оператору"""
+        source_id, _ = self._setup(client, "sticky", weights=(1, 1))
+        before = client.get(f"/api/v1/sources/{source_id}/routing-stats").json()
+
+        first = self._send(client, source_id, 5)
+        second = self._send(client, source_id, 5)
+
+        assert first == second
+        stats = client.get(f"/api/v1/sources/{source_id}/routing-stats").json()
+        assert stats["routing_strategy"] == "sticky"
+        assert stats["preferred"] - before["preferred"] == 10
+        assert stats["fallback"] == before["fallback"]
+
+    def test_sticky_falls_back_when_operator_full(self, client):
+        """Занятый предпочтительный оператор заменяется следующим по рангу"""
+        source_id, operator_ids = self._setup(
+            client, "sticky", max_loads=(1, 1), weights=(1, 1)
+        )
+        before = client.get(f"/api/v1/sources/{source_id}/routing-stats").json()
+
+        (first,) = self._send(client, source_id, 1)
+        response = client.post(
+            "/api/v1/contacts/",
+            json={"lead_external_id": "strategy_user_0", "source_id": source_id},
+        )
+
+        assert response.json()["operator_id"] in operator_ids
+        assert response.json()["operator_id"] != first
+        stats = client.get(f"/api/v1/sources/{source_id}/routing-stats").json()
+        assert stats["preferred"] - before["preferred"] == 1
+        assert stats["fallback"] - before["fallback"] == 1
+
+    def test_routing_stats_unknown_source(self, client):
+        """Статистика несуществующего источника — 404"""
+        response = client.get("/api/v1/sources/999/routing-stats")
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,113 @@
+from datetime import UTC, datetime, timedelta
+
+from sqlalchemy import update
+
+from crud.contact import contact as contact_crud
+from database import explain
+from models import Contact, IdempotencyKey, Lead, Operator, Source, SourceWeight
+from schemas.contact import ContactCreateDB
+from services.dispatcher import PendingDispatcher
+from services.idempotency import IdempotencyCache
+from services.sweeper import IdleContactSweeper
+
+
+class TestIdleContactSweeper:
+    """Тесты автозакрытия простаивающих обращений"""
+
+    def test_sweep_in_batches(self, file_session_factory):
+        """Простаивающие обращения закрываются пачками, слоты уходят очереди"""
+        with file_session_factory() as db:
+            source = Source(name="Бот", bot_token="bot_sweep")
+            operator = Operator(
+                name="Оператор", email="sweep@example.com", max_load=3, active_load=3
+            )
+            lead = Lead(external_id="sweep_lead")
+            db.add_all([source, operator, lead])
+            db.flush()
+            db.add(SourceWeight(source_id=source.id, operator_id=operator.id, weight=1))
+            db.commit()
+            source_id, operator_id, lead_id = source.id, operator.id, lead.id
+
+        with file_session_factory() as db:
+            for _ in range(3):
+                contact_crud.create(
+                    db,
+                    obj_in=ContactCreateDB(
+                        lead_id=lead_id, source_id=source_id, operator_id=operator_id
+                    ),
+                    load_reserved=True,
+                )
+            waiting = contact_crud.create(
+                db, obj_in=ContactCreateDB(lead_id=lead_id, source_id=source_id)
+            )
+            waiting_id = waiting.id
+            stale = datetime.now(UTC).replace(tzinfo=None) - timedelta(hours=2)
+            db.execute(
+                update(Contact).where(Contact.id != waiting_id).values(updated_at=stale)
+            )
+            db.commit()
+
+        sweeper = IdleContactSweeper(
+            file_session_factory,
+            PendingDispatcher(file_session_factory),
+            ttl_seconds=3600,
+            batch_size=2,
+        )
+
+        assert sweeper.sweep() == 3
+        assert sweeper.sweep() == 0
+        with file_session_factory() as db:
+            waiting = db.get(Contact, waiting_id)
+            assert waiting.is_active
+            assert waiting.operator_id == operator_id
+            assert db.get(Operator, operator_id).active_load == 1
+            assert db.query(Contact).filter(Contact.is_active).count() == 1
+
+    def test_idle_batch_uses_index(self, db):
+        """Пачка автозакрытия выбирается по индексу, а не сканом таблицы"""
+        statement = contact_crud.close_statement(
+            Contact.updated_at < datetime(2024, 1, 1), limit=500
+        )
+
+        plan = explain(db, statement)
+
+        assert not any(step.startswith("SCAN") for step in plan)
+        assert any("ix_contacts_active_updated_at" in step for step in plan)
+
+    def test_purge_idempotency_keys(self, file_session_factory):
+        """Ключи старше срока хранения и окна дедупликации удаляются"""
+        now = datetime.now(UTC).replace(tzinfo=None)
+        with file_session_factory() as db:
+            lead = Lead(external_id="purge_lead")
+            source = Source(name="Бот", bot_token="bot_purge")
+            db.add_all([lead, source])
+            db.flush()
+            contact = Contact(lead_id=lead.id, source_id=source.id)
+            db.add(contact)
+            db.flush()
+            for key, age in (
+                ("key:old", timedelta(days=2)),
+                ("key:new", timedelta(hours=1)),
+                ("hash:old", timedelta(minutes=5)),
+                ("hash:new", timedelta(seconds=10)),
+            ):
+                db.add(
+                    IdempotencyKey(
+                        key=key,
+                        contact_id=contact.id,
+                        response="{}",
+                        created_at=now - age,
+                    )
+                )
+            db.commit()
+
+        sweeper = IdleContactSweeper(
+            file_session_factory,
+            PendingDispatcher(file_session_factory),
+            IdempotencyCache(dedupe_window_seconds=60, key_ttl_seconds=86400),
+        )
+
+        assert sweeper.purge(now) == 2
+        with file_session_factory() as db:
+            keys = {row.key for row in db.query(IdempotencyKey)}
+            assert keys == {"key:new", "hash:new"}